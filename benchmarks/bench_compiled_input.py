@@ -0,0 +1,128 @@
+"""
+Benchmarks the compiled input files against the text input files with the same lines.
+    1. text: reading the text file, and ExpressionTree.process() on each line, in a single process.
+    2. compiled: reading the compiled file, and ExpressionTree.process_compiled() on each line, in a single process.
+    3. the whole runner, on the text file and on the compiled file. The outputs are checked to be identical.
+
+To run the benchmark: python3 -m benchmarks.bench_compiled_input --lines=500000
+"""
+import argparse
+import logging
+import os
+import random
+import tempfile
+import time
+
+import rpn_runner
+from binary_expression_tree.binary_expression_tree import ExpressionTree
+from helpers import compiled_input, compressed_input
+
+
+def generate_lines(lines_count):
+    random.seed(0)
+    templates = ['{a}, {b}, +, {c}, *', '{a}, {b}, {c}, -, /', '{a}, {b}, *, {c}, +, {a}, -', '# comment {a}',
+                 '{a}, {b}, +, {c}, *, {b}, {c}, *, -, {a}, +']
+    return [random.choice(templates).format(a=random.randint(1, 10 ** 6), b=random.randint(1, 999),
+                                            c=random.randint(1, 99)) for _ in range(lines_count)]
+
+
+def _evaluate(process, *args):
+    try:
+        return process(*args)
+    except Exception as exc:
+        return str(exc)
+
+
+def evaluate_text(path):
+    results = []
+    with open(path, 'r') as input_file:
+        for line in input_file:
+            line = line.strip()
+            if line and not line.startswith('#'):
+                # A new tree per line, so the lru_cache of process() does not hide the evaluation cost
+                results.append(_evaluate(ExpressionTree().process, line))
+    return results
+
+
+def evaluate_compiled(path):
+    results = []
+    with compiled_input.CompiledInputFile(path) as input_file:
+        for line in input_file:
+            if isinstance(line, bytes):
+                results.append(_evaluate(ExpressionTree().process_compiled, compiled_input.decode_tokens(line)))
+            elif line:
+                results.append(_evaluate(ExpressionTree().process, line))
+    return results
+
+
+def run(path):
+    args = rpn_runner.get_parser().parse_args([path, '--process_limit_size=20000', '--chunk_size=256'])
+    with compressed_input.open_input(path) as input_file, \
+            _CaptureResults(logging.getLogger(rpn_runner.logger_name)) as captured_results:
+        start = time.perf_counter()
+        rpn_runner.start_main_thread(args, input_file)
+        elapsed = time.perf_counter() - start
+    return elapsed, captured_results.records
+
+
+class _CaptureResults(logging.Handler):
+    # Collects the results logged by the runner, instead of printing them
+    def __init__(self, logger):
+        super(_CaptureResults, self).__init__(logging.INFO)
+        self._logger = logger
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record.getMessage())
+
+    def __enter__(self):
+        self._propagate = self._logger.propagate
+        self._logger.propagate = False
+        self._logger.setLevel(logging.INFO)
+        self._logger.addHandler(self)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._logger.removeHandler(self)
+        self._logger.propagate = self._propagate
+
+
+def measure(name, lines_count, callable_object):
+    start = time.perf_counter()
+    result = callable_object()
+    elapsed = time.perf_counter() - start
+    print(f"{name:<36} {elapsed:8.3f} s  {lines_count / elapsed:12.0f} lines/s")
+    return elapsed, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks the compiled input files against the text input files.')
+    parser.add_argument('--lines', type=int, default=200000, help='Number of generated lines (default = 200000).')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        text_path = os.path.join(temp_dir, 'input.txt')
+        compiled_path = os.path.join(temp_dir, 'input.rpnc')
+        with open(text_path, 'w') as text_file:
+            text_file.write('\n'.join(generate_lines(args.lines)))
+        with open(text_path, 'r') as text_file:
+            compiled_input.compile_lines(text_file, compiled_path)
+        print(f"Text file: {os.path.getsize(text_path)} bytes, compiled file: {os.path.getsize(compiled_path)} bytes")
+
+        text_time, text_results = measure('load + evaluate text (1 process)', args.lines,
+                                          lambda: evaluate_text(text_path))
+        compiled_time, compiled_results = measure('load + evaluate compiled (1 process)', args.lines,
+                                                  lambda: evaluate_compiled(compiled_path))
+        assert text_results == compiled_results
+        print(f"Speedup: {text_time / compiled_time:.2f}")
+
+        text_run_time, text_output = run(text_path)
+        compiled_run_time, compiled_output = run(compiled_path)
+        assert text_output == compiled_output
+        print(f"{'runner, text file':<36} {text_run_time:8.3f} s")
+        print(f"{'runner, compiled file':<36} {compiled_run_time:8.3f} s")
+        print(f"Speedup: {text_run_time / compiled_run_time:.2f}")
+
+
+if __name__ == '__main__':
+    main()
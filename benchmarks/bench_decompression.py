@@ -0,0 +1,92 @@
+"""
+Benchmarks the streaming decompression of the inputs against decompressing them to disk first.
+For each compression, the benchmark generates an RPN input file, compresses it, and measures the time needed to get
+all of its lines:
+    1. decompress-then-run: decompress the file to a temporary file, then read the lines of the temporary file.
+    2. streaming: read the lines via compressed_input.open_input() with a single thread.
+    3. parallel streaming: same as 2., with one thread per cpu core (multi-member files only).
+
+To run the benchmark: python3 -m benchmarks.bench_decompression --lines=2000000
+"""
+import argparse
+import bz2
+import gzip
+import lzma
+import os
+import random
+import shutil
+import tempfile
+import time
+
+from helpers import compressed_input
+
+_COMPRESSIONS = {
+    'gzip': (gzip.compress, gzip.open),
+    'bz2': (bz2.compress, bz2.open),
+    'xz': (lzma.compress, lzma.open),
+}
+
+
+def generate_input(lines_count):
+    random.seed(0)
+    return ''.join(f"{random.randint(0, 10 ** 6)}, {random.randint(1, 999)}, +, {random.randint(1, 99)}, *\n"
+                   for _ in range(lines_count)).encode()
+
+
+def compress(data, compression, members_count):
+    compress_callable = _COMPRESSIONS[compression][0]
+    step = len(data) // members_count + 1
+    return b''.join(compress_callable(data[idx:idx + step]) for idx in range(0, len(data), step))
+
+
+def count_lines(input_file):
+    return sum(1 for _ in input_file)
+
+
+def decompress_then_run(path, compression, temp_dir):
+    decompressed_path = os.path.join(temp_dir, 'decompressed.txt')
+    with _COMPRESSIONS[compression][1](path, 'rb') as compressed_file, open(decompressed_path, 'wb') as output:
+        shutil.copyfileobj(compressed_file, output, compressed_input.READ_BUFFER_SIZE)
+    with open(decompressed_path, 'r') as input_file:
+        return count_lines(input_file)
+
+
+def streaming(path, workers):
+    with compressed_input.open_input(path, workers=workers) as input_file:
+        return count_lines(input_file)
+
+
+def measure(name, data_size, callable_object, repeat=3):
+    elapsed = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        lines_count = callable_object()
+        elapsed = min(elapsed or float('inf'), time.perf_counter() - start)
+    print(f"    {name:<24} {elapsed:8.3f} s  {data_size / elapsed / 2 ** 20:8.1f} MiB/s  {lines_count} lines")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks the streaming decompression of the inputs.')
+    parser.add_argument('--lines', type=int, default=1000000, help='Number of generated lines (default = 1000000).')
+    parser.add_argument('--members', type=int, default=64,
+                        help='Number of members of the multi-member files (default = 64).')
+    args = parser.parse_args()
+
+    data = generate_input(args.lines)
+    workers = os.cpu_count()
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for compression in _COMPRESSIONS:
+            for members_count in [1, args.members]:
+                path = os.path.join(temp_dir, f"input.{compression}")
+                with open(path, 'wb') as output_file:
+                    output_file.write(compress(data, compression, members_count))
+
+                print(f"{compression}, {members_count} member(s), {len(data) / 2 ** 20:.1f} MiB uncompressed:")
+                measure('decompress-then-run', len(data), lambda: decompress_then_run(path, compression, temp_dir))
+                measure('streaming', len(data), lambda: streaming(path, workers=1))
+                if members_count > 1 and compression != 'xz':
+                    measure(f"streaming ({workers} threads)", len(data), lambda: streaming(path, workers=workers))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+"""
+Benchmarks the throughput of the runner for an increasing number of worker threads, with:
+    1. the original scheduling: a single shared JoinableQueue, one line at a time (--scheduler=shared --chunk_size=1).
+    2. the shared queue with chunks of lines (--scheduler=shared).
+    3. the work stealing scheduler with chunks of lines (--scheduler=stealing).
+
+To run the benchmark: python3 -m benchmarks.bench_scheduler --lines=200000 --max_workers=8
+"""
+import argparse
+import logging
+import os
+import random
+import time
+
+import rpn_runner
+
+
+def generate_lines(lines_count):
+    random.seed(0)
+    return [f"{random.randint(1, 10 ** 6)}, {random.randint(1, 999)}, +, {random.randint(1, 99)}, *, "
+            f"{random.randint(1, 99)}, -" for _ in range(lines_count)]
+
+
+def run(lines, workers, scheduler, chunk_size, batch_size):
+    args = rpn_runner.get_parser().parse_args(
+        ['dummy_input.txt', f'--worker_threads_count={workers}', f'--process_limit_size={batch_size}',
+         f'--scheduler={scheduler}', f'--chunk_size={chunk_size}'])
+    start = time.perf_counter()
+    rpn_runner.start_main_thread(args, lines)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks the scaling of the schedulers.')
+    parser.add_argument('--lines', type=int, default=100000, help='Number of generated lines (default = 100000).')
+    parser.add_argument('--max_workers', type=int, default=os.cpu_count(),
+                        help='Maximum number of worker threads (default = number of cpu cores).')
+    parser.add_argument('--batch_size', type=int, default=20000, help='process_limit_size (default = 20000).')
+    parser.add_argument('--chunk_size', type=int, default=256, help='Chunk size (default = 256).')
+    args = parser.parse_args()
+
+    # The results are logged at the INFO level, which is not benchmarked
+    logging.getLogger(rpn_runner.logger_name).setLevel(logging.WARNING)
+
+    lines = generate_lines(args.lines)
+    configurations = [('shared, 1 line (original)', 'shared', 1), (f"shared, {args.chunk_size} lines", 'shared',
+                                                                    args.chunk_size),
+                      (f"stealing, {args.chunk_size} lines", 'stealing', args.chunk_size)]
+    workers_counts = sorted({1, 2, 4, 8, 16, 32, 64, args.max_workers} & set(range(1, args.max_workers + 1)))
+
+    print(f"{'workers':>8} " + ' '.join(f"{name:>28}" for name, _, _ in configurations) + '   (lines/s)')
+    for workers in workers_counts:
+        throughputs = [args.lines / run(lines, workers, scheduler, chunk_size, args.batch_size)
+                       for _, scheduler, chunk_size in configurations]
+        print(f"{workers:>8} " + ' '.join(f"{throughput:>28.0f}" for throughput in throughputs), flush=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+"""
+Benchmarks the makespan of the runner on skewed workloads, with the lines dispatched:
+    1. in the input order (--scheduling=fifo).
+    2. in decreasing order of their estimated cost within each scheduling window (--scheduling=lpt).
+
+Most of the generated lines are cheap, and a few of them are long chains of multiplications of big numbers. The heavy
+lines are placed at the end of each window, which is the worst case for the fifo dispatch: the worker threads taking
+them start last, while the other ones wait at the batch barrier.
+Along with the measured times, the makespans are simulated from the evaluation time of each line measured beforehand:
+the chunks are handed, in dispatch order, to the worker thread which becomes idle first. The simulated makespans do not
+depend on the number of cpu cores of the machine running the benchmark.
+
+To run the benchmark: python3 -m benchmarks.bench_scheduling --lines=20000 --max_workers=8
+"""
+import argparse
+import logging
+import os
+import random
+import time
+
+import rpn_runner
+from binary_expression_tree import binary_expression_tree
+from rpn_processes import rpn_cost
+
+
+def generate_lines(lines_count, window, heavy_lines_per_window, heavy_line_operands):
+    random.seed(0)
+    heavy_line = '9' * 300 + (', ' + '9' * 300) * heavy_line_operands + ', *' * heavy_line_operands
+    lines = []
+    while len(lines) < lines_count:
+        lines.extend(f"{random.randint(1, 10 ** 6)}, {random.randint(1, 999)}, +, {random.randint(1, 99)}, *"
+                     for _ in range(window - heavy_lines_per_window))
+        lines.extend([heavy_line] * heavy_lines_per_window)
+    return lines[:lines_count]
+
+
+def measure_line_times(lines):
+    line_times = {}
+    for line in set(lines):
+        start = time.perf_counter()
+        binary_expression_tree.ExpressionTree().process(line)
+        line_times[line] = time.perf_counter() - start
+    return line_times
+
+
+def simulate(lines, line_times, workers, scheduling, window, chunk_size):
+    makespan = 0
+    for window_start in range(0, len(lines), window):
+        items = list(enumerate(lines[window_start:window_start + window]))
+        if scheduling == rpn_cost.LPT:
+            chunks = rpn_cost.plan_chunks(items, chunk_size, workers)
+        else:
+            chunks = [items[index:index + chunk_size] for index in range(0, len(items), chunk_size)]
+        # Each chunk is taken by the worker thread which becomes idle first; the window ends at the batch barrier
+        idle_times = [0] * workers
+        for chunk in chunks:
+            worker = idle_times.index(min(idle_times))
+            idle_times[worker] += sum(line_times[line] for _, line in chunk)
+        makespan += max(idle_times)
+    return makespan
+
+
+def run(lines, workers, scheduling, window, chunk_size):
+    args = rpn_runner.get_parser().parse_args(
+        ['dummy_input.txt', f'--worker_threads_count={workers}', f'--process_limit_size={window}',
+         f'--scheduling={scheduling}', f'--scheduling_window={window}', f'--chunk_size={chunk_size}'])
+    start = time.perf_counter()
+    rpn_runner.start_main_thread(args, lines)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks the fifo and the lpt scheduling on skewed workloads.')
+    parser.add_argument('--lines', type=int, default=20000, help='Number of generated lines (default = 20000).')
+    parser.add_argument('--max_workers', type=int, default=os.cpu_count(),
+                        help='Maximum number of worker threads (default = number of cpu cores).')
+    parser.add_argument('--window', type=int, default=2000,
+                        help='Scheduling window, which is also the batch size (default = 2000).')
+    parser.add_argument('--heavy_lines', type=int, default=8, help='Number of heavy lines per window (default = 8).')
+    parser.add_argument('--heavy_line_operands', type=int, default=150,
+                        help='Number of operands of the heavy lines (default = 150).')
+    parser.add_argument('--chunk_size', type=int, default=64, help='Chunk size (default = 64).')
+    args = parser.parse_args()
+
+    # The results are logged at the INFO level, which is not benchmarked
+    logging.getLogger(rpn_runner.logger_name).setLevel(logging.WARNING)
+
+    lines = generate_lines(args.lines, args.window, args.heavy_lines, args.heavy_line_operands)
+    workers_counts = sorted({1, 2, 4, 8, 16, 32, 64, args.max_workers} & set(range(1, args.max_workers + 1)))
+
+    line_times = measure_line_times(lines)
+    print(f"{'workers':>8} {'fifo (s)':>12} {'lpt (s)':>12} {'speedup':>8} {'simulated fifo (s)':>19} "
+          f"{'simulated lpt (s)':>18} {'speedup':>8}")
+    for workers in workers_counts:
+        times = [run(lines, workers, scheduling, args.window, args.chunk_size)
+                 for scheduling in (rpn_cost.FIFO, rpn_cost.LPT)]
+        simulated_times = [simulate(lines, line_times, workers, scheduling, args.window, args.chunk_size)
+                           for scheduling in (rpn_cost.FIFO, rpn_cost.LPT)]
+        print(f"{workers:>8} {times[0]:>12.2f} {times[1]:>12.2f} {times[0] / times[1]:>8.2f} "
+              f"{simulated_times[0]:>19.3f} {simulated_times[1]:>18.3f} "
+              f"{simulated_times[0] / simulated_times[1]:>8.2f}", flush=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+"""
+Benchmarks the cost of the hot-path instrumentation of the consumers, by evaluating the same chunks in a single process:
+    1. without tracing, as every run without the trace_file argument.
+    2. with the eager debug messages the consumers used to format for every chunk, even with debug logging off.
+    3. with tracing of 1% of the lines (the default sample rate), and of all the lines.
+
+To run the benchmark: python3 -m benchmarks.bench_tracing --lines=200000
+"""
+import argparse
+import logging
+import os
+import tempfile
+import time
+
+from benchmarks.bench_compiled_input import generate_lines
+from rpn_processes import rpn_scheduler, rpn_tracing, rpnconsumer
+
+
+def get_chunks(lines_count, chunk_size):
+    items = [(line_number, line) for line_number, line in enumerate(generate_lines(lines_count))
+             if not line.startswith('#')]
+    return [items[start:start + chunk_size] for start in range(0, len(items), chunk_size)]
+
+
+def process_chunks(consumer, chunks, eager_debug=False):
+    logger = logging.getLogger(rpnconsumer.__name__)
+    for chunk in chunks:
+        if eager_debug:
+            logger.debug(f"Consumer {os.getpid()} took {len(chunk)} item(s) from the scheduler.")
+            for _, line in chunk:
+                logger.debug(f"Constructing binary tree expression from {line}. Delimiter is set to ','")
+        results = consumer._process_chunk(chunk)
+        if eager_debug:
+            logger.debug(f"Consumer {os.getpid()} put results '{results}' to the result list.")
+
+
+def measure(name, lines_count, create_consumer, chunks, eager_debug=False, baseline=None, repeats=3):
+    # The best time of several runs, each with a new consumer, so the results cached by its' evaluator do not help
+    elapsed = None
+    for _ in range(repeats):
+        consumer = create_consumer()
+        start = time.perf_counter()
+        process_chunks(consumer, chunks, eager_debug)
+        run_time = time.perf_counter() - start
+        elapsed = run_time if elapsed is None else min(elapsed, run_time)
+    overhead = f"  {(elapsed / baseline - 1) * 100:+6.1f} %" if baseline else ''
+    print(f"{name:<36} {elapsed:8.3f} s  {lines_count / elapsed:12.0f} lines/s{overhead}")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks the cost of the hot-path instrumentation.')
+    parser.add_argument('--lines', type=int, default=200000, help='Number of generated lines (default = 200000).')
+    parser.add_argument('--chunk_size', type=int, default=64, help='Number of lines per chunk (default = 64).')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    chunks = get_chunks(args.lines, args.chunk_size)
+    lines_count = sum(len(chunk) for chunk in chunks)
+    scheduler = rpn_scheduler.create_scheduler(rpn_scheduler.SHARED_QUEUE, 1)
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        # Warms up the interpreter and the allocator, so the first measurement is not penalised
+        process_chunks(rpnconsumer.RpnConsumer(scheduler, 0), chunks)
+        baseline = measure('no tracing', lines_count, lambda: rpnconsumer.RpnConsumer(scheduler, 0), chunks)
+        measure('eager debug messages (before)', lines_count, lambda: rpnconsumer.RpnConsumer(scheduler, 0), chunks,
+                eager_debug=True, baseline=baseline)
+
+        for sample_rate in (0.01, 1):
+            tracer = rpn_tracing.Tracer(os.path.join(temp_dir, 'trace.jsonl'), sample_rate)
+            measure(f"tracing {sample_rate:.0%} of the lines", lines_count,
+                    lambda: rpnconsumer.RpnConsumer(scheduler, 0, tracer=tracer), chunks, baseline=baseline)
+            tracer.merge()
+    scheduler.join()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+"""
+Benchmarks the validate mode against the full evaluation of the same lines.
+    1. evaluation: ExpressionTree.process() on each line, in a single process, as done by the consumers.
+    2. validation: rpn_validator.validate_expression() on each line, in a single process.
+    3. parallel validation: rpn_validator.validate_files() on the generated file, with one process per cpu core.
+
+To run the benchmark: python3 -m benchmarks.bench_validate --lines=1000000
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from binary_expression_tree.binary_expression_tree import ExpressionTree
+from helpers import rpn_validator
+
+
+def generate_lines(lines_count):
+    random.seed(0)
+    templates = ['{a}, {b}, +, {c}, *', '{a}, {b}, {c}, -, /', '{a}, x, +', '{a}, {b}', '{a}, {b}, *, {c}, +, {a}, -']
+    return [random.choice(templates).format(a=random.randint(1, 10 ** 6), b=random.randint(1, 999),
+                                            c=random.randint(1, 99)) for _ in range(lines_count)]
+
+
+def evaluate(lines):
+    errors_count = 0
+    for line in lines:
+        try:
+            # A new tree per line, so the lru_cache of process() does not hide the evaluation cost
+            ExpressionTree().process(line)
+        except Exception:
+            errors_count += 1
+    return errors_count
+
+
+def validate(lines):
+    return sum(1 for line in lines if rpn_validator.validate_expression(line))
+
+
+def validate_file(path):
+    return rpn_validator.validate_files([path])[0].get_errors_count()
+
+
+def measure(name, lines_count, callable_object):
+    start = time.perf_counter()
+    errors_count = callable_object()
+    elapsed = time.perf_counter() - start
+    print(f"{name:<32} {elapsed:8.3f} s  {lines_count / elapsed:12.0f} lines/s  {errors_count} malformed")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks the validate mode against the full evaluation.')
+    parser.add_argument('--lines', type=int, default=500000, help='Number of generated lines (default = 500000).')
+    args = parser.parse_args()
+
+    lines = generate_lines(args.lines)
+    evaluation_time = measure('evaluation (1 process)', args.lines, lambda: evaluate(lines))
+    validation_time = measure('validation (1 process)', args.lines, lambda: validate(lines))
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path = os.path.join(temp_dir, 'input.txt')
+        with open(path, 'w') as output_file:
+            output_file.write('\n'.join(lines))
+        parallel_time = measure(f"validation ({os.cpu_count()} processes)", args.lines, lambda: validate_file(path))
+
+    print(f"Speed-up: {evaluation_time / validation_time:.1f}x (1 process), "
+          f"{evaluation_time / parallel_time:.1f}x ({os.cpu_count()} processes)")
+
+
+if __name__ == '__main__':
+    main()
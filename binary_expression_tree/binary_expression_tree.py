@@ -1,14 +1,24 @@
 import logging
+import operator
 from collections import deque
 from functools import lru_cache
+from helpers.compiled_input import render_tokens
 from helpers.operators import OperatorsHelper
 from binary_expression_tree import binary_exp_tree_node
 
 logger = logging.getLogger(__name__)
 
+# Operators of the compiled expressions, by opcode (see compiled_input)
+_OPERATORS_BY_OPCODE = OperatorsHelper.get_operators_by_opcode()
+
 
 class ExpressionTree:
-    def __init__(self):
+    def __init__(self, max_result_bits=None):
+        """
+        :param max_result_bits: if set, an expression whose result or any intermediate result would need more bits is
+        rejected before computing it, so a chain of multiplications cannot produce huge numbers.
+        """
+        self._max_result_bits = max_result_bits
         self._stack = deque()
         # We use this to avoid re-processing every time.
         # If it's already evaluated, we just return the cached results
@@ -24,11 +34,36 @@ class ExpressionTree:
 
         return self._stack[-1]
 
+    def _compute_limited(self, current_operator, operand1_result, operand2_result):
+        if self._max_result_bits is None or not (isinstance(operand1_result, int) and isinstance(operand2_result, int)):
+            return current_operator.operator_callable(operand1_result, operand2_result)
+
+        # Only the integer results grow without limit. The bit length of a product is the sum of the bit lengths of its
+        # operands, or one less. The bit length of a sum or a difference is at most one more than the biggest one, and
+        # a quotient is not bigger than its dividend. So the results which are too big for sure are rejected before
+        # computing them.
+        if current_operator.operator_callable is operator.mul:
+            estimated_bits = operand1_result.bit_length() + operand2_result.bit_length()
+        elif current_operator.operator_callable is operator.truediv:
+            estimated_bits = operand1_result.bit_length()
+        else:
+            estimated_bits = max(operand1_result.bit_length(), operand2_result.bit_length()) + 1
+
+        result = None
+        if estimated_bits <= self._max_result_bits + 1:
+            result = current_operator.operator_callable(operand1_result, operand2_result)
+        if result is None or (isinstance(result, int) and result.bit_length() > self._max_result_bits):
+            raise ValueError(f"The result of '{current_operator.string}' exceeds the limit of "
+                             f"{self._max_result_bits} bits.")
+        return result
+
     # References: I got the ideas from the following references:
     # https://www.geeksforgeeks.org/stack-set-4-evaluation-postfix-expression/
     # https://ttzztt.gitbooks.io/lc/content/quant-dev/postfixto-infix.html
     def _construct_from_postfix(self, expression: str, delimiter=',') -> None:
-        logger.debug(f"Constructing binary tree expression from {expression}. Delimiter is set to '{delimiter}'")
+        # Called for every line: the debug message is only formatted if it is logged
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"Constructing binary tree expression from {expression}. Delimiter is set to '{delimiter}'")
         self._stack.clear()
         self._alreadyConstructed = False
         self._cachedResult = None
@@ -94,7 +129,7 @@ class ExpressionTree:
                     raise ValueError(
                         f"The expression '{expression}' is not valid.")
 
-                result_stack.append(current_operator.operator_callable(operand1_result, operand2_result))
+                result_stack.append(self._compute_limited(current_operator, operand1_result, operand2_result))
 
             else:
                 # if the current token is an operand, create a new binary tree node
@@ -118,3 +153,40 @@ class ExpressionTree:
     def process(self, postfix_expression):
         self._construct_from_postfix(postfix_expression)
         return self._cachedResult, self._cachedInfixExpression
+
+    def process_compiled(self, tokens):
+        """
+        Evaluates a pre-tokenised expression (see compiled_input.decode_tokens) without parsing it, nor building the
+        tree. The results are identical to the results of process() for the same expression. The errors are not
+        detected the same way, so an invalid expression is rendered as text (see compiled_input.render_tokens) and
+        processed again, to raise the same error.
+        :param tokens: list of integers: the operands, and the (negative) opcodes of the operators
+        :return: (result, infix expression) tuple
+        """
+        # Each stack entry is a (result, infix expression, precedence of the root operator or None) tuple
+        operand_stack = []
+        try:
+            for token in tokens:
+                if token >= 0:
+                    operand_stack.append((token, str(token), None))
+                    continue
+
+                current_operator = _OPERATORS_BY_OPCODE[token]
+                operand2_result, operand2_string, operand2_precedence = operand_stack.pop()
+                operand1_result, operand1_string, operand1_precedence = operand_stack.pop()
+                # process() rejects a null second operand
+                if not operand2_result:
+                    raise ValueError('The second operand is null.')
+                if operand1_precedence is not None and operand1_precedence < current_operator.precedence:
+                    operand1_string = f"({operand1_string})"
+                if operand2_precedence is not None and operand2_precedence <= current_operator.precedence:
+                    operand2_string = f"({operand2_string})"
+                operand_stack.append((self._compute_limited(current_operator, operand1_result, operand2_result),
+                                      f"{operand1_string} {current_operator.string} {operand2_string}",
+                                      current_operator.precedence))
+        except (ArithmeticError, IndexError, KeyError, ValueError):
+            return self.process(render_tokens(tokens))
+
+        if len(operand_stack) != 1:
+            return self.process(render_tokens(tokens))
+        return operand_stack[0][0], operand_stack[0][1]
@@ -0,0 +1,84 @@
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+
+class BatchOutputWriter:
+    """
+    Routes the results of a multi-file run to their destination. Results arrive sorted by their
+    (source_index, line_index) key, so the sources are written one after another.
+    If output_dir is set, each input file gets its own '<file name>.out' file in that directory. Otherwise, the results
+    are written through output_logger, and each input file gets a section starting with a '==> path <==' header.
+    """
+    def __init__(self, paths, output_logger, output_dir=None):
+        self._paths = paths
+        self._output_logger = output_logger
+        self._output_dir = output_dir
+        self._next_source = 0
+        self._current_file = None
+
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
+        self._output_names = self._get_output_names(paths)
+
+    @staticmethod
+    def _get_output_names(paths):
+        # Two inputs with the same base name (e.g. a/data.txt and b/data.txt) must not overwrite each other
+        names = []
+        used_names = set()
+        for source_index, path in enumerate(paths):
+            name = f"{os.path.basename(path)}.out"
+            if name in used_names:
+                name = f"{os.path.basename(path)}.{source_index}.out"
+            used_names.add(name)
+            names.append(name)
+        return names
+
+    def get_output_path(self, source_index):
+        """
+        :param source_index: index of the input file
+        :return: the path of the output file for the given input, or None if the results go to the output logger
+        """
+        if not self._output_dir:
+            return None
+        return os.path.join(self._output_dir, self._output_names[source_index])
+
+    def _open_source(self, source_index):
+        if self._current_file:
+            self._current_file.close()
+            self._current_file = None
+
+        if self._output_dir:
+            self._current_file = open(self.get_output_path(source_index), 'w')
+        else:
+            self._output_logger.info(f"==> {self._paths[source_index]} <==")
+
+    def _advance_to(self, source_index):
+        # Inputs without any result (e.g. only comments) still get their section or their empty output file
+        while self._next_source <= source_index:
+            self._open_source(self._next_source)
+            self._next_source += 1
+
+    def write(self, line_key, result):
+        """
+        Writes a single result.
+        :param line_key: (source_index, line_index) tuple
+        :param result: the result string
+        :return: None
+        """
+        self._advance_to(line_key[0])
+        if self._current_file:
+            self._current_file.write(f"{result}\n")
+        else:
+            self._output_logger.info(result)
+
+    def close(self):
+        """
+        Opens the sections of the remaining inputs and closes the current output file.
+        :return: None
+        """
+        self._advance_to(len(self._paths) - 1)
+        if self._current_file:
+            self._current_file.close()
+            self._current_file = None
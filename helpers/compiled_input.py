@@ -0,0 +1,245 @@
+import logging
+import mmap
+import struct
+
+from helpers.operators import OperatorsHelper
+
+logger = logging.getLogger(__name__)
+
+# Magic bytes at the beginning of a compiled input file
+MAGIC_BYTES = b'RPNC'
+
+# Version of the compiled format. Files of other versions are rejected.
+FORMAT_VERSION = 2
+
+# Header: magic bytes, format version, size of the comment identifier, and number of records. The comment identifier
+# and the records follow the header.
+_HEADER = struct.Struct('<4sHHQ')
+
+# The tokens are stored as varints (LEB128) of the token plus _TOKEN_OFFSET: the opcodes, from -1 to -_TOKEN_OFFSET
+# (see OperatorsHelper.get_opcode), are single bytes, and so are the operands lower than 128 - _TOKEN_OFFSET.
+_TOKEN_OFFSET = 16
+
+# The strings of the operators, by opcode
+_OPERATOR_STRINGS = {opcode: operator.string for opcode, operator in OperatorsHelper.get_operators_by_opcode().items()}
+
+# Delimiter of the tokens in the rendered lines
+_DELIMITER = ', '
+
+# Size of the records buffered in memory while compiling
+_FLUSH_SIZE = 1024 * 1024
+
+
+def _append_varint(buffer, value):
+    while value >= 0x80:
+        buffer.append(value & 0x7f | 0x80)
+        value >>= 7
+    buffer.append(value)
+
+
+def _read_varint(data, position):
+    # Returns the value of the varint at position, and the position following it
+    value = 0
+    shift = 0
+    while True:
+        byte = data[position]
+        position += 1
+        value |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return value, position
+        shift += 7
+
+
+def encode_tokens(tokens):
+    """
+    :param tokens: iterable of integers: the operands, and the (negative) opcodes of the operators
+    :return: the token bytes of a tokenised line
+    """
+    buffer = bytearray()
+    for token in tokens:
+        _append_varint(buffer, token + _TOKEN_OFFSET)
+    return bytes(buffer)
+
+
+def decode_tokens(token_bytes):
+    """
+    :param token_bytes: the token bytes of a tokenised line (see encode_tokens)
+    :return: a list of integers: the operands, and the (negative) opcodes of the operators
+    """
+    tokens = []
+    value = 0
+    shift = 0
+    for byte in token_bytes:
+        if byte < 0x80:
+            tokens.append((value | byte << shift) - _TOKEN_OFFSET)
+            value = 0
+            shift = 0
+        else:
+            value |= (byte & 0x7f) << shift
+            shift += 7
+    return tokens
+
+
+def render_tokens(tokens):
+    """
+    :param tokens: iterable of integers: the operands, and the (negative) opcodes of the operators
+    :return: the line text of the tokens
+    """
+    return _DELIMITER.join(str(token) if token >= 0 else _OPERATOR_STRINGS[token] for token in tokens)
+
+
+def get_line_text(line):
+    """
+    :param line: a line read from an input file: a string, or the token bytes of a tokenised line of a compiled input
+    file (see CompiledInputFile)
+    :return: the text of the line
+    """
+    return render_tokens(decode_tokens(line)) if isinstance(line, bytes) else line
+
+
+def is_compiled_file(path):
+    """
+    :param path: path to the file
+    :return: True if the file is a compiled input file
+    """
+    with open(path, 'rb') as input_file:
+        return input_file.read(len(MAGIC_BYTES)) == MAGIC_BYTES
+
+
+def _tokenize(line, delimiter=','):
+    # Returns the tokens of the line, or None if the line cannot be rendered identically from its' tokens
+    tokens = []
+    for token in line.split(delimiter):
+        token = token.strip()
+        opcode = OperatorsHelper.get_opcode(token)
+        if opcode is not None:
+            tokens.append(opcode)
+        elif token.isascii() and token.isdecimal():
+            try:
+                tokens.append(int(token))
+            except ValueError:
+                # The operand exceeds the integer string conversion length limit
+                return None
+        else:
+            return None
+    return tokens if render_tokens(tokens) == line else None
+
+
+def compile_lines(input_lines, output_path, comment_identifier='#'):
+    """
+    Compiles RPN text lines into a compiled input file. The empty and the comment lines are skipped, the other lines
+    are tokenised: each operand is stored as a varint, and each operator as a single byte (see encode_tokens). A
+    tokenised line is stored without its' text, which is rendered again from the tokens (see render_tokens). The lines
+    which cannot be rendered identically (e.g. invalid operands, non-canonical operands like '007', or other delimiters
+    than ', ') are kept as text only. Every line keeps its' line number, so the results, including the error results,
+    are identical to the ones of the text file.
+    The file layout is: the header, the comment identifier, and one record per line. A record is a varint of the number
+    of lines skipped before the line times 2, plus 1 for a line kept as text, followed by the varint size and the bytes
+    of the tokens or of the UTF-8 text.
+    :param input_lines: iterable of the text lines
+    :param output_path: path of the compiled file
+    :param comment_identifier: lines beginning with it are skipped
+    :return: (number of compiled lines, number of lines kept as text) tuple
+    """
+    records = bytearray()
+    records_count = 0
+    text_lines_count = 0
+    next_line_number = 0
+    comment_bytes = comment_identifier.encode()
+
+    with open(output_path, 'wb') as output_file:
+        # The number of records is written once known
+        output_file.write(_HEADER.pack(MAGIC_BYTES, FORMAT_VERSION, len(comment_bytes), 0))
+        output_file.write(comment_bytes)
+        for line_number, line in enumerate(input_lines):
+            line = line.strip()
+            if not line or line.startswith(comment_identifier):
+                continue
+
+            line_tokens = _tokenize(line)
+            if line_tokens is None:
+                text_lines_count += 1
+                payload = line.encode()
+                _append_varint(records, (line_number - next_line_number) * 2 + 1)
+            else:
+                payload = encode_tokens(line_tokens)
+                _append_varint(records, (line_number - next_line_number) * 2)
+            _append_varint(records, len(payload))
+            records.extend(payload)
+            next_line_number = line_number + 1
+            records_count += 1
+            if len(records) >= _FLUSH_SIZE:
+                output_file.write(records)
+                del records[:]
+        output_file.write(records)
+        output_file.seek(0)
+        output_file.write(_HEADER.pack(MAGIC_BYTES, FORMAT_VERSION, len(comment_bytes), records_count))
+
+    logger.debug(f"Compiled {records_count} line(s) into '{output_path}', {text_lines_count} of them kept as text.")
+    return records_count, text_lines_count
+
+
+class CompiledInputFile:
+    """
+    Reads a compiled input file (see compile_lines) as a memory-mapped file. Iterating over it yields the lines of the
+    original text file: the token bytes of each tokenised line (see decode_tokens), a string per line kept as text, and
+    an empty string per skipped line, so the line numbers are identical to the ones of the text file. The token bytes
+    go through the producer, the scheduler and the consumers as they are; the consumers evaluate the tokens instead of
+    parsing the text (see ExpressionTree.process_compiled), and the text is only rendered when needed (see
+    get_line_text).
+    """
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'rb')
+        try:
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # An empty file cannot be mapped
+            self._file.close()
+            raise ValueError(f"'{path}' is not a compiled input file.")
+
+        if len(self._mmap) < _HEADER.size:
+            self.close()
+            raise ValueError(f"'{path}' is not a compiled input file.")
+        magic_bytes, version, comment_size, self._records_count = _HEADER.unpack_from(self._mmap)
+        if magic_bytes != MAGIC_BYTES or version != FORMAT_VERSION:
+            self.close()
+            raise ValueError(f"'{path}' is not a compiled input file of version {FORMAT_VERSION}.")
+        self.comment_identifier = self._mmap[_HEADER.size:_HEADER.size + comment_size].decode()
+        self._records_offset = _HEADER.size + comment_size
+
+    def __iter__(self):
+        data = self._mmap
+        position = self._records_offset
+        for _ in range(self._records_count):
+            # Both varints are single bytes, unless the line is long or preceded by many skipped lines
+            record_header = data[position]
+            if record_header < 0x80:
+                position += 1
+            else:
+                record_header, position = _read_varint(data, position)
+            size = data[position]
+            if size < 0x80:
+                position += 1
+            else:
+                size, position = _read_varint(data, position)
+
+            for _ in range(record_header >> 1):
+                yield ''
+            payload = data[position:position + size]
+            position += size
+            yield str(payload, 'utf-8') if record_header & 1 else payload
+
+    def close(self):
+        """
+        Closes the memory-mapped file.
+        :return: None
+        """
+        self._mmap.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -0,0 +1,206 @@
+import bz2
+import gzip
+import io
+import logging
+import lzma
+import mmap
+import os
+import re
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from helpers import compiled_input
+
+logger = logging.getLogger(__name__)
+
+# Size of the read buffers used for the compressed and the decompressed streams
+READ_BUFFER_SIZE = 1024 * 1024
+
+# Members bigger than this (compressed) are not decompressed in parallel, as each member is decompressed in memory
+PARALLEL_MAX_MEMBER_SIZE = 32 * 1024 * 1024
+
+# Members decompressing to more than this are not decompressed in parallel: the decompression of a member stops there,
+# and the rest of the file is decompressed sequentially, so a highly compressed member cannot exhaust the memory
+PARALLEL_MAX_MEMBER_OUTPUT = 16 * 1024 * 1024
+
+# Maximum decompressed bytes of the members in flight, whatever the number of threads. It bounds the number of members
+# decompressed in parallel to PARALLEL_MAX_INFLIGHT_BYTES // PARALLEL_MAX_MEMBER_OUTPUT.
+PARALLEL_MAX_INFLIGHT_BYTES = 128 * 1024 * 1024
+
+# Magic bytes at the beginning of each supported compressed format. 'BZh' and a digit could start a text line, so a
+# bzip2 stream must also start with the magic of a block, or with the end of stream magic if it is empty.
+_MAGIC_BYTES = [('gzip', re.compile(b'\x1f\x8b')), ('bz2', re.compile(b'BZh[1-9](1AY&SY|\x17rE8P\x90)')),
+                ('xz', re.compile(b'\xfd7zXZ\x00'))]
+_MAGIC_BYTES_SIZE = 10
+
+# Candidate starts of the gzip members/bzip2 streams. A candidate could be a false positive within the compressed data;
+# this is detected while decompressing (see _decompress_member).
+_MEMBER_HEADERS = {'gzip': re.compile(b'\x1f\x8b\x08'), 'bz2': re.compile(b'BZh[1-9]1AY&SY')}
+
+_DECOMPRESSING_FILES = {'gzip': lambda fileobj: gzip.GzipFile(fileobj=fileobj), 'bz2': bz2.BZ2File,
+                        'xz': lzma.LZMAFile}
+
+
+def detect_compression(path):
+    """
+    Detects the compression of a file via its magic bytes.
+    :param path: path to the file
+    :return: 'gzip', 'bz2', 'xz', or None for uncompressed files
+    """
+    with open(path, 'rb') as input_file:
+        header = input_file.read(_MAGIC_BYTES_SIZE)
+
+    for compression, magic_bytes in _MAGIC_BYTES:
+        if magic_bytes.match(header):
+            return compression
+    return None
+
+
+def open_input(path, workers=None):
+    """
+    Opens an input file for reading text lines. Compressed files (gzip, bzip2 or xz) are detected via their magic
+    bytes, and decompressed as a stream. Multi-member gzip and bzip2 files are decompressed member by member in a pool
+    of threads (zlib and bz2 release the GIL while decompressing).
+    The lines are identical to the lines of the uncompressed file, so are the line numbers. Compiled input files (see
+    compiled_input.compile_lines) are read as a memory-mapped file; their skipped lines are read as empty lines.
+    :param path: path to the input file
+    :param workers: number of threads decompressing members in parallel (default = number of cpu cores)
+    :return: a text file object
+    """
+    if compiled_input.is_compiled_file(path):
+        logger.debug(f"Detected a compiled input file '{path}'.")
+        return compiled_input.CompiledInputFile(path)
+
+    compression = detect_compression(path)
+    if not compression:
+        return open(path, 'r')
+
+    logger.debug(f"Detected {compression} compression for '{path}'.")
+    raw_stream = _DecompressingStream(path, compression, workers or os.cpu_count() or 1)
+    return io.TextIOWrapper(io.BufferedReader(raw_stream, buffer_size=READ_BUFFER_SIZE))
+
+
+def _decompress_member(data, compression, max_size):
+    """
+    Decompresses a single gzip member or bzip2 stream, up to max_size decompressed bytes.
+    :param data: the compressed bytes
+    :param compression: 'gzip' or 'bz2'
+    :param max_size: maximum size of the decompressed bytes
+    :return: the decompressed bytes, or None if data is not exactly one complete member of at most max_size bytes
+    """
+    decompressor = zlib.decompressobj(wbits=31) if compression == 'gzip' else bz2.BZ2Decompressor()
+    try:
+        output = decompressor.decompress(data, max_length=max_size)
+    except (zlib.error, OSError):
+        return None
+
+    # The decompression stops at max_size bytes, before the end of a bigger member
+    if not decompressor.eof or decompressor.unused_data:
+        return None
+    return output
+
+
+class _DecompressingStream(io.RawIOBase):
+    """
+    A raw binary stream returning the decompressed content of a compressed file.
+    The members of a multi-member gzip/bzip2 file are memory-mapped and decompressed in parallel, and their content is
+    returned in order. If the candidate member boundaries turn out to be wrong, e.g. a header-like sequence within the
+    compressed data, or if a member decompresses to more than PARALLEL_MAX_MEMBER_OUTPUT bytes, the rest of the file is
+    decompressed sequentially, starting from the last known boundary. At most PARALLEL_MAX_INFLIGHT_BYTES decompressed
+    bytes are in flight, whatever the number of threads.
+    """
+    def __init__(self, path, compression, workers):
+        super(_DecompressingStream, self).__init__()
+        self._path = path
+        self._compression = compression
+        # Number of members in flight, and of threads decompressing them
+        self._max_pending = max(1, min(2 * workers, PARALLEL_MAX_INFLIGHT_BYTES // PARALLEL_MAX_MEMBER_OUTPUT))
+        self._workers = min(workers, self._max_pending)
+        self._file = None
+        self._mmap = None
+        self._chunks = self._iter_chunks()
+        self._pending_chunk = memoryview(b'')
+
+    def _get_member_offsets(self):
+        offsets = [match.start() for match in _MEMBER_HEADERS[self._compression].finditer(self._mmap)]
+        if not offsets or offsets[0] != 0:
+            offsets.insert(0, 0)
+        return offsets
+
+    def _iter_sequential(self, offset):
+        logger.debug(f"Decompressing '{self._path}' sequentially from offset {offset}.")
+        with open(self._path, 'rb', buffering=READ_BUFFER_SIZE) as compressed_file:
+            compressed_file.seek(offset)
+            with _DECOMPRESSING_FILES[self._compression](compressed_file) as decompressing_file:
+                while True:
+                    chunk = decompressing_file.read(READ_BUFFER_SIZE)
+                    if not chunk:
+                        return
+                    yield chunk
+
+    def _iter_chunks(self):
+        if self._compression not in _MEMBER_HEADERS or self._workers < 2:
+            yield from self._iter_sequential(0)
+            return
+
+        self._file = open(self._path, 'rb')
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        offsets = self._get_member_offsets()
+        segments = list(zip(offsets, offsets[1:] + [len(self._mmap)]))
+        if len(segments) < 2 or max(end - start for start, end in segments) > PARALLEL_MAX_MEMBER_SIZE:
+            yield from self._iter_sequential(0)
+            return
+
+        logger.debug(f"Decompressing {len(segments)} members of '{self._path}' with {self._workers} threads.")
+        segments = iter(segments)
+        pending = deque()
+        with ThreadPoolExecutor(max_workers=self._workers) as executor:
+            def submit_segments():
+                # Keep a bounded number of members in flight, so the memory usage depends neither on the file size nor
+                # on the number of threads
+                while len(pending) < self._max_pending:
+                    segment = next(segments, None)
+                    if segment is None:
+                        return
+                    start, end = segment
+                    pending.append((start, executor.submit(_decompress_member, self._mmap[start:end],
+                                                           self._compression, PARALLEL_MAX_MEMBER_OUTPUT)))
+
+            submit_segments()
+            while pending:
+                start, future = pending.popleft()
+                output = future.result()
+                if output is None:
+                    for _, pending_future in pending:
+                        pending_future.cancel()
+                    yield from self._iter_sequential(start)
+                    return
+
+                submit_segments()
+                if output:
+                    yield output
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        if not self._pending_chunk:
+            self._pending_chunk = memoryview(next(self._chunks, b''))
+            if not self._pending_chunk:
+                return 0
+
+        size = min(len(buffer), len(self._pending_chunk))
+        buffer[:size] = self._pending_chunk[:size]
+        self._pending_chunk = self._pending_chunk[size:]
+        return size
+
+    def close(self):
+        if not self.closed:
+            self._chunks.close()
+            self._pending_chunk = memoryview(b'')
+            if self._mmap:
+                self._mmap.close()
+            if self._file:
+                self._file.close()
+        super(_DecompressingStream, self).close()
@@ -0,0 +1,61 @@
+import glob
+import os
+
+from helpers.compressed_input import open_input
+
+
+def read_file_list(file_list_path):
+    """
+    Reads a file-of-files. Each non-empty line holds a path or a glob pattern. Lines beginning with a pound sign (#)
+    are ignored.
+    :param file_list_path: path to the file containing the input paths
+    :return: a list of paths/patterns in the order they appear in the file
+    """
+    with open(file_list_path, 'r') as file_list:
+        return [line.strip() for line in file_list if line.strip() and not line.strip().startswith('#')]
+
+
+def expand_input_paths(patterns, file_list_path=None):
+    """
+    Expands the input patterns into a list of file paths. Glob patterns are expanded and sorted, so the processing
+    order is deterministic. A pattern that does not match anything is kept as is; opening it will then fail and the
+    failure will be reported for that input only.
+    :param patterns: an iterable of paths or glob patterns
+    :param file_list_path: an optional file-of-files whose entries are appended to the patterns
+    :return: a list of file paths
+    """
+    patterns = list(patterns or [])
+    if file_list_path:
+        patterns.extend(read_file_list(file_list_path))
+
+    paths = []
+    for pattern in patterns:
+        if any(char in pattern for char in '*?['):
+            matches = sorted(path for path in glob.glob(pattern, recursive=True) if not os.path.isdir(path))
+            paths.extend(matches if matches else [pattern])
+        else:
+            paths.append(pattern)
+
+    return paths
+
+
+def iter_tagged_lines(paths, opener=open_input):
+    """
+    Chains the lines of several input files into a single stream, so a single producer can feed a single warm pool
+    of consumers. Every line is tagged with a (source_index, line_index) key. Both indexes are zero based.
+    If an input cannot be opened or read, the exception is yielded in place of the line content, and the stream
+    continues with the next input.
+    :param paths: list of input file paths
+    :param opener: callable used to open each path, returning an iterable of lines. Compressed inputs are decompressed
+    as a stream by default.
+    :return: a generator of ((source_index, line_index), line or exception) tuples
+    """
+    for source_index, path in enumerate(paths):
+        line_index = 0
+        try:
+            with opener(path) as input_file:
+                for line in input_file:
+                    yield (source_index, line_index), line
+                    line_index += 1
+        except Exception as exc:
+            yield (source_index, line_index), exc
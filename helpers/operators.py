@@ -1,5 +1,13 @@
 import operator
 
+# Supported operators. Each operator string is mapped to its (precedence, callable) tuple.
+_OPERATORS = {'+': (1, operator.add), '-': (1, operator.sub), '*': (2, operator.mul), '/': (2, operator.truediv)}
+
+# Opcodes of the operators in the compiled input files (see compiled_input). The opcodes are negative, from -1 to -16,
+# so they can be stored along with the (non-negative) operands. Existing opcodes must not change, as they are written
+# to disk.
+_OPCODES = {'+': -1, '-': -2, '*': -3, '/': -4}
+
 
 class RPNOperator:
     """
@@ -32,18 +40,37 @@ class OperatorsHelper:
         :param token: is a string containing zero or more characters
         :return: The operator's object if the string is a valid operator, else None
         """
-        operators = {'+': (1, operator.add), '-': (1, operator.sub), '*': (2, operator.mul), '/': (2, operator.truediv)}
-
         token = token.strip()
         if not (token and isinstance(token, str) and len(token) == 1):
             return None
 
-        if not (token in operators.keys()):
+        if not (token in _OPERATORS.keys()):
             return None
 
-        precedence_operator_tuple = operators[token]
+        precedence_operator_tuple = _OPERATORS[token]
         return RPNOperator(token, precedence_operator_tuple[0], precedence_operator_tuple[1])
 
+    @staticmethod
+    def get_opcode(token):
+        """
+        :param token: the string representation of an operator
+        :return: the opcode of the operator in the compiled input files, or None if token is not an operator
+        """
+        return _OPCODES.get(token)
+
+    @staticmethod
+    def get_operators_by_opcode():
+        """
+        :return: a dictionary mapping each opcode to its' operator object
+        """
+        return {opcode: OperatorsHelper.get_operator(token) for token, opcode in _OPCODES.items()}
+
+    @staticmethod
+    def get_operator_strings():
+        """
+        :return: a frozenset of the string representations of the supported operators
+        """
+        return frozenset(_OPERATORS.keys())
 
     @staticmethod
     def validate_operand(token: str) -> int:
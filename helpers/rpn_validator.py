@@ -0,0 +1,233 @@
+import locale
+import logging
+import multiprocessing as mp
+import os
+from collections import deque
+
+from helpers.compiled_input import is_compiled_file
+from helpers.compressed_input import detect_compression, open_input
+from helpers.operators import OperatorsHelper
+
+logger = logging.getLogger(__name__)
+
+# Error classes reported by validate_expression()
+ERROR_EMPTY_TOKEN = 'empty_token'
+ERROR_INVALID_OPERAND = 'invalid_operand'
+ERROR_MISSING_OPERAND = 'missing_operand'
+ERROR_MISSING_OPERATOR = 'missing_operator'
+ERROR_ZERO_SECOND_OPERAND = 'zero_second_operand'
+
+# Uncompressed files are split into byte ranges of this size, which are read by the workers themselves
+RANGE_SIZE = 8 * 1024 * 1024
+
+# Compressed files are read by the main process, and sent to the workers in chunks of this number of lines
+CHUNK_LINES = 50000
+
+_OPERATOR_STRINGS = OperatorsHelper.get_operator_strings()
+
+
+def validate_expression(expression, delimiter=','):
+    """
+    Checks the tokens and the stack depth of an RPN expression in a single pass, without evaluating it, building a tree
+    or raising exceptions. ExpressionTree rejects any operator whose second operand is zero: a literal zero operand is
+    detected here, but a second operand which evaluates to zero (e.g. '5, 2, 2, -, +'), like the other arithmetic
+    errors, is only detected while evaluating.
+    An empty expression is valid, as it is for ExpressionTree.
+    :param expression: the RPN expression
+    :param delimiter: tokens delimiter
+    :return: None if the expression is valid, otherwise its error class (one of the ERROR_* constants)
+    """
+    expression = expression.strip()
+    if not expression:
+        return None
+
+    depth = 0
+    # True if the operand on top of the stack is a literal zero
+    is_zero_on_top = False
+    for token in expression.split(delimiter):
+        token = token.strip()
+        if token in _OPERATOR_STRINGS:
+            if depth < 2:
+                return ERROR_MISSING_OPERAND
+            if is_zero_on_top:
+                return ERROR_ZERO_SECOND_OPERAND
+            depth -= 1
+        elif token.isdecimal():
+            # Any decimal string is accepted by int(), contrary to the other numeric strings (e.g. '½'). The non ASCII
+            # digits (e.g. '٠') are rare, so int() is only called for them.
+            depth += 1
+            is_zero_on_top = not token.lstrip('0') or (not token.isascii() and int(token) == 0)
+        elif not token:
+            return ERROR_EMPTY_TOKEN
+        else:
+            return ERROR_INVALID_OPERAND
+
+    return None if depth == 1 else ERROR_MISSING_OPERATOR
+
+
+class ValidationReport:
+    """
+    Summary of the validation of an input: the number of validated expressions, the number of malformed expressions per
+    error class, and the indexes of the first malformed lines.
+    """
+    def __init__(self, path, max_reported):
+        self.path = path
+        self.max_reported = max_reported
+        self.lines_count = 0
+        self.expressions_count = 0
+        self.error_counts = {}
+        self.first_errors = []
+        self.read_error = None
+
+    def get_errors_count(self):
+        """
+        :return: total number of malformed expressions
+        """
+        return sum(self.error_counts.values())
+
+    def add_chunk_result(self, chunk_result):
+        """
+        Merges the result of a chunk (see _validate_lines) into the report. Chunks must be added in the input order.
+        :param chunk_result: (lines_count, expressions_count, error_counts, first_errors) tuple
+        :return: None
+        """
+        lines_count, expressions_count, error_counts, first_errors = chunk_result
+        for line_index, error_class in first_errors:
+            if len(self.first_errors) >= self.max_reported:
+                break
+            self.first_errors.append((self.lines_count + line_index, error_class))
+
+        for error_class, count in error_counts.items():
+            self.error_counts[error_class] = self.error_counts.get(error_class, 0) + count
+        self.lines_count += lines_count
+        self.expressions_count += expressions_count
+
+    def get_summary_lines(self):
+        """
+        :return: list of strings describing the report
+        """
+        if self.read_error:
+            return [f"ERROR- Could not read the input. Details: {self.read_error}"]
+
+        summary_lines = [f"Validated {self.expressions_count} expression(s) in {self.lines_count} line(s): "
+                         f"{self.get_errors_count()} malformed."]
+        for error_class, count in sorted(self.error_counts.items()):
+            summary_lines.append(f"ERROR- {error_class}: {count}")
+        if self.first_errors:
+            summary_lines.append("First malformed lines: " +
+                                 ', '.join(f"{line_index} ({error_class})" for line_index, error_class
+                                           in self.first_errors))
+        return summary_lines
+
+
+def _validate_lines(lines, comment_identifier, max_reported):
+    """
+    Validates a chunk of lines. Empty and comment lines are skipped, as they are by the producer.
+    :return: (lines_count, expressions_count, error_counts, first_errors) tuple. The line indexes of first_errors are
+    relative to the chunk.
+    """
+    expressions_count = 0
+    error_counts = {}
+    first_errors = []
+    for line_index, line in enumerate(lines):
+        line = line.strip()
+        if not line or line.startswith(comment_identifier):
+            continue
+
+        expressions_count += 1
+        error_class = validate_expression(line)
+        if error_class:
+            error_counts[error_class] = error_counts.get(error_class, 0) + 1
+            if len(first_errors) < max_reported:
+                first_errors.append((line_index, error_class))
+
+    return len(lines), expressions_count, error_counts, first_errors
+
+
+def _read_range_lines(path, start, end):
+    # The same newlines translation as the files opened in text mode
+    with open(path, 'rb') as input_file:
+        input_file.seek(start)
+        text = input_file.read(end - start).decode(locale.getpreferredencoding(False))
+    lines = text.replace('\r\n', '\n').replace('\r', '\n').split('\n')
+    if lines[-1] == '':
+        lines.pop()
+    return lines
+
+
+def _validate_task(task):
+    """
+    Entry point of the pool workers.
+    :param task: either ('range', path, start, end, comment_identifier, max_reported) or
+    ('lines', lines, comment_identifier, max_reported)
+    """
+    if task[0] == 'range':
+        _, path, start, end, comment_identifier, max_reported = task
+        return _validate_lines(_read_range_lines(path, start, end), comment_identifier, max_reported)
+
+    _, lines, comment_identifier, max_reported = task
+    return _validate_lines(lines, comment_identifier, max_reported)
+
+
+def _get_line_aligned_ranges(path):
+    # Each range ends right after a line feed, so no line (and no '\r\n') is split between two ranges
+    file_size = os.path.getsize(path)
+    ranges = []
+    with open(path, 'rb') as input_file:
+        start = 0
+        while start < file_size:
+            input_file.seek(min(start + RANGE_SIZE, file_size))
+            input_file.readline()
+            end = min(input_file.tell(), file_size)
+            ranges.append((start, end))
+            start = end
+    return ranges
+
+
+def _iter_tasks(path, comment_identifier, max_reported):
+    if not detect_compression(path) and not is_compiled_file(path):
+        for start, end in _get_line_aligned_ranges(path):
+            yield 'range', path, start, end, comment_identifier, max_reported
+        return
+
+    with open_input(path) as input_file:
+        lines = []
+        for line in input_file:
+            lines.append(line)
+            if len(lines) >= CHUNK_LINES:
+                yield 'lines', lines, comment_identifier, max_reported
+                lines = []
+        if lines:
+            yield 'lines', lines, comment_identifier, max_reported
+
+
+def validate_files(paths, comment_identifier='#', max_reported=10, workers=None):
+    """
+    Validates the input files with a pool of processes, one per cpu core by default. Uncompressed files are split into
+    byte ranges read by the workers, so the main process does not read them at all.
+    :param paths: list of input file paths
+    :param comment_identifier: lines starting with this string are ignored
+    :param max_reported: maximum number of malformed line indexes reported per input
+    :param workers: number of worker processes (default = number of cpu cores)
+    :return: a list of ValidationReport, one per input
+    """
+    workers = workers or os.cpu_count()
+    reports = []
+    with mp.Pool(processes=workers) as pool:
+        for path in paths:
+            report = ValidationReport(path, max_reported)
+            # Pool.imap() would read the whole input ahead, so the number of chunks in flight is bounded here instead
+            pending = deque()
+            try:
+                for task in _iter_tasks(path, comment_identifier, max_reported):
+                    pending.append(pool.apply_async(_validate_task, (task,)))
+                    if len(pending) >= 2 * workers:
+                        report.add_chunk_result(pending.popleft().get())
+                while pending:
+                    report.add_chunk_result(pending.popleft().get())
+            except Exception as exc:
+                report.read_error = exc
+            reports.append(report)
+            logger.debug(f"Validated '{path}': {report.get_errors_count()} malformed expression(s).")
+
+    return reports
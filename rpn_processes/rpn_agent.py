@@ -0,0 +1,92 @@
+import logging
+import multiprocessing as mp
+import os
+import socket
+import time
+
+from binary_expression_tree import binary_expression_tree
+from rpn_processes import rpn_process, rpn_protocol
+from rpn_processes.rpnconsumer import evaluate_item
+
+logger = logging.getLogger(__name__)
+
+# Number of chunks an agent asks to have in flight: while it evaluates a chunk, the next one is already on the way
+DEFAULT_PREFETCH = 2
+
+
+def _connect(address, connect_timeout):
+    # The coordinator might not be listening yet
+    deadline = time.monotonic() + connect_timeout
+    while True:
+        try:
+            return socket.create_connection(address, timeout=connect_timeout)
+        except OSError:
+            if time.monotonic() >= deadline:
+                raise
+            time.sleep(rpn_process.POLL_INTERVAL * 10)
+
+
+def run_agent(address, name=None, prefetch=DEFAULT_PREFETCH, connect_timeout=30):
+    """
+    Runs a worker agent: connects to a coordinator (see rpn_coordinator.Coordinator), evaluates the chunks of lines it
+    sends with ExpressionTree, and sends back the results, until the coordinator reports that all the lines are
+    processed.
+    :param address: (host, port) tuple of the coordinator
+    :param name: name of the agent in the coordinator statistics (default = host name and process id)
+    :param prefetch: number of chunks in flight
+    :param connect_timeout: maximum waiting time in seconds for the coordinator to be listening
+    :return: the number of evaluated lines
+    """
+    name = name or f"{socket.gethostname()}:{os.getpid()}"
+    lines_count = 0
+    with _connect(address, connect_timeout) as connection:
+        # The evaluation of a chunk might take longer than connecting
+        connection.settimeout(None)
+        rpn_protocol.send_message(connection, {'type': rpn_protocol.HELLO, 'name': name, 'prefetch': prefetch})
+        config = rpn_protocol.receive_message(connection)
+        if not config or config['type'] != rpn_protocol.CONFIG:
+            raise rpn_protocol.ProtocolError(f"Expected a {rpn_protocol.CONFIG} message, received {config}.")
+        expression_tree = binary_expression_tree.ExpressionTree(max_result_bits=config.get('max_result_bits'))
+        logger.debug(f"Agent {name} connected to {address}.")
+
+        while True:
+            message = rpn_protocol.receive_message(connection)
+            if not message or message['type'] == rpn_protocol.DONE:
+                break
+            if message['type'] != rpn_protocol.CHUNK:
+                raise rpn_protocol.ProtocolError(f"Unexpected {message['type']} message.")
+
+            results = [evaluate_item(expression_tree, (line_index, line))[0][1] for line_index, line in
+                       message['items']]
+            rpn_protocol.send_message(connection, {'type': rpn_protocol.RESULTS, 'chunk_id': message['chunk_id'],
+                                                   'results': results})
+            lines_count += len(results)
+
+    logger.debug(f"Agent {name} finished after evaluating {lines_count} line(s).")
+    return lines_count
+
+
+def _run_agent_process(address, name, prefetch, connect_timeout):
+    try:
+        run_agent(address, name, prefetch, connect_timeout)
+    except (OSError, rpn_protocol.ProtocolError) as exc:
+        logger.error(f"Agent {name} stopped. Details: {exc}")
+
+
+def run_agents(address, agents_count, name=None, prefetch=DEFAULT_PREFETCH, connect_timeout=30):
+    """
+    Runs agents_count worker agents in their own processes, so a host contributes all its' cpu cores.
+    :param address: (host, port) tuple of the coordinator
+    :param agents_count: number of agent processes
+    :param name: prefix of the names of the agents (default = host name)
+    :param prefetch: number of chunks in flight per agent
+    :param connect_timeout: maximum waiting time in seconds for the coordinator to be listening
+    :return: None
+    """
+    name = name or socket.gethostname()
+    processes = [mp.Process(target=_run_agent_process, args=(address, f"{name}-{index}", prefetch, connect_timeout))
+                 for index in range(agents_count)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
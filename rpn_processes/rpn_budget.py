@@ -0,0 +1,120 @@
+import multiprocessing as mp
+import re
+import sys
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows
+    resource = None
+
+# Approximate memory overhead of an item (the tuple, the line number and the string object headers) in bytes
+ITEM_OVERHEAD = 100
+
+_SIZE_UNITS = {'': 1, 'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}
+
+
+def parse_size(size_string):
+    """
+    Parses a size in bytes, with an optional K, M or G suffix (e.g. '512M').
+    :param size_string: the size string
+    :return: the size in bytes
+    """
+    match = re.fullmatch(r'\s*(\d+)\s*([KMG]?)B?\s*', str(size_string), re.IGNORECASE)
+    if not match:
+        raise ValueError(f"'{size_string}' is not a valid size.")
+    return int(match.group(1)) * _SIZE_UNITS[match.group(2).upper()]
+
+
+def get_item_size(text):
+    """
+    :param text: a line or a result string
+    :return: the number of bytes charged to the budget for the given line or result
+    """
+    return len(text) + ITEM_OVERHEAD
+
+
+def get_line_reservation(line):
+    """
+    :param line: a line read by the producer, either a string or the token bytes of a compiled line (see compiled_input)
+    :return: the number of bytes charged to the budget for the given line and its future result. The result (the infix
+    expression and its value) is about as long as the line. The token bytes are charged as they are, as they are what
+    is held in flight.
+    """
+    return 2 * get_item_size(line)
+
+
+def get_peak_rss():
+    """
+    :return: (peak RSS of the current process, peak RSS of the largest terminated child process) tuple in bytes, or
+    None if it is not available on this platform
+    """
+    if not resource:
+        return None
+    # ru_maxrss is in bytes on macOS, and in kilobytes on the other platforms
+    unit = 1 if sys.platform == 'darwin' else 1024
+    return (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * unit,
+            resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * unit)
+
+
+class ByteBudget:
+    """
+    A budget of in-flight bytes shared by the producer, the consumers and the main thread. The producer charges every
+    line it reads along with its future result, the consumers replace this reservation with the actual charge of the
+    result, and the main thread releases the charge of each result once it is written out. So the budget covers the
+    lines waiting in the producer chunks and in the scheduler queues, and the results waiting in the result queues.
+    Only the producer waits for the budget (see try_acquire); the consumers are never blocked, so the results can
+    always be collected, and the budget released.
+    """
+    def __init__(self, limit):
+        self.limit = limit
+        self._used = mp.Value('q', 0)
+        self._peak = mp.RawValue('q', 0)
+
+    def try_acquire(self, size):
+        """
+        Charges size bytes, if they fit into the budget. A single item bigger than the whole budget is accepted when
+        nothing else is in flight, otherwise it would never be processed.
+        :param size: number of bytes
+        :return: True if the bytes are charged
+        """
+        with self._used.get_lock():
+            if self._used.value and self._used.value + size > self.limit:
+                return False
+            self._charge(size)
+            return True
+
+    def acquire(self, size):
+        """
+        Charges size bytes, even if they exceed the budget.
+        :param size: number of bytes
+        :return: None
+        """
+        with self._used.get_lock():
+            self._charge(size)
+
+    def _charge(self, size):
+        self._used.value += size
+        if self._used.value > self._peak.value:
+            self._peak.value = self._used.value
+
+    def release(self, size):
+        """
+        Releases size bytes charged before.
+        :param size: number of bytes
+        :return: None
+        """
+        with self._used.get_lock():
+            self._used.value -= size
+
+    def get_used(self):
+        """
+        :return: number of bytes in flight
+        """
+        return self._used.value
+
+    def get_peak(self):
+        """
+        :return: the maximum number of bytes in flight so far
+        """
+        return self._peak.value
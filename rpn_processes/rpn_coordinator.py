@@ -0,0 +1,295 @@
+import logging
+import socket
+import socketserver
+import threading
+import time
+from collections import deque
+
+from helpers import compiled_input
+from rpn_processes import rpn_protocol
+from rpn_processes.rpnconsumer import format_error_result, get_line_index
+
+logger = logging.getLogger(__name__)
+
+# Maximum waiting time in seconds of the coordinator threads between two checks of the shared state
+_WAIT_INTERVAL = 0.1
+
+
+class _Chunk:
+    """
+    A chunk of consecutive (line_key, line) items, and their results once processed.
+    """
+    def __init__(self, chunk_id, items, results=None):
+        self.chunk_id = chunk_id
+        self.items = items
+        self.results = results
+        self.attempts = 0
+
+
+class AgentStats:
+    """
+    The statistics of a worker agent connection.
+    """
+    def __init__(self, name):
+        self.name = name
+        self.chunks_count = 0
+        self.lines_count = 0
+        self.lost_chunks_count = 0
+        self.connected_time = time.monotonic()
+        self.disconnected_time = None
+
+    def get_throughput(self):
+        """
+        :return: number of lines processed per second while the agent was connected
+        """
+        elapsed = (self.disconnected_time or time.monotonic()) - self.connected_time
+        return self.lines_count / elapsed if elapsed > 0 else 0.0
+
+    def __str__(self):
+        return f"Worker agent '{self.name}': {self.lines_count} line(s) in {self.chunks_count} chunk(s), " \
+               f"{self.get_throughput():.0f} lines/s, {self.lost_chunks_count} lost chunk(s)."
+
+
+class _AgentHandler(socketserver.BaseRequestHandler):
+    # Serves a single worker agent connection, in its' own thread
+    def handle(self):
+        self.server.coordinator.serve_agent(self.request, self.client_address)
+
+
+class _AgentServer(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+class Coordinator:
+    """
+    Splits the input into chunks of consecutive lines, and hands them to worker agents (see rpn_agent.run_agent)
+    connected over TCP. Each agent leases up to its' prefetch count of chunks at once. A lease ends when the agent sends
+    the results of the chunk; if the agent disconnects, or does not send any result for lease_timeout seconds, its'
+    leased chunks are handed to the other agents again. A chunk lost more than max_retries times gets error results,
+    as one of its' lines might be killing the agents.
+    The results are merged back into the input order via a reorder buffer of at most max_pending_chunks chunks: the
+    input is read only while the buffer is not full, so the memory usage is bounded even if an agent is slow.
+    """
+    def __init__(self, address, chunk_size=64, lease_timeout=30, max_retries=3, max_pending_chunks=64,
+                 max_result_bits=None, comment_identifier='#', tagged_input=False):
+        """
+        :param address: (host, port) tuple to listen on, the port might be 0 to pick a free port
+        :param chunk_size: number of lines per chunk
+        :param lease_timeout: seconds without any result after which the chunks leased by an agent are considered lost
+        :param max_retries: number of times a lost chunk is handed to the agents again
+        :param max_pending_chunks: maximum number of chunks read from the input, but not written out yet
+        :param max_result_bits: see ExpressionTree, sent to the agents
+        :param comment_identifier: lines beginning with it are skipped
+        :param tagged_input: see rpnproducer.RpnProducer
+        """
+        self._chunk_size = chunk_size
+        self._lease_timeout = lease_timeout
+        self._max_retries = max_retries
+        self._max_pending_chunks = max_pending_chunks
+        self._config = {'type': rpn_protocol.CONFIG, 'max_result_bits': max_result_bits}
+        self._comment_identifier = comment_identifier
+        self._tagged_input = tagged_input
+
+        self._condition = threading.Condition()
+        # The chunks read from the input, but not written out yet, by chunk id
+        self._chunks = {}
+        # The ids of the chunks waiting for an agent
+        self._pending_chunk_ids = deque()
+        self._input_exhausted = False
+        self._finished = False
+        self.agent_stats = []
+
+        self._server = _AgentServer(address, _AgentHandler)
+        self._server.coordinator = self
+        self.address = self._server.server_address[:2]
+        self._server_thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._server_thread.start()
+        logger.info(f"Waiting for worker agents on {self.address[0]}:{self.address[1]}.")
+
+    def _iter_chunks(self, input_iterable):
+        # Yields (items, results) tuples; results is None unless the chunk is an input which could not be read
+        chunk = []
+        for line_number, string_item in enumerate(input_iterable):
+            line_key = line_number
+            if self._tagged_input:
+                line_key, string_item = string_item
+                if isinstance(string_item, Exception):
+                    if chunk:
+                        yield chunk, None
+                        chunk = []
+                    yield [(line_key, '')], [f"ERROR- Could not read the input. Details: {string_item}"]
+                    continue
+
+            # The agents receive the text of the tokenised lines of the compiled input files
+            string_item = compiled_input.get_line_text(string_item).strip()
+            if not string_item or string_item.startswith(self._comment_identifier):
+                continue
+            chunk.append((line_key, string_item))
+            if len(chunk) >= self._chunk_size:
+                yield chunk, None
+                chunk = []
+        if chunk:
+            yield chunk, None
+
+    def _pop_ready_chunks(self, next_chunk_id):
+        ready_chunks = []
+        while next_chunk_id + len(ready_chunks) in self._chunks and \
+                self._chunks[next_chunk_id + len(ready_chunks)].results is not None:
+            ready_chunks.append(self._chunks.pop(next_chunk_id + len(ready_chunks)))
+        return ready_chunks
+
+    def run(self, input_iterable, emit):
+        """
+        Processes the input with the connected agents. Blocks until all the lines are processed.
+        :param input_iterable: iterable of lines, or of (line_key, line) tuples if tagged_input is set
+        :param emit: callable receiving each (line_key, result string), in the input order
+        :return: None
+        """
+        chunks_iterator = self._iter_chunks(input_iterable)
+        created_count = 0
+        next_chunk_id = 0
+        while True:
+            with self._condition:
+                ready_chunks = self._pop_ready_chunks(next_chunk_id)
+                buffer_full = len(self._chunks) >= self._max_pending_chunks
+                if not ready_chunks and (buffer_full or self._input_exhausted):
+                    if self._input_exhausted and not self._chunks:
+                        break
+                    self._condition.wait(_WAIT_INTERVAL)
+                    continue
+
+            next_chunk_id += len(ready_chunks)
+            for chunk in ready_chunks:
+                for item, result in zip(chunk.items, chunk.results):
+                    emit(item[0], result)
+
+            if not buffer_full and not self._input_exhausted:
+                # The input is read outside of the lock, so the agents are served meanwhile
+                items, results = next(chunks_iterator, (None, None))
+                with self._condition:
+                    if items is None:
+                        self._input_exhausted = True
+                    else:
+                        self._chunks[created_count] = _Chunk(created_count, items, results)
+                        if results is None:
+                            self._pending_chunk_ids.append(created_count)
+                        created_count += 1
+                    self._condition.notify_all()
+
+        with self._condition:
+            self._finished = True
+            self._condition.notify_all()
+
+    def _lease_chunk(self):
+        # Returns a chunk waiting for an agent, or None. Must be called with the lock held.
+        while self._pending_chunk_ids:
+            chunk = self._chunks.get(self._pending_chunk_ids.popleft())
+            # A lost chunk might have been completed by its' late results
+            if chunk and chunk.results is None:
+                return chunk
+        return None
+
+    def _complete_chunk(self, leased_chunks, message, stats):
+        chunk = leased_chunks.pop(message.get('chunk_id'), None)
+        results = message.get('results')
+        if not chunk or not isinstance(results, list) or len(results) != len(chunk.items):
+            raise rpn_protocol.ProtocolError(f"Unexpected results of the chunk {message.get('chunk_id')}.")
+
+        with self._condition:
+            if chunk.results is None:
+                chunk.results = [str(result) for result in results]
+            stats.chunks_count += 1
+            stats.lines_count += len(results)
+            self._condition.notify_all()
+
+    def _release_chunks(self, leased_chunks, stats, details):
+        # Hands the chunks of a lost agent to the other agents, in the input order
+        with self._condition:
+            for chunk in sorted(leased_chunks.values(), key=lambda leased_chunk: leased_chunk.chunk_id, reverse=True):
+                if chunk.results is not None:
+                    continue
+                stats.lost_chunks_count += 1
+                chunk.attempts += 1
+                if chunk.attempts > self._max_retries:
+                    chunk.results = [format_error_result(line_key, line, f"The chunk was lost by {chunk.attempts} "
+                                                                         f"worker agent(s). Last error: {details}")
+                                     for line_key, line in chunk.items]
+                else:
+                    self._pending_chunk_ids.appendleft(chunk.chunk_id)
+            self._condition.notify_all()
+
+    def serve_agent(self, connection, client_address):
+        """
+        Serves a worker agent connection until all the lines are processed, or the agent is lost. Called by the
+        server, in a thread per connection.
+        :param connection: the connected socket
+        :param client_address: the address of the agent
+        :return: None
+        """
+        stats = None
+        leased_chunks = {}
+        try:
+            connection.settimeout(self._lease_timeout)
+            hello = rpn_protocol.receive_message(connection)
+            if not hello or hello['type'] != rpn_protocol.HELLO:
+                raise rpn_protocol.ProtocolError(f"Expected a {rpn_protocol.HELLO} message.")
+            prefetch = max(1, int(hello.get('prefetch', 1)))
+            stats = AgentStats(str(hello.get('name') or f"{client_address[0]}:{client_address[1]}"))
+            with self._condition:
+                self.agent_stats.append(stats)
+            rpn_protocol.send_message(connection, self._config)
+            logger.debug(f"Worker agent '{stats.name}' connected from {client_address}.")
+
+            while True:
+                with self._condition:
+                    new_chunks = []
+                    while len(leased_chunks) + len(new_chunks) < prefetch:
+                        chunk = self._lease_chunk()
+                        if not chunk:
+                            break
+                        new_chunks.append(chunk)
+                    finished = self._finished
+                    if not new_chunks and not leased_chunks and not finished:
+                        self._condition.wait(_WAIT_INTERVAL)
+                        continue
+
+                for chunk in new_chunks:
+                    leased_chunks[chunk.chunk_id] = chunk
+                    rpn_protocol.send_message(connection, {'type': rpn_protocol.CHUNK, 'chunk_id': chunk.chunk_id,
+                                                           'items': [(get_line_index(line_key), line)
+                                                                     for line_key, line in chunk.items]})
+                if not leased_chunks:
+                    rpn_protocol.send_message(connection, {'type': rpn_protocol.DONE})
+                    break
+
+                message = rpn_protocol.receive_message(connection)
+                if not message:
+                    raise rpn_protocol.ProtocolError('The agent closed the connection.')
+                if message['type'] != rpn_protocol.RESULTS:
+                    raise rpn_protocol.ProtocolError(f"Unexpected {message['type']} message.")
+                self._complete_chunk(leased_chunks, message, stats)
+        except (OSError, ValueError, rpn_protocol.ProtocolError) as exc:
+            details = 'The lease expired.' if isinstance(exc, socket.timeout) else str(exc)
+            logger.warning(f"Lost the worker agent '{stats.name if stats else client_address}'. Details: {details}")
+            self._release_chunks(leased_chunks, stats or AgentStats(str(client_address)), details)
+        finally:
+            if stats:
+                stats.disconnected_time = time.monotonic()
+
+    def close(self):
+        """
+        Stops listening. The agents which are still connected are told that all the lines are processed.
+        :return: None
+        """
+        with self._condition:
+            self._finished = True
+            self._condition.notify_all()
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -0,0 +1,62 @@
+import string
+
+from helpers import compiled_input
+
+# Names of the available dispatch orders, see plan_chunks()
+FIFO = 'fifo'
+LPT = 'lpt'
+
+# Estimated cost of handling a token, relative to the cost of a byte of the line
+TOKEN_COST = 8
+
+# Number of chunks planned per worker thread within a scheduling window. A worker thread finishing its' heavy chunks
+# early can then pick some of the lighter ones.
+CHUNKS_PER_WORKER = 4
+
+_DELETE_DIGITS = str.maketrans('', '', string.digits)
+
+
+def estimate_line_cost(line, delimiter=','):
+    """
+    Estimates the relative cost of evaluating a line, without parsing it. The parsing cost grows with the byte length
+    and the token count. The arithmetic on big operands costs about the number of digits of the operands times the
+    number of digits of the intermediate results, which is approximated with the total digit count times the average
+    digit count per token.
+    :param line: the line content
+    :param delimiter: the token delimiter
+    :return: the estimated cost, an integer
+    """
+    token_count = line.count(delimiter) + 1
+    digit_count = len(line) - len(line.translate(_DELETE_DIGITS))
+    return len(line) + TOKEN_COST * token_count + digit_count * digit_count // token_count
+
+
+def plan_chunks(items, chunk_size, workers_count):
+    """
+    Splits the items of a scheduling window into chunks to be dispatched in the returned order, longest processing
+    time first: the items are sorted by decreasing estimated cost, and packed into chunks of at most chunk_size items
+    and of about 1 / (CHUNKS_PER_WORKER * workers_count) of the window cost. So the expensive lines are dispatched
+    first, in chunks of their own, and the cheap lines fill the gaps at the end of the window. The output order is
+    restored by the main thread from the line keys.
+    :param items: list of (line_key, line) items
+    :param chunk_size: maximum number of items in a chunk
+    :param workers_count: number of worker threads
+    :return: list of chunks
+    """
+    costed_items = sorted(((estimate_line_cost(compiled_input.get_line_text(item[1])), item) for item in items),
+                          key=lambda costed: costed[0], reverse=True)
+    chunk_cost_target = sum(cost for cost, _ in costed_items) / (CHUNKS_PER_WORKER * workers_count)
+
+    chunks = []
+    chunk = []
+    chunk_cost = 0
+    for cost, item in costed_items:
+        chunk.append(item)
+        chunk_cost += cost
+        if len(chunk) >= chunk_size or chunk_cost >= chunk_cost_target:
+            chunks.append(chunk)
+            chunk = []
+            chunk_cost = 0
+    if chunk:
+        chunks.append(chunk)
+    return chunks
@@ -1,5 +1,12 @@
 from abc import abstractmethod
 import multiprocessing as mp
+import queue
+
+# Sleeping time in seconds between two checks of a shared parameter
+POLL_INTERVAL = 0.01
+
+# Maximum waiting time in seconds for an item of the result queue of a lost process
+SALVAGE_TIMEOUT = 1
 
 
 class ProcessWithIPC(mp.Process):
@@ -10,6 +17,11 @@ class ProcessWithIPC(mp.Process):
     get_result_queue() is the interface for collecting the results from the consumers.
     _shared_parameters is a dictionary for holding the shared values. The values are set via get_shared_parameter() and
     set_shared_parameter().
+    profile_prefix is set by rpn_tracing.Profiler.attach() to profile the run() method, if decorated with
+    rpn_tracing.profiled().
+    The result queue is only written by the spawned process: its' write end is closed in the parent process once the
+    process is started, so reading an item the process could not write entirely raises EOFError instead of blocking
+    forever (see read_result_queue).
     """
 
     @abstractmethod
@@ -22,6 +34,11 @@ class ProcessWithIPC(mp.Process):
         self._shared_parameters = self._manager.dict()
         self._result_list = mp.Queue()
         self._exception_list = mp.Queue()
+        self.profile_prefix = None
+
+    def start(self):
+        super(ProcessWithIPC, self).start()
+        self._result_list._writer.close()
 
     def get_shared_parameter(self, parameter):
         """
@@ -52,4 +69,43 @@ class ProcessWithIPC(mp.Process):
         To be used to return a list of exceptions caught in the run process.
         :return: a list of caught exceptions, if any
         """
-        return self._result_list
+        return self._exception_list
+
+    def drain_result_queue(self):
+        """
+        Pops every item currently available in the result queue.
+        :return: a list of the popped items
+        """
+        return_list = []
+        while self._result_list.qsize() != 0:
+            return_list.append(self._result_list.get())
+        return return_list
+
+    def read_result_queue(self, timeout=None):
+        """
+        Pops the items put into the result queue so far, even if the process died or was terminated. The queue counts
+        an item as soon as it is put, before the feeder thread of the process writes it, so an item might never be
+        written, or only partially written.
+        :param timeout: maximum waiting time in seconds for each item (default = no limit)
+        :return: (list of the popped items, True if all the items put by the process could be popped) tuple
+        """
+        expected_count = self._result_list.qsize()
+        return_list = []
+        while len(return_list) < expected_count:
+            try:
+                return_list.append(self._result_list.get(timeout=timeout))
+            except queue.Empty:
+                break
+            except Exception:
+                # A truncated item might raise EOFError, or about any exception while being unpickled
+                break
+        return return_list, len(return_list) == expected_count
+
+    def salvage_result_queue(self, timeout=SALVAGE_TIMEOUT):
+        """
+        Pops the items left in the result queue by a process which died or was terminated. Must be called once the
+        process is joined (see read_result_queue).
+        :param timeout: maximum waiting time in seconds for each item
+        :return: (list of the popped items, True if all the items put by the process could be popped) tuple
+        """
+        return self.read_result_queue(timeout)
@@ -0,0 +1,85 @@
+import json
+import struct
+
+# Each message is a JSON object, preceded by its' size in bytes as a 4 bytes big endian unsigned integer
+_HEADER = struct.Struct('>I')
+
+# Bigger messages are rejected, so a corrupted header cannot make the receiver allocate gigabytes
+MAX_MESSAGE_SIZE = 256 * 1024 * 1024
+
+# Message types. An agent sends HELLO once connected, and the coordinator replies with CONFIG. The coordinator then
+# sends CHUNK messages, and the agent replies to each of them with a RESULTS message. The coordinator sends DONE when
+# all the lines are processed.
+HELLO = 'hello'
+CONFIG = 'config'
+CHUNK = 'chunk'
+RESULTS = 'results'
+DONE = 'done'
+
+
+class ProtocolError(Exception):
+    """
+    Raised when a peer sends an invalid message, or closes the connection in the middle of a message.
+    """
+    pass
+
+
+def parse_address(address):
+    """
+    :param address: a 'host:port' string. The host might be omitted (':port') to listen on all interfaces.
+    :return: (host, port) tuple
+    """
+    host, separator, port = address.rpartition(':')
+    if not separator or not port.isdecimal():
+        raise ValueError(f"'{address}' is not a valid 'host:port' address.")
+    return host.strip('[]'), int(port)
+
+
+def send_message(connection, message):
+    """
+    :param connection: a connected socket
+    :param message: a dictionary with a 'type' key, and JSON serializable values
+    :return: None
+    """
+    data = json.dumps(message, separators=(',', ':')).encode()
+    connection.sendall(_HEADER.pack(len(data)) + data)
+
+
+def _receive_exactly(connection, size):
+    data = bytearray()
+    while len(data) < size:
+        received = connection.recv(min(size - len(data), 1024 * 1024))
+        if not received:
+            return None if not data else bytes(data)
+        data.extend(received)
+    return bytes(data)
+
+
+def receive_message(connection):
+    """
+    :param connection: a connected socket
+    :return: the received message, or None if the peer closed the connection
+    :raise ProtocolError: if the message is not valid
+    :raise socket.timeout: if the timeout of the socket expires
+    """
+    header = _receive_exactly(connection, _HEADER.size)
+    if header is None:
+        return None
+    if len(header) < _HEADER.size:
+        raise ProtocolError('The connection was closed in the middle of a message.')
+
+    (size,) = _HEADER.unpack(header)
+    if size > MAX_MESSAGE_SIZE:
+        raise ProtocolError(f"The message size {size} exceeds the limit of {MAX_MESSAGE_SIZE} bytes.")
+    data = _receive_exactly(connection, size)
+    if data is None or len(data) < size:
+        raise ProtocolError('The connection was closed in the middle of a message.')
+
+    try:
+        message = json.loads(data)
+    except ValueError as exc:
+        raise ProtocolError(f"The message is not valid JSON. Details: {exc}")
+    if not isinstance(message, dict) or 'type' not in message:
+        raise ProtocolError('The message has no type.')
+    return message
+
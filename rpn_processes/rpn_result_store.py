@@ -0,0 +1,182 @@
+import hashlib
+import multiprocessing as mp
+import os
+import sqlite3
+
+from helpers.operators import OperatorsHelper
+
+# Version of the evaluation rules (infix rendering, result formatting and error messages). It must be increased
+# whenever a change of the evaluator could change the result of a line, so the stored results are not reused anymore.
+EVALUATOR_VERSION = 1
+
+# Approximate storage overhead of a stored result (the key, the row and the index entries) in bytes
+ENTRY_OVERHEAD = 64
+
+# Maximum number of lines looked up with a single query
+_LOOKUP_BATCH_SIZE = 500
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (key BLOB PRIMARY KEY, is_error INTEGER NOT NULL, payload TEXT NOT NULL,
+                                    size INTEGER NOT NULL, last_run INTEGER NOT NULL);
+CREATE INDEX IF NOT EXISTS results_last_run ON results (last_run);
+CREATE TABLE IF NOT EXISTS runs (run_id INTEGER PRIMARY KEY AUTOINCREMENT);
+"""
+
+
+def get_namespace(max_result_bits=None):
+    """
+    :param max_result_bits: the result size limit of the run, which changes the result of some lines
+    :return: a string identifying the evaluator, the operator set and the options the results depend on
+    """
+    operators = ','.join(f"{string}:{OperatorsHelper.get_operator(string).precedence}"
+                         for string in sorted(OperatorsHelper.get_operator_strings()))
+    return f"evaluator={EVALUATOR_VERSION};operators={operators};max_result_bits={max_result_bits}"
+
+
+class ResultStore:
+    """
+    An on-disk (SQLite) store of the results of the evaluated lines, shared by the producer, the consumers and the main
+    thread, so a rerun over an edited input only evaluates the new or modified lines. The results are keyed by the
+    SHA-256 hash of the namespace (see get_namespace) and of the line. The lines are only normalised by stripping the
+    surrounding whitespaces, as the producer does: the error messages quote the line, so two lines which differ
+    otherwise might not have the same result.
+    The result of a valid line is stored as is. The error result of a line is stored as its' details only, and
+    rendered again with the line number of the line in the current run. The errors which depend on the load of the
+    machine (e.g. the CPU time limit) are not stored.
+    Each process opens its' own connection. Every run gets a new run id, and the stored results are tagged with the id
+    of the last run which used them; the results which were used the longest time ago are evicted first.
+    """
+    def __init__(self, path, namespace, max_size):
+        """
+        :param path: path of the SQLite database, created if it does not exist
+        :param namespace: see get_namespace()
+        :param max_size: maximum size of the stored results in bytes, enforced by evict()
+        """
+        self.path = path
+        self.max_size = max_size
+        self._key_prefix = hashlib.sha256(namespace.encode())
+        self._connection = None
+        self._connection_pid = None
+        self._reused_count = mp.RawValue('q', 0)
+        self._computed_count = mp.Value('q', 0)
+
+        connection = self._get_connection()
+        # Must be set before the first table is created, so the evicted pages can be returned to the file system
+        connection.execute('PRAGMA auto_vacuum = INCREMENTAL')
+        connection.execute('PRAGMA journal_mode = WAL')
+        with connection:
+            connection.executescript(_SCHEMA)
+            self.run_id = connection.execute('INSERT INTO runs DEFAULT VALUES').lastrowid
+
+    def _get_connection(self):
+        # A connection must not be shared with the forked processes
+        if self._connection_pid != os.getpid():
+            self._connection = sqlite3.connect(self.path, timeout=60)
+            self._connection.execute('PRAGMA synchronous = NORMAL')
+            self._connection_pid = os.getpid()
+        return self._connection
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_connection'] = None
+        state['_connection_pid'] = None
+        return state
+
+    def get_key(self, line):
+        """
+        :param line: a stripped line
+        :return: the key of the line's result
+        """
+        key_hash = self._key_prefix.copy()
+        key_hash.update(line.encode())
+        return key_hash.digest()
+
+    def lookup(self, lines):
+        """
+        Looks up the stored results of the given lines, and marks them as used by the current run.
+        :param lines: list of stripped lines
+        :return: list of (is_error, payload) tuples in the order of lines, None for the lines without a stored result
+        """
+        keys = [self.get_key(line) for line in lines]
+        stored = {}
+        connection = self._get_connection()
+        with connection:
+            for start in range(0, len(keys), _LOOKUP_BATCH_SIZE):
+                batch_keys = list(set(keys[start:start + _LOOKUP_BATCH_SIZE]))
+                placeholders = ','.join('?' * len(batch_keys))
+                stored.update((row[0], (bool(row[1]), row[2])) for row in connection.execute(
+                    f'SELECT key, is_error, payload FROM results WHERE key IN ({placeholders})', batch_keys))
+            connection.executemany('UPDATE results SET last_run = ? WHERE key = ?',
+                                   ((self.run_id, key) for key in stored))
+
+        entries = [stored.get(key) for key in keys]
+        self._reused_count.value += sum(1 for entry in entries if entry)
+        return entries
+
+    def put(self, entries, computed_count):
+        """
+        Stores the results of evaluated lines.
+        :param entries: list of (line, is_error, payload) tuples, payload being the result string or the error details
+        :param computed_count: number of evaluated lines, including the ones whose results are not stored
+        :return: None
+        """
+        if entries:
+            connection = self._get_connection()
+            with connection:
+                connection.executemany(
+                    'INSERT OR REPLACE INTO results (key, is_error, payload, size, last_run) VALUES (?, ?, ?, ?, ?)',
+                    ((self.get_key(line), int(is_error), payload, len(line) + len(payload) + ENTRY_OVERHEAD,
+                      self.run_id) for line, is_error, payload in entries))
+        with self._computed_count.get_lock():
+            self._computed_count.value += computed_count
+
+    def get_size(self):
+        """
+        :return: size of the stored results in bytes
+        """
+        return self._get_connection().execute('SELECT COALESCE(SUM(size), 0) FROM results').fetchone()[0]
+
+    def evict(self):
+        """
+        Evicts the results used the longest time ago, until the stored results fit into max_size.
+        :return: the number of evicted results
+        """
+        connection = self._get_connection()
+        excess_size = self.get_size() - self.max_size
+        if excess_size <= 0:
+            return 0
+
+        evicted_keys = []
+        cursor = connection.execute('SELECT key, size FROM results ORDER BY last_run, rowid')
+        for key, size in cursor:
+            evicted_keys.append((key,))
+            excess_size -= size
+            if excess_size <= 0:
+                break
+        cursor.close()
+        with connection:
+            connection.executemany('DELETE FROM results WHERE key = ?', evicted_keys)
+        connection.execute('PRAGMA incremental_vacuum')
+        return len(evicted_keys)
+
+    def get_reused_count(self):
+        """
+        :return: number of lines whose stored result was reused by the current run
+        """
+        return self._reused_count.value
+
+    def get_computed_count(self):
+        """
+        :return: number of lines evaluated by the current run
+        """
+        return self._computed_count.value
+
+    def close(self):
+        """
+        Closes the connection of the current process.
+        :return: None
+        """
+        if self._connection and self._connection_pid == os.getpid():
+            self._connection.close()
+        self._connection = None
+        self._connection_pid = None
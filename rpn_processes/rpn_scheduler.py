@@ -0,0 +1,388 @@
+import multiprocessing as mp
+import os
+import pickle
+import queue
+import random
+import struct
+
+# Names of the available schedulers, see create_scheduler()
+SHARED_QUEUE = 'shared'
+WORK_STEALING = 'stealing'
+
+# Default maximum number of chunks dispatched within a batch
+DEFAULT_MAX_CHUNKS = 1024
+
+# Upper bound of the maximum number of chunks dispatched within a batch: the consumer which took each chunk of the batch
+# is recorded in shared memory, in 4 bytes per chunk
+MAX_BATCH_CHUNKS = 2 ** 22
+
+# Maximum waiting time in seconds for the read lock of a chunk queue. The lock is only held while reading a chunk which
+# is already in the queue, so a lock held for longer was left held by a consumer killed meanwhile.
+READ_LOCK_TIMEOUT = 1
+
+# Each chunk is sent with its' sequence number within the batch
+_SEQUENCE = struct.Struct('q')
+
+# States of the chunk queues
+_ACTIVE = 0
+_SPARE = 1
+_RETIRED = 2
+
+# Number of bytes read at once while discarding the content of a retired chunk queue
+_DISCARD_SIZE = 65536
+
+
+class Scheduler:
+    """
+    Hands the chunks of (line_key, line) items put by the producer to the consumers, and tracks their completion.
+    The completion is tracked with plain counters in shared memory instead of a lock per item: the producer adds the
+    number of items of each chunk to produced_count before dispatching it, and each consumer adds the number of items
+    of each processed chunk to its own slot of completed_counts, once their results are in its result queue. All the
+    dispatched items are processed, and their results are available, when the sum of completed_counts reaches
+    produced_count. The last slot of completed_counts is used by the producer, for the items it completes itself
+    (see complete_externally).
+    The chunks are sent through pipes, each with a read lock. Unlike multiprocessing.Queue, a consumer waits for a chunk
+    without holding the read lock; it only holds it to read a chunk which is already in the pipe, and to record its'
+    id in shared memory as the taker of the chunk. A consumer killed while holding the lock leaves the pipe locked: the
+    main thread then retires the pipe, and hands a spare pipe to the consumer slots which used it (see
+    retire_held_queues).
+    The producer keeps the chunks of the current batch, and hands the chunks lost with a consumer to the consumers again
+    when the main thread requests it (see request_recovery), so the chunks are only sent to the consumers.
+    """
+    def __init__(self, workers_count, slots_count, max_chunks=DEFAULT_MAX_CHUNKS):
+        """
+        :param workers_count: number of consumers
+        :param slots_count: number of chunk queues used at once. A spare queue per consumer is created as well.
+        :param max_chunks: maximum number of chunks dispatched within a batch
+        """
+        self.workers_count = workers_count
+        self.max_chunks = min(max_chunks, MAX_BATCH_CHUNKS)
+        self._produced_count = mp.RawValue('q', 0)
+        self._completed_counts = mp.RawArray('q', workers_count + 1)
+        # Id of the consumer which took each chunk of the batch, or 0 if it is queued, by sequence number
+        self._chunk_takers = mp.RawArray('i', self.max_chunks)
+        queues_count = slots_count + workers_count
+        self._pipes = [mp.Pipe(duplex=False) for _ in range(queues_count)]
+        self._read_locks = [mp.Lock() for _ in range(queues_count)]
+        self._queue_states = mp.RawArray('b', [_ACTIVE] * slots_count + [_SPARE] * workers_count)
+        # The chunks put into each queue are only counted by the producer, and the chunks taken from each queue are
+        # only counted under its' read lock
+        self._put_counts = mp.RawArray('q', queues_count)
+        self._taken_counts = mp.RawArray('q', queues_count)
+        self._slot_queues = mp.RawArray('i', range(slots_count))
+        self._recovery_requests = mp.Queue()
+        self._served_count = mp.RawValue('q', 0)
+        # Counted separately by the producer and the main thread (see start_batch)
+        self._batch_index = 0
+        # Only used by the producer: the chunks of the batch, the queue each of them was put into, the recovery
+        # requests of the next batch, and the retired queues which are not read anymore for sure
+        self._chunks = []
+        self._chunk_queues = []
+        self._pending_requests = []
+        self._settled_queues = set()
+        # Only used by the main thread
+        self._requested_count = 0
+
+    def start_batch(self):
+        """
+        Called by the producer when it starts a new batch, once all the chunks of the previous batch are completed and
+        their results collected, and by the main thread right before resuming the producer.
+        :return: None
+        """
+        self._batch_index += 1
+        self._chunks = []
+        self._chunk_queues = []
+
+    def dispatch(self, chunk):
+        """
+        Called by the producer to hand a chunk of items to the consumers.
+        :param chunk: list of (line_key, line) items
+        :return: None
+        """
+        sequence = len(self._chunks)
+        if sequence >= self.max_chunks:
+            raise ValueError(f"More than {self.max_chunks} chunks dispatched within a batch.")
+        self._chunks.append(chunk)
+        self._chunk_queues.append(-1)
+        self._produced_count.value += len(chunk)
+        self._put(sequence, chunk)
+
+    def _put(self, sequence, chunk):
+        queue_index = self._get_target_queue()
+        if self._queue_states[queue_index] != _ACTIVE:
+            raise RuntimeError("All the chunk queues were left locked by killed worker threads.")
+        self._chunk_takers[sequence] = 0
+        self._chunk_queues[sequence] = queue_index
+        self._put_counts[queue_index] += 1
+        # The pipe is written directly, so the chunk is in the pipe once sent
+        self._pipes[queue_index][1].send_bytes(_SEQUENCE.pack(sequence) + pickle.dumps(chunk, pickle.HIGHEST_PROTOCOL))
+
+    def _get_target_queue(self):
+        raise NotImplementedError
+
+    def _get_queued_count(self, queue_index):
+        return self._put_counts[queue_index] - self._taken_counts[queue_index]
+
+    def _take(self, queue_index, consumer_id, timeout):
+        # Waits for a chunk without holding the read lock, then takes it under the lock, unless another consumer took it
+        # meanwhile
+        reader = self._pipes[queue_index][0]
+        read_lock = self._read_locks[queue_index]
+        while self._queue_states[queue_index] == _ACTIVE and reader.poll(timeout):
+            if not read_lock.acquire(timeout=READ_LOCK_TIMEOUT):
+                return None
+            try:
+                if self._queue_states[queue_index] != _ACTIVE or not reader.poll():
+                    continue
+                message = reader.recv_bytes()
+                sequence = _SEQUENCE.unpack_from(message)[0]
+                self._chunk_takers[sequence] = consumer_id
+                self._taken_counts[queue_index] += 1
+            finally:
+                read_lock.release()
+            return sequence, pickle.loads(memoryview(message)[_SEQUENCE.size:])
+        return None
+
+    def fetch(self, worker_index, consumer_id, timeout):
+        """
+        Called by a consumer to get the next chunk to process.
+        :param worker_index: index of the consumer
+        :param consumer_id: id of the consumer, unique within the run, recorded as the taker of the chunk
+        :param timeout: maximum waiting time in seconds
+        :return: a (sequence number, chunk) tuple, or None if there is nothing to process
+        """
+        raise NotImplementedError
+
+    def complete(self, worker_index, chunk):
+        """
+        Called by a consumer once the results of a chunk are in its result queue.
+        :param worker_index: index of the consumer
+        :param chunk: the processed chunk
+        :return: None
+        """
+        self._completed_counts[worker_index] += len(chunk)
+
+    def complete_externally(self, count):
+        """
+        Called by the producer for the dispatched items it completes itself, e.g. with an error result.
+        :param count: number of completed items, negative for the items reported as completed whose results were lost
+        :return: None
+        """
+        self._completed_counts[self.workers_count] += count
+
+    def get_completed_counts(self):
+        """
+        :return: list of the number of items processed by each consumer
+        """
+        return list(self._completed_counts[:self.workers_count])
+
+    def is_drained(self):
+        """
+        :return: True if all the dispatched items are processed, and all the recovery requests are served
+        """
+        return self._served_count.value >= self._requested_count and \
+            sum(self._completed_counts) >= self._produced_count.value
+
+    def retire_held_queues(self):
+        """
+        Called by the main thread once a consumer is dead. A chunk queue whose read lock cannot be acquired within
+        READ_LOCK_TIMEOUT seconds was left locked by the consumer, and cannot be read anymore: it is retired, and the
+        consumer slots using it get a spare queue. The chunks left in a retired queue are handed to the consumers again
+        with the next recovery request (see request_recovery).
+        :return: list of the indexes of the retired queues
+        """
+        retired_queues = []
+        for queue_index in sorted(set(self._slot_queues)):
+            if self._queue_states[queue_index] != _ACTIVE:
+                continue
+            read_lock = self._read_locks[queue_index]
+            if read_lock.acquire(timeout=READ_LOCK_TIMEOUT):
+                read_lock.release()
+                continue
+            self._queue_states[queue_index] = _RETIRED
+            retired_queues.append(queue_index)
+
+        for slot, queue_index in enumerate(self._slot_queues):
+            if self._queue_states[queue_index] == _RETIRED:
+                self._slot_queues[slot] = self._get_replacement_queue(queue_index)
+        return retired_queues
+
+    def _get_replacement_queue(self, queue_index):
+        # A spare queue, or else an active queue used by other slots
+        states = list(self._queue_states)
+        if _SPARE in states:
+            spare_index = states.index(_SPARE)
+            self._queue_states[spare_index] = _ACTIVE
+            return spare_index
+        return next((index for index in self._slot_queues if states[index] == _ACTIVE), queue_index)
+
+    def drain_retired_queues(self):
+        """
+        Called regularly by the main thread, to discard the content of the retired queues. Otherwise, the producer might
+        block forever while writing a chunk into a queue retired meanwhile.
+        :return: None
+        """
+        for queue_index, state in enumerate(self._queue_states):
+            if state != _RETIRED:
+                continue
+            reader = self._pipes[queue_index][0]
+            while reader.poll():
+                os.read(reader.fileno(), _DISCARD_SIZE)
+
+    def request_recovery(self, consumer_id, counted_count, received_sequences, received_count, failed_line=None):
+        """
+        Called by the main thread once a consumer is dead, to have the producer hand the chunks it took to the
+        consumers again, except the chunks whose results were received, along with the chunks left in the retired
+        queues. The scheduler is not drained until the producer serves the request (see serve_recovery_requests).
+        :param consumer_id: id of the dead consumer
+        :param counted_count: number of items the consumer reported as completed within the batch
+        :param received_sequences: set of the sequence numbers of the chunks whose results were received from the
+        consumer within the batch
+        :param received_count: number of results received from the consumer within the batch
+        :param failed_line: None, or a (sequence number, position, failure details) tuple for the line the consumer was
+        processing. The line gets an error result instead of being processed again.
+        :return: None
+        """
+        self._requested_count += 1
+        self._recovery_requests.put((self._batch_index, consumer_id, counted_count, received_sequences, received_count,
+                                     failed_line))
+
+    def serve_recovery_requests(self, fail_line, timeout=0):
+        """
+        Called regularly by the producer, to serve the recovery requests of the main thread (see request_recovery).
+        :param fail_line: callable taking the line_key, the line and the failure details of a failed line, which must
+        put an error result for the line
+        :param timeout: maximum waiting time in seconds for a request
+        :return: None
+        """
+        try:
+            self._pending_requests.append(self._recovery_requests.get(timeout=timeout) if timeout else
+                                          self._recovery_requests.get_nowait())
+            while True:
+                self._pending_requests.append(self._recovery_requests.get_nowait())
+        except queue.Empty:
+            pass
+
+        next_requests = []
+        for request in self._pending_requests:
+            if request[0] > self._batch_index:
+                next_requests.append(request)
+                continue
+            # A request of a previous batch was sent once the results of the batch were collected: nothing was lost
+            if request[0] == self._batch_index:
+                self._recover(request[1:], fail_line)
+            self._served_count.value += 1
+        self._pending_requests = next_requests
+
+    def _settle_retired_queues(self):
+        # A consumer reading a chunk from a queue while it was retired records itself as the taker before releasing the
+        # read lock. Unless the lock was left held by a killed consumer, waiting for it ensures no chunk is in transit.
+        for queue_index, state in enumerate(self._queue_states):
+            if state == _RETIRED and queue_index not in self._settled_queues:
+                if self._read_locks[queue_index].acquire(timeout=READ_LOCK_TIMEOUT):
+                    self._read_locks[queue_index].release()
+                self._settled_queues.add(queue_index)
+
+    def _recover(self, request, fail_line):
+        consumer_id, counted_count, received_sequences, received_count, failed_line = request
+        self._settle_retired_queues()
+        # The items counted as completed by the lost consumer are replaced with the items whose results were received
+        self.complete_externally(received_count - counted_count)
+        for sequence, chunk in enumerate(self._chunks):
+            taker = self._chunk_takers[sequence]
+            if taker == consumer_id:
+                if sequence in received_sequences:
+                    continue
+            elif taker != 0 or self._queue_states[self._chunk_queues[sequence]] != _RETIRED:
+                continue
+
+            if taker and failed_line and failed_line[0] == sequence and failed_line[1] < len(chunk):
+                position = failed_line[1]
+                line_key, line = chunk[position]
+                fail_line(line_key, line, failed_line[2])
+                self.complete_externally(1)
+                chunk = chunk[:position] + chunk[position + 1:]
+            self._chunks[sequence] = chunk
+            if chunk:
+                self._put(sequence, chunk)
+
+    def join(self):
+        """
+        Waits until the underlying queues are flushed.
+        :return: None
+        """
+        pass
+
+
+class SharedQueueScheduler(Scheduler):
+    """
+    All consumers take the chunks from a single shared queue. With a chunk size of 1, this is the original scheduling
+    of the runner.
+    """
+    def __init__(self, workers_count, max_chunks=DEFAULT_MAX_CHUNKS):
+        super(SharedQueueScheduler, self).__init__(workers_count, 1, max_chunks)
+
+    def _get_target_queue(self):
+        return self._slot_queues[0]
+
+    def fetch(self, worker_index, consumer_id, timeout):
+        return self._take(self._slot_queues[0], consumer_id, timeout)
+
+
+class WorkStealingScheduler(Scheduler):
+    """
+    Each consumer has its own local queue, so the consumers do not contend for a single queue lock. The producer puts
+    each chunk into the least loaded local queue. A consumer whose local queue is empty steals a chunk from the local
+    queue of another consumer before waiting on its own queue.
+    """
+    def __init__(self, workers_count, max_chunks=DEFAULT_MAX_CHUNKS):
+        super(WorkStealingScheduler, self).__init__(workers_count, workers_count, max_chunks)
+        self._next_slot = 0
+
+    def _get_target_queue(self):
+        # Round robin, skipping the queues which are more loaded than the least loaded one
+        target_slot = None
+        target_count = None
+        for offset in range(self.workers_count):
+            slot = (self._next_slot + offset) % self.workers_count
+            queue_index = self._slot_queues[slot]
+            if self._queue_states[queue_index] != _ACTIVE:
+                continue
+            queued_count = self._get_queued_count(queue_index)
+            if target_count is None or queued_count < target_count:
+                target_slot, target_count = slot, queued_count
+        if target_slot is None:
+            return self._slot_queues[self._next_slot]
+        self._next_slot = (target_slot + 1) % self.workers_count
+        return self._slot_queues[target_slot]
+
+    def fetch(self, worker_index, consumer_id, timeout):
+        local_index = self._slot_queues[worker_index]
+        taken = self._take(local_index, consumer_id, 0)
+        if taken:
+            return taken
+
+        # Try to steal from the other consumers, starting from a random one so the thieves spread over the victims
+        start = random.randrange(self.workers_count)
+        for offset in range(self.workers_count):
+            victim_index = self._slot_queues[(start + offset) % self.workers_count]
+            if victim_index == local_index:
+                continue
+            taken = self._take(victim_index, consumer_id, 0)
+            if taken:
+                return taken
+
+        return self._take(local_index, consumer_id, timeout)
+
+
+def create_scheduler(name, workers_count, max_chunks=DEFAULT_MAX_CHUNKS):
+    """
+    :param name: SHARED_QUEUE or WORK_STEALING
+    :param workers_count: number of consumers
+    :param max_chunks: maximum number of chunks dispatched within a batch, at most MAX_BATCH_CHUNKS
+    :return: a Scheduler instance
+    """
+    schedulers = {SHARED_QUEUE: SharedQueueScheduler, WORK_STEALING: WorkStealingScheduler}
+    if name not in schedulers:
+        raise ValueError(f"Unknown scheduler '{name}'. Valid values are: {', '.join(schedulers.keys())}.")
+    return schedulers[name](workers_count, max_chunks)
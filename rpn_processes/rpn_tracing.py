@@ -0,0 +1,197 @@
+import cProfile
+import functools
+import glob
+import io
+import json
+import os
+import pstats
+import time
+
+# Number of spans buffered by a process before appending them to its' part file
+_FLUSH_SPANS = 1024
+
+# A line is sampled if the multiplicative hash of its' key falls below the sample rate, so the sampled lines are spread
+# evenly over the input, and every process samples the same lines without any coordination
+_SAMPLING_MULTIPLIER = 2654435761
+_SAMPLING_MODULUS = 2 ** 32
+
+# Number of functions listed in each section of the profile report
+DEFAULT_REPORT_FUNCTIONS = 40
+
+# The profiler of the main thread, if it is running. A process forked meanwhile inherits it, and must stop it before
+# starting its' own profiler (see profiled()).
+_main_profiler = None
+
+
+def _get_part_prefix(path):
+    # The part files of a run are named after the main process and the start time, so they cannot be mistaken with the
+    # part files left over by another run
+    return f"{path}.{os.getpid()}-{time.time_ns()}"
+
+
+class Tracer:
+    """
+    Records structured spans (name, line key, process id, start time, duration and optional attributes) for a sample of
+    the lines. The sampling only depends on the line key, so the producer, the consumers and the main thread record the
+    spans of the same lines, and a line can be followed across the processes.
+    Each process buffers its' spans, and appends them to its' own part file; the main thread merges the part files into
+    a single JSON lines file at the end of the run (see merge()). The spans of a consumer killed by the watchdog are
+    lost.
+    The instrumented code only holds a tracer when tracing is enabled, so disabled tracing costs a single 'is not None'
+    test per line.
+    """
+    def __init__(self, trace_path, sample_rate):
+        """
+        :param trace_path: path of the merged trace file
+        :param sample_rate: fraction of the lines being traced, between 0 (excluded) and 1
+        """
+        self.trace_path = trace_path
+        self.sample_rate = sample_rate
+        self._threshold = int(sample_rate * _SAMPLING_MODULUS)
+        self._part_prefix = _get_part_prefix(trace_path)
+        self._spans = []
+        self._spans_pid = os.getpid()
+
+    def is_sampled(self, line_key):
+        """
+        :param line_key: key of the line, either a line index or a (source_index, line_index) tuple
+        :return: True if the spans of the line are recorded
+        """
+        # The hash of integers and of tuples of integers does not depend on the process
+        return hash(line_key) * _SAMPLING_MULTIPLIER % _SAMPLING_MODULUS < self._threshold
+
+    def record(self, name, line_key, start, duration, **attributes):
+        """
+        :param name: name of the span, e.g. 'consumer.evaluate'
+        :param line_key: key of the line, or None for a span which does not belong to a line
+        :param start: time.time() time at which the span started
+        :param duration: duration of the span in seconds
+        :param attributes: JSON serializable attributes of the span
+        :return: None
+        """
+        if self._spans_pid != os.getpid():
+            # The spans buffered by the parent process were copied into the forked process
+            self._spans = []
+            self._spans_pid = os.getpid()
+        self._spans.append(dict(name=name, line=line_key, pid=self._spans_pid, start=start, duration=duration,
+                                **attributes))
+        if len(self._spans) >= _FLUSH_SPANS:
+            self.flush()
+
+    def flush(self):
+        """
+        Appends the spans buffered by the current process to its' part file.
+        :return: None
+        """
+        if self._spans_pid != os.getpid() or not self._spans:
+            return
+        with open(f"{self._part_prefix}.{self._spans_pid}.part", 'a') as part_file:
+            part_file.writelines(json.dumps(span, separators=(',', ':')) + '\n' for span in self._spans)
+        self._spans = []
+
+    def merge(self):
+        """
+        Merges the part files of all the processes into trace_path, sorted by start time, and removes them. Must be
+        called by the main thread, once the other processes are joined.
+        :return: the number of merged spans
+        """
+        self.flush()
+        spans = []
+        for part_path in glob.glob(glob.escape(self._part_prefix) + '.*.part'):
+            with open(part_path) as part_file:
+                spans.extend(json.loads(line) for line in part_file)
+            os.remove(part_path)
+        spans.sort(key=lambda span: span['start'])
+        with open(self.trace_path, 'w') as trace_file:
+            trace_file.writelines(json.dumps(span, separators=(',', ':')) + '\n' for span in spans)
+        return len(spans)
+
+
+def profiled(run_method):
+    """
+    Decorates the run() method of a ProcessWithIPC: if the profile_prefix attribute of the process is set (see
+    Profiler.attach), the method runs under cProfile, and the profile is saved as '<profile_prefix>.<pid>.prof'.
+    :param run_method: the run() method
+    :return: the decorated method
+    """
+    @functools.wraps(run_method)
+    def run(self):
+        if not self.profile_prefix:
+            return run_method(self)
+        if _main_profiler:
+            _main_profiler.disable()
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            return run_method(self)
+        finally:
+            profiler.disable()
+            profiler.dump_stats(f"{self.profile_prefix}.{os.getpid()}.prof")
+    return run
+
+
+class Profiler:
+    """
+    Profiles the main thread with cProfile, along with the processes attached to it, and merges the profiles of all the
+    processes into a single report (see merge()), so the hot spots can be found under a real multiprocess load.
+    """
+    def __init__(self, report_path):
+        """
+        :param report_path: path of the merged profile, in the pstats format. A text report is written next to it, with
+        a '.txt' suffix.
+        """
+        self.report_path = report_path
+        self._part_prefix = _get_part_prefix(report_path)
+        self._profiler = cProfile.Profile()
+
+    def attach(self, process):
+        """
+        :param process: a ProcessWithIPC whose run() method is decorated with profiled(), not started yet
+        :return: the process
+        """
+        process.profile_prefix = self._part_prefix
+        return process
+
+    def start(self):
+        """
+        Starts profiling the main thread.
+        :return: None
+        """
+        global _main_profiler
+        _main_profiler = self._profiler
+        self._profiler.enable()
+
+    def stop(self):
+        """
+        Stops profiling the main thread, and saves its' profile.
+        :return: None
+        """
+        global _main_profiler
+        _main_profiler = None
+        self._profiler.disable()
+        self._profiler.dump_stats(f"{self._part_prefix}.{os.getpid()}.prof")
+
+    def merge(self, functions_count=DEFAULT_REPORT_FUNCTIONS):
+        """
+        Merges the profiles of all the processes into report_path, writes the text report, and removes the per-process
+        profiles. Must be called once the other processes are joined.
+        :param functions_count: number of functions listed in each section of the text report
+        :return: the number of merged profiles
+        """
+        part_paths = sorted(glob.glob(glob.escape(self._part_prefix) + '.*.prof'))
+        if not part_paths:
+            return 0
+        stats = pstats.Stats(*part_paths)
+        stats.dump_stats(self.report_path)
+
+        report = io.StringIO()
+        report.write(f"Merged profile of {len(part_paths)} process(es).\n")
+        stats.stream = report
+        for sort_key in (pstats.SortKey.TIME, pstats.SortKey.CUMULATIVE):
+            stats.sort_stats(sort_key).print_stats(functions_count)
+        with open(f"{self.report_path}.txt", 'w') as report_file:
+            report_file.write(report.getvalue())
+
+        for part_path in part_paths:
+            os.remove(part_path)
+        return len(part_paths)
@@ -0,0 +1,116 @@
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class ConsumerWatchdog:
+    """
+    Detects the consumers which died, or which are processing a single line for more than line_timeout seconds, and
+    replaces them with new consumers. The results already put by a lost consumer are kept. The line it was processing
+    gets an error result, as it might kill or hang any consumer processing it, and the other chunks it took are handed
+    to the consumers again by the producer, except the ones whose results were read (see
+    rpn_scheduler.Scheduler.request_recovery). The chunk queues the lost consumer left locked are replaced as well.
+    """
+    def __init__(self, scheduler, consumer_factory, line_timeout=None):
+        """
+        :param scheduler: the scheduler shared by the producer and the consumers
+        :param consumer_factory: callable returning a new (not started) consumer for a given worker index
+        :param line_timeout: wall-clock seconds after which a consumer processing a single line is considered hung
+        (default = no limit)
+        """
+        self._scheduler = scheduler
+        self._consumer_factory = consumer_factory
+        self._line_timeout = line_timeout
+
+    def _get_failure(self, consumer, now):
+        line_start_time = consumer.get_line_start_time()
+        if self._line_timeout and line_start_time and now - line_start_time > self._line_timeout:
+            return f"The line was stopped after {self._line_timeout} seconds."
+
+        if not consumer.is_alive():
+            details = f"The worker thread processing the line died with exit code {consumer.exitcode}."
+            if not consumer.get_exception_queue().empty():
+                details += f" Exception: {consumer.get_exception_queue().get()}"
+            return details
+
+        return None
+
+    def _recover(self, consumer, failure):
+        worker_index = consumer.get_worker_index()
+        results, all_salvaged = consumer.salvage_results()
+        if not all_salvaged:
+            logger.warning(f"Some results of the worker thread {worker_index} could not be read. Their chunks are "
+                           f"processed again.")
+
+        retired_queues = self._scheduler.retire_held_queues()
+        if retired_queues:
+            logger.warning(f"The worker thread {worker_index} left the chunk queue(s) {retired_queues} locked. Their' "
+                           f"chunks are dispatched again.")
+
+        # The line being processed gets an error result, unless the consumer was lost between two lines
+        sequence = consumer.get_lease()
+        failed_line = None
+        if sequence is not None and consumer.get_line_start_time():
+            failed_line = (sequence, consumer.get_line_position(), failure)
+        self._scheduler.request_recovery(consumer.get_consumer_id(), *consumer.get_batch_report(), failed_line)
+        return results
+
+    def _replace(self, pool_consumers, position, failure):
+        consumer = pool_consumers[position]
+        logger.warning(f"Replacing the worker thread {consumer.get_worker_index()}. Details: {failure}")
+        if consumer.is_alive():
+            consumer.terminate()
+        consumer.join()
+        results = self._recover(consumer, failure)
+
+        replacement = self._consumer_factory(consumer.get_worker_index())
+        replacement.start()
+        pool_consumers[position] = replacement
+        return results
+
+    def check(self, pool_consumers):
+        """
+        Replaces the dead or hung consumers of the pool. Must be called regularly, as it also discards the content of
+        the retired chunk queues (see rpn_scheduler.Scheduler.drain_retired_queues).
+        :param pool_consumers: the list of consumers, updated in place
+        :return: list of the (line_key, result string) results recovered from the replaced consumers
+        """
+        self._scheduler.drain_retired_queues()
+        recovered_results = []
+        now = time.monotonic()
+        for position, consumer in enumerate(pool_consumers):
+            failure = self._get_failure(consumer, now)
+            if failure:
+                recovered_results.extend(self._replace(pool_consumers, position, failure))
+        return recovered_results
+
+    def collect_results(self, pool_consumers):
+        """
+        Collects the results of the consumers of the pool, once the scheduler is drained. A consumer whose results
+        cannot all be read died meanwhile: it is replaced, and its' chunks are processed again. The other consumers
+        might then put results after their results were collected, so the results must be collected again once the
+        scheduler is drained again.
+        :param pool_consumers: the list of consumers, updated in place
+        :return: (list of the (line_key, result string) results, True if all the results of the batch are collected)
+        tuple
+        """
+        collected_results = []
+        all_collected = True
+        for position, consumer in enumerate(pool_consumers):
+            results, all_read = consumer.get_results()
+            collected_results.extend(results)
+            if not all_read:
+                collected_results.extend(self._replace(pool_consumers, position, "Its' results could not be read."))
+                all_collected = False
+        return collected_results, all_collected
+
+    def start_batch(self, pool_consumers):
+        """
+        Called once the results of a batch are collected, right before resuming the producer.
+        :param pool_consumers: the list of consumers
+        :return: None
+        """
+        self._scheduler.start_batch()
+        for consumer in pool_consumers:
+            consumer.start_batch()
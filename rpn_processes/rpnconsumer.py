@@ -1,92 +1,277 @@
-import inspect
+import itertools
 import logging
+import multiprocessing as mp
 import os
+import signal
 import time
 
 from binary_expression_tree import binary_expression_tree
-from rpn_processes import rpn_process
+from helpers import compiled_input
+from rpn_processes import rpn_budget, rpn_process, rpn_tracing
 
 logger = logging.getLogger(__name__)
 
+# Ids of the consumers, unique within the run, as the consumers are only created by the main thread
+_consumer_ids = itertools.count(1)
+
+
+def get_line_index(line_key):
+    """
+    :param line_key: either a line index, or a (source_index, line_index) tuple for multi-file runs
+    :return: the line index within its input
+    """
+    return line_key[-1] if isinstance(line_key, tuple) else line_key
+
+
+def format_error_result(line_key, postfix, details):
+    """
+    :param line_key: key of the line, see get_line_index()
+    :param postfix: the line content, see compiled_input.get_line_text()
+    :param details: the reason why the line could not be processed
+    :return: the error result string of the line
+    """
+    postfix = compiled_input.get_line_text(postfix)
+    return f"ERROR- Could not parse the input line {get_line_index(line_key)} '{postfix}. Details: {details}"
+
+
+def evaluate_item(expression_tree, item):
+    """
+    Evaluates a line, and renders its' result.
+    :param expression_tree: the ExpressionTree instance evaluating the line
+    :param item: (line_key, line) tuple
+    :return: ((line_key, result string) tuple, the exception raised by the evaluation or None) tuple
+    """
+    line_no, current_postfix = item
+    try:
+        # The lines read from compiled input files are already tokenised
+        if isinstance(current_postfix, bytes):
+            current_result, current_infix = expression_tree.process_compiled(
+                compiled_input.decode_tokens(current_postfix))
+        else:
+            current_result, current_infix = expression_tree.process(current_postfix)
+        return (line_no, f"{current_infix} = {int(current_result)}"), None
+    except Exception as exc:
+        return (line_no, format_error_result(line_no, current_postfix, exc)), exc
+
+
+class LineBudgetExceeded(Exception):
+    """
+    Raised when the evaluation of a line exceeds its CPU time budget.
+    """
+    pass
+
 
 class RpnConsumer(rpn_process.ProcessWithIPC):
     """
-     A single or multiple consumer(s) will pop the (line_no, line) tuple from the queue shared by producer.
-     The popped item will be then evaluated and the results are appended to the result queue.
+     A single or multiple consumer(s) will fetch chunks of (line_no, line) tuples from the scheduler fed by the
+     producer. The fetched items will be then evaluated and the results of each chunk are appended to the result queue.
+     If a budget (see rpn_budget.ByteBudget) is set, the reservation of each line is replaced with the charge of its
+     result.
+     The evaluation of a line can be limited to line_cpu_time_limit seconds of CPU time, and to results of
+     max_result_bits bits; a line exceeding its limits gets an error result.
+     The sequence number of the chunk being processed (the lease), and the position and the start time of the line being
+     processed are shared with the main thread in shared memory, so the line can get an error result if the consumer
+     dies or hangs (see rpn_watchdog.ConsumerWatchdog). The main thread also tracks the chunks whose results it
+     received from the consumer within the batch, so the other chunks the consumer took can be dispatched again (see
+     rpn_scheduler.Scheduler.request_recovery).
+     If a result store (see rpn_result_store.ResultStore) is set, the results of each chunk are stored, except the
+     errors caused by the CPU time limit.
+     If a tracer (see rpn_tracing.Tracer) is set, the evaluation of the sampled lines is recorded as
+     'consumer.evaluate' spans.
     """
-    def __init__(self, producer_queue):
+    def __init__(self, scheduler, worker_index, budget=None, line_cpu_time_limit=None, max_result_bits=None,
+                 result_store=None, tracer=None):
         super(RpnConsumer, self).__init__()
-        self._binary_expression_tree = binary_expression_tree.ExpressionTree()
-        self._producer_queue = producer_queue
+        self._binary_expression_tree = binary_expression_tree.ExpressionTree(max_result_bits=max_result_bits)
+        self._scheduler = scheduler
+        self._worker_index = worker_index
+        self._consumer_id = next(_consumer_ids)
+        self._budget = budget
+        self._line_cpu_time_limit = line_cpu_time_limit
+        self._result_store = result_store
+        self._tracer = tracer
+        self._is_evaluating = False
+        self._line_position = mp.RawValue('q', 0)
+        self._line_start_time = mp.RawValue('d', 0)
+        # Sequence number of the chunk being processed, or -1 if idle
+        self._lease = mp.RawValue('q', -1)
         self.set_shared_parameter('isFinished', False)
-        self.set_shared_parameter('isPaused', False)
-        self.set_shared_parameter('pauseReceived', False)
-        self.__result_list = self.get_result_queue()
+        # Only used by the main thread, see start_batch()
+        self._batch_completed_count = 0
+        self._received_sequences = set()
+        self._received_count = 0
+        self.start_batch()
+
+    def get_worker_index(self):
+        """
+        :return: the index of the consumer in the scheduler
+        """
+        return self._worker_index
 
+    def get_consumer_id(self):
+        """
+        :return: the id of the consumer, unique within the run
+        """
+        return self._consumer_id
+
+    def get_lease(self):
+        """
+        :return: None, or the sequence number of the chunk being processed
+        """
+        sequence = self._lease.value
+        return None if sequence < 0 else sequence
+
+    def get_line_position(self):
+        """
+        :return: the position of the line being processed within the chunk of the lease
+        """
+        return self._line_position.value
+
+    def get_line_start_time(self):
+        """
+        :return: the time.monotonic() time at which the processing of the current line started, or 0 if idle
+        """
+        return self._line_start_time.value
+
+    def _on_cpu_time_limit(self, signum, frame):
+        # The signal might arrive right after the evaluation, before the timer is disarmed
+        if self._is_evaluating:
+            raise LineBudgetExceeded(f"The line exceeded the CPU time limit of {self._line_cpu_time_limit} seconds.")
+
+    def _process_item(self, item):
+        # Returns the (line_no, result string) result, and the exception raised by the evaluation if any
+        try:
+            if self._line_cpu_time_limit:
+                self._is_evaluating = True
+                signal.setitimer(signal.ITIMER_PROF, self._line_cpu_time_limit)
+            # Process the input item and generate the corresponding result
+            return evaluate_item(self._binary_expression_tree, item)
+        finally:
+            if self._line_cpu_time_limit:
+                self._is_evaluating = False
+                signal.setitimer(signal.ITIMER_PROF, 0)
+
+    def _process_chunk(self, chunk):
+        results = []
+        store_entries = []
+        tracer = self._tracer
+        for position, item in enumerate(chunk):
+            self._line_position.value = position
+            self._line_start_time.value = time.monotonic()
+            if tracer is not None and tracer.is_sampled(item[0]):
+                span_start = time.time()
+                span_counter = time.perf_counter()
+                result, exc = self._process_item(item)
+                tracer.record('consumer.evaluate', item[0], span_start, time.perf_counter() - span_counter,
+                              worker=self._worker_index, chunk_size=len(chunk), error=exc is not None)
+            else:
+                result, exc = self._process_item(item)
+            results.append(result)
+            if not self._result_store:
+                continue
+            if exc is None:
+                store_entries.append((compiled_input.get_line_text(item[1]), False, result[1]))
+            elif not isinstance(exc, LineBudgetExceeded):
+                store_entries.append((compiled_input.get_line_text(item[1]), True, str(exc)))
+        self._line_start_time.value = 0
+
+        if self._result_store:
+            self._result_store.put(store_entries, computed_count=len(chunk))
+        return results
+
+    @rpn_tracing.profiled
     def run(self):
         logger.debug(f'Consumer {os.getpid()} started.')
+        # The debug messages of the loop are only formatted if they are logged
+        debug_enabled = logger.isEnabledFor(logging.DEBUG)
+        if self._line_cpu_time_limit:
+            # ITIMER_PROF counts the CPU time of the process, and raises SIGPROF when it expires
+            signal.signal(signal.SIGPROF, self._on_cpu_time_limit)
         try:
             while True:
-                # Check if there is any pause command.
-                if self.get_shared_parameter('pauseReceived'):
-                    # Confirm pausing
-                    self.set_shared_parameter('isPaused', True)
-                    # Wait until pauseReceived is reset
-                    while self.get_shared_parameter('pauseReceived'):
-                        time.sleep(0.1)
-
-                try:
-                    # Pop an item from the queue. Timeout is set to 0.1 second.
-                    item = self._producer_queue.get(timeout=0.1)
-                    logger.debug(f"Consumer {os.getpid()} took item '{item}' from the queue.")
-                except:
-                    # An exception caught. Check if producer is finished?
+                taken = self._scheduler.fetch(self._worker_index, self._consumer_id, timeout=0.1)
+                if taken is None:
+                    # Nothing to process. Check if producer is finished?
                     if self.get_shared_parameter('isFinished'):
                         logger.debug(f"Consumer {os.getpid()} detected finished producer event. Returning.")
-                        self.set_shared_parameter('isPaused', True)
                         return
-                    else:
-                        # _producer_queue couldn't pop any item probably because of empty shared queue
-                        continue
-
-                line_no, current_postfix = item
-                try:
-                    # Process the input item and generate the corresponding result
-                    current_result, current_infix = self._binary_expression_tree.process(current_postfix)
-                    result = (line_no, f"{current_infix} = {int(current_result)}")
-                except Exception as exc:
-                    result = (line_no, f"ERROR- Could not parse the input line {line_no} '{current_postfix}. "
-                                       f"Details: {exc}")
-
-                # This needs to be set after each item pop as we're using joinableQueue.
-                self._producer_queue.task_done()
-                # Put the result in the result queue
-                self._result_list.put(result)
-                logger.debug(f"Consumer {os.getpid()} put result '{result}' to the result list.")
+                    continue
+
+                sequence, chunk = taken
+                self._lease.value = sequence
+                if debug_enabled:
+                    logger.debug(f"Consumer {os.getpid()} took {len(chunk)} item(s) from the scheduler.")
+                results = self._process_chunk(chunk)
+                if self._budget:
+                    self._budget.release(sum(rpn_budget.get_line_reservation(item[1]) for item in chunk))
+                    self._budget.acquire(sum(rpn_budget.get_item_size(result[1]) for result in results))
+
+                # Put the results in the result queue, then report the chunk as completed to the scheduler
+                self._result_list.put((sequence, results))
+                self._scheduler.complete(self._worker_index, chunk)
+                self._lease.value = -1
+                if debug_enabled:
+                    logger.debug(f"Consumer {os.getpid()} put results '{results}' to the result list.")
         except Exception as exc:
             # Any exception caught will be put into the exception queue to be handled by the main thread.
             self.get_exception_queue().put(exc)
+        finally:
+            if self._tracer:
+                self._tracer.flush()
 
         logger.debug(f"Consumer {os.getpid()} finished.")
 
-    def get_results(self):
-        logger.debug(f"{inspect.currentframe().f_code.co_name}()  called.")
-        self.set_shared_parameter('pauseReceived', True)
-        # Wait for pause to be confirmed
-        while not self.get_shared_parameter('isPaused'):
-            time.sleep(0.1)
+    def start_batch(self):
+        """
+        Called by the main thread once the results of a batch are collected, before resuming the producer.
+        :return: None
+        """
+        self._batch_completed_count = self._scheduler.get_completed_counts()[self._worker_index]
+        self._received_sequences = set()
+        self._received_count = 0
 
+    def _receive(self, items):
+        # Flattens the (sequence number, results) items of the result queue, and records them as received
         return_list = []
-        while self._result_list.qsize() != 0:
-            return_list.append(self._result_list.get())
+        for sequence, results in items:
+            self._received_sequences.add(sequence)
+            self._received_count += len(results)
+            return_list.extend(results)
+        return return_list
 
-        # Continue consuming from the shared input queue
-        self.set_shared_parameter('pauseReceived', False)
-        self.set_shared_parameter('isPaused', False)
-        logger.debug(f"Returning results : {return_list}")
+    def get_results(self):
+        """
+        Collects the results put by the consumer so far. As the scheduler reports a chunk as completed only after its
+        results are put into the result queue, all the results are available once the scheduler is drained.
+        :return: (list of (line_no, result string) tuples, True if none of the results put by the consumer was lost)
+        tuple. Results might only be lost if the consumer died meanwhile.
+        """
+        items, all_read = self.read_result_queue()
+        return_list = self._receive(items)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"get_results() returning results : {return_list}")
 
-        return return_list
+        return return_list, all_read
+
+    def salvage_results(self):
+        """
+        Collects the results put by the consumer, once it died or was terminated (see
+        ProcessWithIPC.salvage_result_queue).
+        :return: (list of (line_no, result string) tuples, True if none of the results put by the consumer was lost)
+        tuple
+        """
+        items, all_salvaged = self.salvage_result_queue()
+        return self._receive(items), all_salvaged
+
+    def get_batch_report(self):
+        """
+        Called by the main thread once the consumer is dead.
+        :return: (number of items the consumer reported as completed within the batch, set of the sequence numbers of
+        the chunks whose results were received within the batch, number of results received within the batch) tuple
+        """
+        completed_count = self._scheduler.get_completed_counts()[self._worker_index] - self._batch_completed_count
+        return completed_count, self._received_sequences, self._received_count
 
     def set_finished_flag(self):
-        logger.debug(f"{inspect.currentframe().f_code.co_name}()  called.")
+        logger.debug("set_finished_flag() called.")
         self.set_shared_parameter('isFinished', True)
@@ -1,91 +1,235 @@
-import inspect
 import logging
 import os
 import time
 
-from rpn_processes import rpn_process
+from helpers import compiled_input
+from rpn_processes import rpn_budget, rpn_cost, rpn_process, rpn_tracing
+from rpn_processes.rpnconsumer import format_error_result
 
 logger = logging.getLogger(__name__)
 
 
 class RpnProducer(rpn_process.ProcessWithIPC):
     """
-    Reads the input iterable line by line, and append the line content along with its' line number (as a tuple) to a
-    queue shared with multiple consumers. There is a process_limit_size argument. The producer
+    Reads the input iterable line by line, and dispatches the line content along with its' line number (as a tuple) to
+    the consumers via a scheduler (see rpn_scheduler). The items are dispatched in chunks of chunk_size items, to
+    amortize the inter-process communication. There is a process_limit_size argument. The producer
     has a line counter which is equal number of processed lines. When the line counter reaches the
     process_limit_size, the process would be paused, and waits for calling resume() from the main.
+    If tagged_input is True, the input iterable yields (line_key, line) tuples instead of lines, and line_key is put
+    into the queue instead of the line number. This is used to chain several input files into a single stream. A line
+    that is an exception means the corresponding input could not be read; an error result is then put into the
+    producer's result queue, to be collected by the main thread via get_results().
+    If a budget (see rpn_budget.ByteBudget) is set, every line is charged to the budget before being dispatched. When
+    the budget is exhausted, the producer pauses as if process_limit_size was reached, so the main thread can write out
+    the results, and release their bytes.
+    With the LPT scheduling (see rpn_cost.plan_chunks), the lines are buffered in windows of scheduling_window lines,
+    and the lines of each window are dispatched in decreasing order of their estimated cost. A window is also closed
+    when the producer pauses, as the batch is complete.
+    If a result store (see rpn_result_store.ResultStore) is set, the stored results of the lines of each window are
+    looked up before dispatching the window. The stored results are put into the producer's result queue, and only the
+    other lines are dispatched to the consumers.
+    If a tracer (see rpn_tracing.Tracer) is set, the time each sampled line spends in the window, from being read to
+    being dispatched, is recorded as a 'producer.window' span.
+    The producer keeps the chunks of the current batch, to hand the chunks lost with a consumer to the consumers again
+    (see rpn_scheduler.Scheduler.serve_recovery_requests). So it serves the recovery requests between the windows, while
+    paused, and once finished until stop() is called. A batch is also limited to the maximum number of chunks of the
+    scheduler.
     """
-    def __init__(self, input_iterable, producer_queue, queue_limit, comment_identifier):
+    def __init__(self, input_iterable, scheduler, queue_limit, comment_identifier, tagged_input=False, chunk_size=1,
+                 budget=None, scheduling=rpn_cost.FIFO, scheduling_window=1024, result_store=None, tracer=None):
         super(RpnProducer, self).__init__()
-        self._producer_queue = producer_queue
+        self._scheduler = scheduler
         self.set_shared_parameter('isFinished', False)
         self.set_shared_parameter('isPaused', False)
         self.set_shared_parameter('pauseReceived', False)
         self.set_shared_parameter('continueProducing', True)
         self.set_shared_parameter('queueIsFull', False)
-        self.set_shared_parameter('currentLine', 0)
+        self.set_shared_parameter('isStopped', False)
         self._input_iterable = input_iterable
-        self._queue_limit = queue_limit
+        # Each non-empty line might be dispatched in a chunk of its' own
+        self._queue_limit = min(queue_limit, scheduler.max_chunks)
         self._comment_identifier = comment_identifier
+        self._tagged_input = tagged_input
+        self._chunk_size = chunk_size
+        self._budget = budget
+        self._scheduling = scheduling
+        self._result_store = result_store
+        self._tracer = tracer
+        # The time.time() read times of the sampled lines of the window, by line key
+        self._window_read_times = {}
+        # Set by run(), once the logging of the process is configured
+        self._debug_enabled = False
+        # Number of lines buffered before dispatching them
+        self._window_size = scheduling_window if scheduling == rpn_cost.LPT else chunk_size
 
+    def _reuse_stored_results(self, window):
+        # Puts the stored results of the window's lines into the result queue, and returns the other lines
+        remaining_window = []
+        reused_results = []
+        lines = [compiled_input.get_line_text(item[1]) for item in window]
+        for item, entry in zip(window, self._result_store.lookup(lines)):
+            if not entry:
+                remaining_window.append(item)
+                continue
+            line_key, line = item
+            is_error, payload = entry
+            result = format_error_result(line_key, line, payload) if is_error else payload
+            reused_results.append((line_key, result))
+            if self._budget:
+                self._budget.release(rpn_budget.get_line_reservation(line))
+                self._budget.acquire(rpn_budget.get_item_size(result))
+
+        if reused_results:
+            logger.debug(f"Producer reused the stored results of {len(reused_results)} line(s).")
+            self.get_result_queue().put(reused_results)
+        return remaining_window
+
+    def _dispatch(self, window):
+        window_size = len(window)
+        if window and self._result_store:
+            window = self._reuse_stored_results(window)
+        if self._scheduling == rpn_cost.LPT:
+            chunks = rpn_cost.plan_chunks(window, self._chunk_size, self._scheduler.workers_count)
+        else:
+            chunks = [window] if window else []
+        for chunk in chunks:
+            self._scheduler.dispatch(chunk)
+            if self._debug_enabled:
+                logger.debug(f"Producer dispatched {len(chunk)} item(s) starting from line {chunk[0][0]}.")
+
+        if self._window_read_times:
+            dispatch_time = time.time()
+            for line_key, read_time in self._window_read_times.items():
+                self._tracer.record('producer.window', line_key, read_time, dispatch_time - read_time,
+                                    window_size=window_size)
+            self._window_read_times.clear()
+        self._scheduler.serve_recovery_requests(self._fail_line)
+
+    def _fail_line(self, line_key, line, failure):
+        # Puts the error result of a line which was being processed by a lost consumer
+        error_result = format_error_result(line_key, line, failure)
+        if self._budget:
+            self._budget.release(rpn_budget.get_line_reservation(line))
+            self._budget.acquire(rpn_budget.get_item_size(error_result))
+        self.get_result_queue().put([(line_key, error_result)])
+
+    def _pause_until_resumed(self):
+        # Pauses itself and wait continueProducing signal from the main thread, serving the recovery requests meanwhile.
+        # Returns False if the producer was stopped instead.
+        self.pause()
+        # Confirm pausing
+        self.set_shared_parameter('isPaused', True)
+        self.set_shared_parameter('queueIsFull', True)
+        while not self.get_shared_parameter('continueProducing'):
+            self._scheduler.serve_recovery_requests(self._fail_line, timeout=rpn_process.POLL_INTERVAL)
+        self._scheduler.start_batch()
+        return not self.get_shared_parameter('isStopped')
+
+    @rpn_tracing.profiled
     def run(self) -> None:
         logger.debug(f'Producer {os.getpid()} started.')
+        # The debug messages of the loop are only formatted if they are logged
+        self._debug_enabled = logger.isEnabledFor(logging.DEBUG)
+        tracer = self._tracer
 
         # This is used to detect if a line is a comment
         def is_comment_line(line): return line.startswith(self._comment_identifier)
 
+        # The counters are local to the process; the shared parameters are only accessed when a batch is complete
+        line_number = 0
+        batch_lines_count = 0
+        window = []
         try:
             # Read an item from the input iterable
             for string_item in self._input_iterable:
 
                 # Check if we hit full queue
-                if self.get_shared_parameter('currentLine') >= self._queue_limit:
-                    logger.debug(f'Producer - Hit Full Queue, going to pause the thread')
-                    # Pauses itself and wait continueProducing signal from the main thread
-                    self.pause()
-                    # Confirm pausing
-                    self.set_shared_parameter('isPaused', True)
-                    self.set_shared_parameter('queueIsFull', True)
-                    while not self.get_shared_parameter('continueProducing'):
-                        time.sleep(0.1)
-
-                # Check if there is any pause command arrived?
-                if self.get_shared_parameter('pauseReceived'):
-                    logger.debug(f'Producer - Pause command arrived.')
-                    self.set_shared_parameter('isPaused', True)
-                    while not self.get_shared_parameter('continueProducing'):
-                        time.sleep(0.1)
-
-                self.set_shared_parameter('queueIsFull', False)
-
-                string_item = string_item.strip()
-                current_line = self.get_shared_parameter('currentLine')
+                if batch_lines_count >= self._queue_limit:
+                    self._dispatch(window)
+                    window = []
+                    logger.debug('Producer - Hit Full Queue, going to pause the thread')
+                    if not self._pause_until_resumed():
+                        return
+                    batch_lines_count = 0
+
+                current_line = line_number
+                line_number += 1
+                batch_lines_count += 1
+                line_key = current_line
+                if self._tagged_input:
+                    line_key, string_item = string_item
+                    if isinstance(string_item, Exception):
+                        if self._debug_enabled:
+                            logger.debug(f'Producer failed reading the input {line_key}. Details: {string_item}')
+                        error_result = f"ERROR- Could not read the input. Details: {string_item}"
+                        if self._budget:
+                            self._budget.acquire(rpn_budget.get_item_size(error_result))
+                        self.get_result_queue().put([(line_key, error_result)])
+                        continue
+
+                # The tokenised lines of the compiled input files are token bytes, neither empty nor comments (see
+                # compiled_input.CompiledInputFile)
+                is_tokenised = isinstance(string_item, bytes)
+                if not is_tokenised:
+                    string_item = string_item.strip()
 
                 if not string_item:
-                    logger.debug(f'Producer found an empty line {current_line}. It will be ignored !')
-                elif is_comment_line(string_item):
-                    logger.debug(f'Producer found commented line {current_line}. It will be ignored !')
+                    if self._debug_enabled:
+                        logger.debug(f'Producer found an empty line {line_key}. It will be ignored !')
+                elif not is_tokenised and is_comment_line(string_item):
+                    if self._debug_enabled:
+                        logger.debug(f'Producer found commented line {line_key}. It will be ignored !')
                 else:
-                    # Put the read line into the queue shared by consumers
-                    self._producer_queue.put((current_line, string_item))
-                    logger.debug(f"Producer put one item {current_line} {string_item} to the queue.")
+                    if self._budget and not self._budget.try_acquire(rpn_budget.get_line_reservation(string_item)):
+                        self._dispatch(window)
+                        window = []
+                        logger.debug('Producer - In-flight bytes budget exhausted, going to pause the thread')
+                        if not self._pause_until_resumed():
+                            return
+                        # All the dispatched lines are processed, and their results are written out and released
+                        # now. The line is charged even if it is bigger than the whole budget, so it is processed.
+                        self._budget.acquire(rpn_budget.get_line_reservation(string_item))
+                        batch_lines_count = 1
 
-                self.set_shared_parameter('currentLine', current_line + 1)
+                    # Add the read line to the window to be dispatched to the consumers
+                    window.append((line_key, string_item))
+                    if tracer is not None and tracer.is_sampled(line_key):
+                        self._window_read_times[line_key] = time.time()
+                    if len(window) >= self._window_size:
+                        self._dispatch(window)
+                        window = []
 
+            self._dispatch(window)
             # Signaling finished
             self.set_shared_parameter('isFinished', True)
+            while not self.get_shared_parameter('isStopped'):
+                self._scheduler.serve_recovery_requests(self._fail_line, timeout=rpn_process.POLL_INTERVAL)
         except Exception as exc:
             self.get_exception_queue().put(exc)
+        finally:
+            if tracer:
+                tracer.flush()
 
         logger.debug(f"Producer {os.getpid()} finished.")
 
+    def get_results(self):
+        """
+        Collects the results put by the producer itself: the error results of the inputs which could not be read, the
+        results reused from the result store, and the error results of the lines being processed by lost consumers. As
+        they are put before dispatching the rest of the window, or before serving the recovery request, all of them are
+        available once the producer is paused or finished, and the scheduler is drained.
+        :return: a list of (line_key, result string) tuples
+        """
+        return [result for results in self.drain_result_queue() for result in results]
+
     def reset_line_counter(self):
         """
-        This is used to reset counter to zero after each full queue hit
+        This is used to reset the full queue flag after each full queue hit. It must be called before resume(). The
+        producer resets its' batch line counter itself when it is resumed.
         :return: None
         """
-        logger.debug(f"{inspect.currentframe().f_code.co_name}()  called.")
-        self.set_shared_parameter('currentLine', 0)
+        logger.debug("reset_line_counter() called.")
         self.set_shared_parameter('queueIsFull', False)
 
     def is_finished(self):
@@ -108,7 +252,7 @@ class RpnProducer(rpn_process.ProcessWithIPC):
         Sets the pauseReceived ti True
         :return:
         """
-        logger.debug(f"{inspect.currentframe().f_code.co_name}()  called.")
+        logger.debug("pause() called.")
         self.set_shared_parameter('continueProducing', False)
         self.set_shared_parameter('pauseReceived', True)
 
@@ -117,7 +261,16 @@ class RpnProducer(rpn_process.ProcessWithIPC):
         Continue producing input data.
         :return:
         """
-        logger.debug(f"{inspect.currentframe().f_code.co_name}()  called.")
+        logger.debug("resume() called.")
         self.set_shared_parameter('pauseReceived', False)
         self.set_shared_parameter('isPaused', False)
         self.set_shared_parameter('continueProducing', True)
+
+    def stop(self):
+        """
+        Lets the producer exit, once it is finished or paused: it does not serve the recovery requests anymore.
+        :return: None
+        """
+        logger.debug("stop() called.")
+        self.set_shared_parameter('isStopped', True)
+        self.set_shared_parameter('continueProducing', True)
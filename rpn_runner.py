@@ -1,15 +1,22 @@
+import functools
 import itertools
 import logging
-import multiprocessing as mp
+import os
+import sqlite3
 import sys
 import time
 from collections.abc import Iterable
 
 from customized_parser import customized_parser
-from rpn_processes import rpnproducer, rpnconsumer
+from helpers import batch_output, compiled_input, compressed_input, input_sources, rpn_validator
+from rpn_processes import rpn_agent, rpn_budget, rpn_coordinator, rpn_cost, rpn_process, rpn_protocol, \
+    rpn_result_store, rpn_scheduler, rpn_tracing, rpn_watchdog, rpnproducer, rpnconsumer
 
 logger_name = "RPN_Runner"
 logger = logging.getLogger(logger_name)
+# The statistics reported at the end of a run are kept out of the results, on a logger of their own
+stats_logger_name = "RPN_Runner_Stats"
+stats_logger = logging.getLogger(stats_logger_name)
 
 
 def get_parser():
@@ -20,7 +27,15 @@ def get_parser():
     prn_calc_parser = customized_parser.CustomizedParser(prog='prn_calculator',
                                                          description='Calculates Polish Reverse Notion(PRN) for an '
                                                                      'input file.')
-    prn_calc_parser.add_argument('input_file', help='Input File')
+    prn_calc_parser.add_argument('input_file', nargs='*',
+                                 help='Input file(s). Glob patterns (e.g. "data/*.txt") are expanded.')
+    prn_calc_parser.add_argument('--file_list',
+                                 help="A file containing one input path or glob pattern per line.",
+                                 default=None)
+    prn_calc_parser.add_argument('--output_dir',
+                                 help="Writes the results of each input file into '<output_dir>/<file name>.out' "
+                                      "instead of STDOUT.",
+                                 default=None)
     prn_calc_parser.add_argument('--worker_threads_count',
                                  help="Number of worker threads (default = 2).",
                                  default=2)
@@ -29,6 +44,111 @@ def get_parser():
                                  help="Sets the number of lines processed in batch (default = 10).",
                                  default=10)
 
+    prn_calc_parser.add_argument('--chunk_size',
+                                 help="Number of lines handed to a worker thread at once (default = 64).",
+                                 default=64)
+
+    prn_calc_parser.add_argument('--scheduler',
+                                 help="'stealing': each worker thread has its' own queue, and steals work from the "
+                                      "other queues when it is idle. 'shared': all the worker threads share a single "
+                                      "queue (default = stealing).",
+                                 choices=[rpn_scheduler.WORK_STEALING, rpn_scheduler.SHARED_QUEUE],
+                                 default=rpn_scheduler.WORK_STEALING)
+
+    prn_calc_parser.add_argument('--scheduling',
+                                 help="'lpt': the lines of each scheduling window are dispatched in decreasing order "
+                                      "of their estimated cost (longest processing time first). 'fifo': the lines are "
+                                      "dispatched in the input order (default = lpt).",
+                                 choices=[rpn_cost.LPT, rpn_cost.FIFO],
+                                 default=rpn_cost.LPT)
+
+    prn_calc_parser.add_argument('--scheduling_window',
+                                 help="Number of lines reordered at once by the lpt scheduling (default = 1024).",
+                                 default=1024)
+
+    prn_calc_parser.add_argument('--max_inflight_bytes', '--max_memory',
+                                 help="Caps the size of the lines and results in flight (read by the producer, but not "
+                                      "written out yet), e.g. 512M. The producer is paused when the budget is "
+                                      "exhausted. The peak RSS is reported at the end (default = no limit).",
+                                 default=None)
+
+    prn_calc_parser.add_argument('--line_cpu_time_limit',
+                                 help="Maximum CPU time in seconds for evaluating a single line. Lines exceeding it "
+                                      "get an error result (default = no limit).",
+                                 default=None)
+
+    prn_calc_parser.add_argument('--max_result_bits',
+                                 help="Maximum bit length of the (intermediate) results of a line. Lines exceeding it "
+                                      "get an error result (default = no limit).",
+                                 default=None)
+
+    prn_calc_parser.add_argument('--line_timeout',
+                                 help="Wall-clock seconds after which a worker thread processing a single line is "
+                                      "considered hung, and replaced. The line gets an error result (default = no "
+                                      "limit). Dead worker threads are always replaced.",
+                                 default=None)
+
+    prn_calc_parser.add_argument('--result_store',
+                                 help="Path of an on-disk store of the results, created if it does not exist. The "
+                                      "lines whose results are in the store are not evaluated again, so a rerun over "
+                                      "an edited input only evaluates the new or modified lines (default = no store).",
+                                 default=None)
+
+    prn_calc_parser.add_argument('--result_store_max_size',
+                                 help="Maximum size of the results kept in the result store, e.g. 512M. The results "
+                                      "used the longest time ago are evicted at the end of the run (default = 1G).",
+                                 default='1G')
+
+    prn_calc_parser.add_argument('--coordinator',
+                                 help="Listens on the given 'host:port' address, and hands the lines to the worker "
+                                      "agents connecting to it (see the agent subcommand), instead of evaluating them "
+                                      "locally (default = local evaluation).",
+                                 default=None)
+
+    prn_calc_parser.add_argument('--lease_timeout',
+                                 help="Seconds without any result after which the chunks handed to a worker agent are "
+                                      "handed to the other agents (default = 30).",
+                                 default=30)
+
+    prn_calc_parser.add_argument('--max_retries',
+                                 help="Number of times a chunk lost by a worker agent is handed to the other agents. "
+                                      "The lines of a chunk lost more often get an error result (default = 3).",
+                                 default=3)
+
+    prn_calc_parser.add_argument('--max_pending_chunks',
+                                 help="Maximum number of chunks read by the coordinator, but not written out yet "
+                                      "(default = 64).",
+                                 default=64)
+
+    prn_calc_parser.add_argument('--trace_file',
+                                 help="Records structured spans (see rpn_tracing.Tracer) of a sample of the lines into "
+                                      "the given JSON lines file (default = no tracing).",
+                                 default=None)
+
+    prn_calc_parser.add_argument('--trace_sample_rate',
+                                 help="Fraction of the lines traced into trace_file, between 0 and 1 (default = 0.01).",
+                                 default=0.01)
+
+    prn_calc_parser.add_argument('--profile',
+                                 help="Runs cProfile in the main thread and in each worker thread, and merges the "
+                                      "profiles into profile_file, along with a text report '<profile_file>.txt'.",
+                                 action='store_true')
+
+    prn_calc_parser.add_argument('--profile_file',
+                                 help="The merged profile written with the profile argument (default = "
+                                      "rpn_runner.prof).",
+                                 default='rpn_runner.prof')
+
+    prn_calc_parser.add_argument('--validate',
+                                 help="Only checks the tokens and the stack depth of each line, without evaluating "
+                                      "them, and reports the malformed lines per error class.",
+                                 action='store_true')
+
+    prn_calc_parser.add_argument('--validate_max_reported',
+                                 help="Maximum number of malformed lines reported per input file in validate mode "
+                                      "(default = 10).",
+                                 default=10)
+
     prn_calc_parser.add_argument('-v', '--verbose', help='activates debugging logs', action='store_true')
 
     prn_calc_parser.add_argument('--comment_identifier',
@@ -38,16 +158,57 @@ def get_parser():
     return prn_calc_parser
 
 
-def start_main_thread(input_args, input_iterable):
+def get_compile_parser():
+    """
+    :return: the parser of the compile subcommand
+    """
+    compile_parser = customized_parser.CustomizedParser(prog='prn_calculator compile',
+                                                        description='Compiles a PRN input file into a pre-tokenised '
+                                                                    'binary file, which the runner reads without '
+                                                                    'parsing the lines.')
+    compile_parser.add_argument('input_file', help='Input file, optionally compressed.')
+    compile_parser.add_argument('output_file', help='Compiled file.')
+    compile_parser.add_argument('-v', '--verbose', help='activates debugging logs', action='store_true')
+    compile_parser.add_argument('--comment_identifier',
+                                help="Overrides the default comment identifier (default = pound sign(#)). The comment "
+                                     "lines are skipped when compiling.",
+                                default='#')
+    return compile_parser
+
+
+def get_agent_parser():
+    """
+    :return: the parser of the agent subcommand
+    """
+    agent_parser = customized_parser.CustomizedParser(prog='prn_calculator agent',
+                                                      description='Runs worker agents, evaluating the lines handed by '
+                                                                  'a coordinator (see --coordinator).')
+    agent_parser.add_argument('coordinator', help="'host:port' address of the coordinator.")
+    agent_parser.add_argument('--worker_threads_count',
+                              help="Number of agent processes, each with its' own connection (default = 2).",
+                              default=2)
+    agent_parser.add_argument('--name', help='Name of the agents in the statistics (default = host name).',
+                              default=None)
+    agent_parser.add_argument('--connect_timeout',
+                              help='Maximum waiting time in seconds for the coordinator to be listening '
+                                   '(default = 30).',
+                              default=30)
+    agent_parser.add_argument('-v', '--verbose', help='activates debugging logs', action='store_true')
+    return agent_parser
+
+
+def start_main_thread(input_args, input_iterable, output_writer=None):
     """
     Starts the main thread. The main thread is responsible for dispatching and orchestrating consumer and producers
-    processes. Whenever, process_limit_size is reached by the producer, the main threads waits until all the items in
-    the shared queue are consumed. The main thread will then pause all consumer threads, and collect the processed
-    items from them. The main thread will ,in the end, sort the collected results according to their line number and
+    processes. Whenever, process_limit_size is reached by the producer, the main threads waits until all the items
+    dispatched by the scheduler are processed. The main thread will then collect the processed items from the consumer
+    threads. The main thread will ,in the end, sort the collected results according to their line number and
     print them out to STDOUT.
 
     :param input_args:  Arguments passed from the command line
     :param input_iterable: any iterable containing the input data
+    :param output_writer: if set, the input iterable yields (line_key, line) tuples (see
+    input_sources.iter_tagged_lines), and the results are passed to output_writer.write() instead of being logged.
     :return:
     """
     if not hasattr(input_args, 'process_limit_size') or (int(input_args.process_limit_size) < 1):
@@ -56,9 +217,61 @@ def start_main_thread(input_args, input_iterable):
     if not hasattr(input_args, 'worker_threads_count') or (int(input_args.worker_threads_count) < 1):
         logger.error(f"worker_threads_count argument must be a positive number.")
         sys.exit(-1)
+    if int(getattr(input_args, 'chunk_size', 1)) < 1:
+        logger.error(f"chunk_size argument must be a positive number.")
+        sys.exit(-1)
+    if int(getattr(input_args, 'scheduling_window', 1)) < 1:
+        logger.error(f"scheduling_window argument must be a positive number.")
+        sys.exit(-1)
+
+    budget = None
+    if getattr(input_args, 'max_inflight_bytes', None):
+        try:
+            budget = rpn_budget.ByteBudget(rpn_budget.parse_size(input_args.max_inflight_bytes))
+        except ValueError as exc:
+            logger.error(f"max_inflight_bytes argument must be a size in bytes. Details: {exc}")
+            sys.exit(-1)
+
+    line_limits = {}
+    for name, value_type in [('line_cpu_time_limit', float), ('max_result_bits', int), ('line_timeout', float)]:
+        value = getattr(input_args, name, None)
+        if value is not None:
+            try:
+                line_limits[name] = value_type(value)
+            except ValueError:
+                line_limits[name] = 0
+            if line_limits[name] <= 0:
+                logger.error(f"{name} argument must be a positive number.")
+                sys.exit(-1)
+
+    result_store = None
+    if getattr(input_args, 'result_store', None):
+        try:
+            result_store = rpn_result_store.ResultStore(
+                input_args.result_store, rpn_result_store.get_namespace(line_limits.get('max_result_bits')),
+                rpn_budget.parse_size(getattr(input_args, 'result_store_max_size', '1G')))
+        except ValueError as exc:
+            logger.error(f"result_store_max_size argument must be a size in bytes. Details: {exc}")
+            sys.exit(-1)
+        except sqlite3.Error as exc:
+            logger.error(f"Could not open the result store '{input_args.result_store}'. Details: {exc}")
+            sys.exit(-1)
+
+    tracer = None
+    if getattr(input_args, 'trace_file', None):
+        try:
+            sample_rate = float(getattr(input_args, 'trace_sample_rate', 0.01))
+        except ValueError:
+            sample_rate = 0
+        if not 0 < sample_rate <= 1:
+            logger.error(f"trace_sample_rate argument must be a number between 0 (excluded) and 1.")
+            sys.exit(-1)
+        tracer = rpn_tracing.Tracer(input_args.trace_file, sample_rate)
+    profiler = rpn_tracing.Profiler(input_args.profile_file) if getattr(input_args, 'profile', False) else None
 
     queue_limit = int(input_args.process_limit_size)
     worker_threads = int(input_args.worker_threads_count)
+    chunk_size = int(getattr(input_args, 'chunk_size', 1))
 
     comment_string = input_args.comment_identifier
     logger.debug(f"Number of worker threads is set to {worker_threads}.")
@@ -66,26 +279,50 @@ def start_main_thread(input_args, input_iterable):
     if not isinstance(input_iterable, Iterable):
         raise Exception("input_iterable must be iterable.")
 
-    input_rpn_queue = mp.JoinableQueue()
+    scheduler = rpn_scheduler.create_scheduler(getattr(input_args, 'scheduler', rpn_scheduler.WORK_STEALING),
+                                               worker_threads, max_chunks=queue_limit)
     pool_consumers = []
     producer_process = None
 
+    def create_consumer(worker_index):
+        consumer = rpnconsumer.RpnConsumer(scheduler, worker_index, budget=budget,
+                                           line_cpu_time_limit=line_limits.get('line_cpu_time_limit'),
+                                           max_result_bits=line_limits.get('max_result_bits'),
+                                           result_store=result_store, tracer=tracer)
+        return profiler.attach(consumer) if profiler else consumer
+
+    # Replaces the dead or hung consumers; the results it recovers from them are collected with the next batch
+    watchdog = rpn_watchdog.ConsumerWatchdog(scheduler, create_consumer, line_limits.get('line_timeout'))
+    recovered_results = []
+
     try:
         # Instantiates a RpnProducer and start it. There should be only a single instance of the producer. A single
-        # producer reads the input iterable line by line, and append the line content along with its' line number (as
-        # a tuple) to a queue shared with multiple consumers.
-        producer_process = rpnproducer.RpnProducer(input_iterable, input_rpn_queue, int(queue_limit), comment_string)
+        # producer reads the input iterable line by line, and dispatches chunks of line contents along with their line
+        # numbers (as tuples) to the consumers via the scheduler.
+        producer_process = rpnproducer.RpnProducer(input_iterable, scheduler, int(queue_limit), comment_string,
+                                                   tagged_input=output_writer is not None, chunk_size=chunk_size,
+                                                   budget=budget,
+                                                   scheduling=getattr(input_args, 'scheduling', rpn_cost.FIFO),
+                                                   scheduling_window=int(getattr(input_args, 'scheduling_window', 1)),
+                                                   result_store=result_store, tracer=tracer)
+        if profiler:
+            profiler.attach(producer_process)
         producer_process.start()
 
         # Instantiates a number of worker threads and starts them.
-        # Each will pop the produced tuple from the shared queue. The popped item will be then evaluated
+        # Each will fetch the produced chunks from the scheduler. The fetched items will be then evaluated
         #  and the results are appended to a result queue.
         for i in range(int(worker_threads)):
-            consumer_proc = rpnconsumer.RpnConsumer(input_rpn_queue)
+            consumer_proc = create_consumer(i)
             consumer_proc.start()
             pool_consumers.append(consumer_proc)
 
+        if profiler:
+            profiler.start()
+        # The debug messages of the loop are only formatted if they are logged
+        debug_enabled = logger.isEnabledFor(logging.DEBUG)
         while True:
+            recovered_results.extend(watchdog.check(pool_consumers))
 
             # Check if any exception caught by the producer
             if not producer_process.get_exception_queue().empty():
@@ -99,34 +336,73 @@ def start_main_thread(input_args, input_iterable):
                 logger.error(f"Detected exception(s) in the consumer threads. Details : "
                              f"{consumer_exceptions}")
 
-            # If producer hit full queue or it's finished
-            if producer_process.hit_full_queue() or producer_process.is_finished():
+            # If producer hit full queue or it's finished. is_finished() is checked first and only once: a paused
+            # producer cannot finish, and a finished producer does not dispatch anything anymore.
+            producer_finished = producer_process.is_finished()
+            if producer_finished or producer_process.hit_full_queue():
                 logger.debug("Detected full producer queue or finished producer")
-                # Waiting until all of the items in queue are popped by consumers
-                while not input_rpn_queue.empty():
-                    logger.debug("Waiting for queue items to be processed.")
-                    time.sleep(0.1)
-
-                # Each consumer has its' own result queue. Here, the producer and consumers are already paused.
-                # We collect the results from different worker threads and reorder them according to line numbers
-                collected_results = [consumer.get_results() for consumer in pool_consumers]
-                # Flatten the results. The result is now  a [[res1], [res2], ...]
-                collected_results = [item for sublist in collected_results for item in sublist]
-                logger.debug(f"Collected results = {collected_results}, now sorting the outputs by line number.")
+                wait_start = time.time()
+                wait_counter = time.perf_counter()
+                # Waiting until all of the dispatched items are processed by consumers. Each consumer has its' own
+                # result queue. Here, the producer is paused and the consumers are idle. We collect the results from
+                # different worker threads and reorder them according to line numbers. A consumer lost meanwhile has
+                # its' chunks processed again, so the waiting resumes.
+                collected_results = []
+                while True:
+                    while not scheduler.is_drained():
+                        logger.debug("Waiting for queue items to be processed.")
+                        time.sleep(rpn_process.POLL_INTERVAL)
+                        recovered_results.extend(watchdog.check(pool_consumers))
+                    batch_results, all_collected = watchdog.collect_results(pool_consumers)
+                    collected_results.extend(batch_results)
+                    if all_collected:
+                        break
+                if tracer:
+                    tracer.record('main.batch_wait', None, wait_start, time.perf_counter() - wait_counter)
+                collected_results.extend(recovered_results)
+                recovered_results.clear()
+                # The inputs which could not be read, the results reused from the result store and the lines being
+                # processed by lost consumers are reported by the producer
+                collected_results.extend(producer_process.get_results())
+                if debug_enabled:
+                    logger.debug(f"Collected results = {collected_results}, now sorting the outputs by line number.")
                 iters = sorted(itertools.chain(collected_results), key=lambda results: results[0])
 
-                # If producer is not finished, resets its' line counter to zero and resume putting items into the queue
-                if not producer_process.is_finished():
-                    producer_process.resume()
+                # If producer is not finished, resets its' full queue flag and resume putting items into the queue. It
+                # reads the next batch while the results are written out, unless the budget is set: the producer must
+                # then wait for the results to be written out and released, so the budget is a bound.
+                if not producer_finished and not budget:
+                    watchdog.start_batch(pool_consumers)
                     producer_process.reset_line_counter()
+                    producer_process.resume()
 
                 # printing the sorted results to the output
                 for result in iters:
-                    logger.debug(f'line {result[0]}:')
-                    logger.info(result[1])
+                    if debug_enabled:
+                        logger.debug(f'line {result[0]}:')
+                    if tracer is not None and tracer.is_sampled(result[0]):
+                        span_start = time.time()
+                        span_counter = time.perf_counter()
+                    else:
+                        span_start = None
+                    if output_writer:
+                        output_writer.write(result[0], result[1])
+                    else:
+                        logger.info(result[1])
+                    if span_start is not None:
+                        tracer.record('main.write', result[0], span_start, time.perf_counter() - span_counter)
+                    if budget:
+                        budget.release(rpn_budget.get_item_size(result[1]))
+
+                if not producer_finished and budget:
+                    watchdog.start_batch(pool_consumers)
+                    producer_process.reset_line_counter()
+                    producer_process.resume()
 
-                if producer_process.is_finished():
+                if producer_finished:
                     break
+            else:
+                time.sleep(rpn_process.POLL_INTERVAL)
 
     except KeyboardInterrupt:
         logger.info("Keyboard Interrupt received in the main thread.")
@@ -136,7 +412,11 @@ def start_main_thread(input_args, input_iterable):
     logger.debug("Cleanup ...")
     logger.debug("Waiting for producer process to join.")
     if producer_process:
-        producer_process.join()
+        producer_process.stop()
+        # The producer might be writing a chunk into a retired queue
+        while producer_process.is_alive():
+            scheduler.drain_retired_queues()
+            producer_process.join(rpn_process.POLL_INTERVAL)
 
     logger.debug("Sending finish signal to consumers.")
     for consumer in pool_consumers:
@@ -146,8 +426,188 @@ def start_main_thread(input_args, input_iterable):
     for consumer in pool_consumers:
         consumer.join()
 
-    logger.debug("Waiting for the joinable queue to join.")
-    input_rpn_queue.join()
+    logger.debug("Waiting for the scheduler queues to join.")
+    scheduler.join()
+
+    if tracer:
+        spans_count = tracer.merge()
+        stats_logger.info(f"Traced {spans_count} span(s) into '{tracer.trace_path}'.")
+
+    if profiler:
+        profiler.stop()
+        profiles_count = profiler.merge()
+        stats_logger.info(f"Merged the profiles of {profiles_count} process(es) into '{profiler.report_path}' "
+                          f"(report: '{profiler.report_path}.txt').")
+
+    if result_store:
+        evicted_count = result_store.evict()
+        stats_logger.info(f"Result store: {result_store.get_reused_count()} line(s) reused, "
+                          f"{result_store.get_computed_count()} line(s) evaluated, {evicted_count} result(s) evicted.")
+        result_store.close()
+
+    if budget:
+        peak_rss = rpn_budget.get_peak_rss()
+        stats_logger.info(f"Peak in-flight bytes: {budget.get_peak()} of {budget.limit}. " +
+                          (f"Peak RSS: {peak_rss[0] // 1024} KiB (main), {peak_rss[1] // 1024} KiB (largest child "
+                           f"process)." if peak_rss else "Peak RSS: not available on this platform."))
+
+
+def start_coordinator(input_args, input_iterable, output_writer=None):
+    """
+    Hands the lines to remote worker agents (see rpn_coordinator.Coordinator) instead of evaluating them locally, and
+    prints the results in the input order. The statistics of each agent are then logged by the stats_logger.
+
+    :param input_args:  Arguments passed from the command line
+    :param input_iterable: any iterable containing the input data
+    :param output_writer: see start_main_thread()
+    :return: None
+    """
+    for name in ['max_inflight_bytes', 'line_cpu_time_limit', 'line_timeout', 'result_store', 'trace_file', 'profile']:
+        if getattr(input_args, name, None):
+            logger.error(f"{name} argument is not supported with the coordinator argument.")
+            sys.exit(-1)
+    try:
+        address = rpn_protocol.parse_address(input_args.coordinator)
+        options = {name: int(getattr(input_args, name, default)) for name, default in
+                   [('chunk_size', 64), ('max_pending_chunks', 64), ('max_retries', 3)]}
+        lease_timeout = float(getattr(input_args, 'lease_timeout', 30))
+        max_result_bits = int(input_args.max_result_bits) if getattr(input_args, 'max_result_bits', None) else None
+    except ValueError as exc:
+        logger.error(f"Invalid coordinator argument(s). Details: {exc}")
+        sys.exit(-1)
+    if options['chunk_size'] < 1 or options['max_pending_chunks'] < 1 or options['max_retries'] < 0 or \
+            lease_timeout <= 0:
+        logger.error(f"chunk_size, max_pending_chunks and lease_timeout arguments must be positive numbers, and "
+                     f"max_retries must not be a negative number.")
+        sys.exit(-1)
+
+    def emit(line_key, result):
+        if output_writer:
+            output_writer.write(line_key, result)
+        else:
+            logger.info(result)
+
+    with rpn_coordinator.Coordinator(address, lease_timeout=lease_timeout, max_result_bits=max_result_bits,
+                                     comment_identifier=input_args.comment_identifier,
+                                     tagged_input=output_writer is not None, **options) as coordinator:
+        coordinator.run(input_iterable, emit)
+
+    for stats in coordinator.agent_stats:
+        stats_logger.info(str(stats))
+
+
+def start_agents(input_args):
+    """
+    Runs the worker agents (see rpn_agent.run_agents) until the coordinator has no more lines to process.
+
+    :param input_args:  Arguments passed from the command line of the agent subcommand
+    :return: None
+    """
+    try:
+        address = rpn_protocol.parse_address(input_args.coordinator)
+        agents_count = int(input_args.worker_threads_count)
+        connect_timeout = float(input_args.connect_timeout)
+    except ValueError as exc:
+        logger.error(f"Invalid agent argument(s). Details: {exc}")
+        sys.exit(-1)
+    if agents_count < 1:
+        logger.error(f"worker_threads_count argument must be a positive number.")
+        sys.exit(-1)
+    rpn_agent.run_agents(address, agents_count, name=input_args.name, connect_timeout=connect_timeout)
+
+
+def find_overwritten_input(input_args, input_paths):
+    """
+    Checks that the files written by the runner besides the results (the trace file and the profile) are not inputs.
+    :param input_args: Arguments passed from the command line
+    :param input_paths: list of input file paths
+    :return: the first output path which is also an input path, or None
+    """
+    output_paths = []
+    if getattr(input_args, 'trace_file', None):
+        output_paths.append(input_args.trace_file)
+    if getattr(input_args, 'profile', False):
+        output_paths.extend([input_args.profile_file, f"{input_args.profile_file}.txt"])
+    real_input_paths = {os.path.realpath(path) for path in input_paths}
+    for path in output_paths:
+        if os.path.realpath(path) in real_input_paths:
+            return path
+    return None
+
+
+def open_input(input_args, path):
+    """
+    Opens an input file (see compressed_input.open_input). The comment lines of a compiled input file were skipped
+    while compiling it, so a warning is logged if they were not skipped with the comment_identifier argument.
+
+    :param input_args:  Arguments passed from the command line
+    :param path: input file path
+    :return: an iterable of lines, to be used as a context manager
+    """
+    input_file = compressed_input.open_input(path)
+    if isinstance(input_file, compiled_input.CompiledInputFile) and \
+            input_file.comment_identifier != input_args.comment_identifier:
+        logger.warning(f"The comment lines of the compiled input file '{path}' were skipped with the comment "
+                       f"identifier '{input_file.comment_identifier}', not '{input_args.comment_identifier}'. "
+                       f"Compile it again with --comment_identifier={input_args.comment_identifier} to skip them "
+                       f"identically.")
+    return input_file
+
+
+def start_batch_thread(input_args, input_paths):
+    """
+    Processes several input files with a single producer and a single pool of consumers. The input files are chained
+    into one stream of lines, so the pool is spawned once and stays busy across file boundaries, even for many small
+    files. Results are written per input file and in the input order (see batch_output.BatchOutputWriter). An input
+    that could not be read gets an error result, and does not stop the processing of the other inputs.
+
+    :param input_args:  Arguments passed from the command line
+    :param input_paths: list of input file paths
+    :return: None
+    """
+    output_writer = batch_output.BatchOutputWriter(input_paths, logger, getattr(input_args, 'output_dir', None))
+    try:
+        start = start_coordinator if getattr(input_args, 'coordinator', None) else start_main_thread
+        start(input_args, input_sources.iter_tagged_lines(input_paths, functools.partial(open_input, input_args)),
+              output_writer=output_writer)
+    finally:
+        output_writer.close()
+
+
+def start_validation(input_args, input_paths):
+    """
+    Validates the input files on all cpu cores (see rpn_validator.validate_files), and prints a report per input file.
+
+    :param input_args:  Arguments passed from the command line
+    :param input_paths: list of input file paths
+    :return: True if all the expressions are well-formed, otherwise False
+    """
+    if int(input_args.validate_max_reported) < 0:
+        logger.error(f"validate_max_reported argument must not be a negative number.")
+        sys.exit(-1)
+
+    reports = rpn_validator.validate_files(input_paths, input_args.comment_identifier,
+                                           int(input_args.validate_max_reported))
+    for report in reports:
+        logger.info(f"==> {report.path} <==")
+        for summary_line in report.get_summary_lines():
+            logger.info(summary_line)
+
+    return not any(report.get_errors_count() or report.read_error for report in reports)
+
+
+def start_compile(input_args):
+    """
+    Compiles an input file (see compiled_input.compile_lines).
+
+    :param input_args:  Arguments passed from the command line of the compile subcommand
+    :return: None
+    """
+    with compressed_input.open_input(input_args.input_file) as input_file:
+        lines_count, text_lines_count = compiled_input.compile_lines(input_file, input_args.output_file,
+                                                                     input_args.comment_identifier)
+    logger.info(f"Compiled {lines_count} line(s) into '{input_args.output_file}'. {text_lines_count} of them could not "
+                f"be tokenised, and will be parsed as text.")
 
 
 def prepare_logging(verbose=False):
@@ -161,26 +621,62 @@ def prepare_logging(verbose=False):
 
     # Configuring the root logger
     logging.basicConfig(format=log_format, level=logger_level)
-    logger.propagate = False
-    logger.setLevel(logger_level)
-    handler = logging.StreamHandler()
-    handler.setLevel(logger_level)
-    formatter = logging.Formatter(log_format)
+    for configured_logger in [logger, stats_logger]:
+        configured_logger.propagate = False
+        configured_logger.setLevel(logger_level)
+        handler = logging.StreamHandler()
+        handler.setLevel(logger_level)
+        formatter = logging.Formatter(log_format)
 
-    handler.setFormatter(formatter)
-    logger.addHandler(handler)
+        handler.setFormatter(formatter)
+        configured_logger.addHandler(handler)
 
 
 if __name__ == '__main__':
+    if sys.argv[1:2] == ['compile']:
+        compile_args = get_compile_parser().parse_args(sys.argv[2:])
+        prepare_logging(compile_args.verbose)
+        try:
+            start_compile(compile_args)
+        except (IOError, UnicodeDecodeError) as compile_exc:
+            logger.error(f"Exception caught while compiling '{compile_args.input_file}'. Details: {compile_exc}")
+            sys.exit(-1)
+        sys.exit(0)
+
+    if sys.argv[1:2] == ['agent']:
+        agent_args = get_agent_parser().parse_args(sys.argv[2:])
+        prepare_logging(agent_args.verbose)
+        start_agents(agent_args)
+        sys.exit(0)
+
     parser = get_parser()
     args = parser.parse_args(sys.argv[1:])
     prepare_logging(args.verbose)
 
     try:
-        with open(args.input_file, 'r') as input_file:
-            start_main_thread(args, input_file)
+        paths = input_sources.expand_input_paths(args.input_file, args.file_list)
+    except IOError as os_exc:
+        logger.error(f"Exception caught while opening '{args.file_list}'. Details: {os_exc}")
+        sys.exit(-1)
+
+    if not paths:
+        parser.error("at least one input file is required.")
+
+    overwritten_input = find_overwritten_input(args, paths)
+    if overwritten_input:
+        parser.error(f"'{overwritten_input}' is an input file, it cannot be the trace file or the profile.")
+
+    if args.validate:
+        sys.exit(0 if start_validation(args, paths) else 1)
+
+    try:
+        if len(paths) > 1 or args.file_list or args.output_dir:
+            start_batch_thread(args, paths)
+        else:
+            with open_input(args, paths[0]) as input_file:
+                (start_coordinator if args.coordinator else start_main_thread)(args, input_file)
     except IOError as os_exc:
-        logger.error(f"Exception caught while opening '{args.input_file}'. Details: {os_exc}")
+        logger.error(f"Exception caught while opening '{paths[0]}'. Details: {os_exc}")
         sys.exit(-1)
     except Exception as exc:
         logger.error(f"Exception caught in the main thread. Details: {exc}")
@@ -1,6 +1,18 @@
+import json
+import os
 import random
+import re
 import rpn_runner
+import signal
+import socket
+import tempfile
+import threading
+import time
 import unittest
+from unittest import mock
+
+from helpers import compressed_input
+from rpn_processes import rpn_agent, rpn_protocol, rpnconsumer
 
 
 class TestRpnRunner(unittest.TestCase):
@@ -11,11 +23,11 @@ class TestRpnRunner(unittest.TestCase):
     """
 
     def _execute_runner_assert_logs(self, test_input_list, expected_results_list, workers_count, comment_identifier,
-                                    batch_size):
+                                    batch_size, extra_args=()):
         parser = rpn_runner.get_parser()
         args = parser.parse_args(
             ['dummy_input.txt', f'--worker_threads_count={workers_count}',
-             f'--comment_identifier={comment_identifier}', f'--process_limit_size={batch_size}'])
+             f'--comment_identifier={comment_identifier}', f'--process_limit_size={batch_size}'] + list(extra_args))
         rpn_runner.prepare_logging(verbose=False)
 
         with self.assertLogs(rpn_runner.logger_name, level='INFO') as context_manager:
@@ -58,6 +70,283 @@ class TestRpnRunner(unittest.TestCase):
                                                  comment_identifier=comment_identifier,
                                                  batch_size=batch_size)
 
+    def test_rpn_runner_schedulers(self):
+        test_input_list = ['#CMNT', '2, 3, +, 5, *', '#COMMENT', 'sds', '#CMNT', '10,7,2,3', '10, 7, 2, -, /'] * 20
+        test_expected_results = ['(2 + 3) * 5 = 25', 'ERROR', 'ERROR', '10 / (7 - 2) = 2'] * 20
+        comment_identifier = '#'
+
+        for scheduler, scheduling in [('shared', 'fifo'), ('stealing', 'fifo'), ('shared', 'lpt'), ('stealing', 'lpt')]:
+            for chunk_size in [1, 3, 64]:
+                for threads in [1, 4]:
+                    print(f"Running test_rpn_runner_schedulers with {scheduler} scheduler, {scheduling} scheduling, "
+                          f"chunk size {chunk_size}, {threads} threads.", flush=True)
+                    self._execute_runner_assert_logs(test_input_list=test_input_list,
+                                                     expected_results_list=test_expected_results,
+                                                     workers_count=threads,
+                                                     comment_identifier=comment_identifier,
+                                                     batch_size=50,
+                                                     extra_args=[f'--scheduler={scheduler}',
+                                                                 f'--scheduling={scheduling}',
+                                                                 '--scheduling_window=16',
+                                                                 f'--chunk_size={chunk_size}'])
+
+    def test_rpn_runner_max_inflight_bytes(self):
+        test_input_list = ['2, 3, +, 5, *', 'sds', '1' + ', 1, +' * 300, '10, 7, 2, -, /'] * 25
+        test_expected_results = ['(2 + 3) * 5 = 25', 'ERROR', '1 + 1' + ' + 1' * 299 + ' = 301',
+                                 '10 / (7 - 2) = 2'] * 25
+
+        for budget in ['1', '2K', '64K']:
+            print(f"Running test_rpn_runner_max_inflight_bytes with a budget of {budget}.", flush=True)
+            args = rpn_runner.get_parser().parse_args(['dummy_input.txt', '--worker_threads_count=3',
+                                                       '--process_limit_size=1000', '--chunk_size=4',
+                                                       f'--max_inflight_bytes={budget}'])
+            rpn_runner.prepare_logging(verbose=False)
+
+            with self.assertLogs(rpn_runner.logger_name, level='INFO') as context_manager, \
+                    self.assertLogs(rpn_runner.stats_logger_name, level='INFO') as stats_context_manager:
+                rpn_runner.start_main_thread(input_args=args, input_iterable=test_input_list)
+            # The statistics are not in the results
+            self.assertEqual(len(test_expected_results), len(context_manager.output))
+            for idx in range(len(test_expected_results)):
+                self.assertIn(test_expected_results[idx], context_manager.output[idx])
+            self.assertEqual(1, len(stats_context_manager.output))
+            self.assertIn('Peak in-flight bytes', stats_context_manager.output[0])
+            if budget == '64K':
+                # The lines are smaller than the budget, so it is never exceeded
+                peak, limit = re.search(r'Peak in-flight bytes: (\d+) of (\d+)',
+                                        stats_context_manager.output[0]).groups()
+                self.assertLessEqual(int(peak), int(limit))
+
+    def test_rpn_runner_line_limits(self):
+        test_input_list = ['2, 3, +, 5, *', '9' * 50 + (', ' + '9' * 50) * 30 + ', *' * 30, '10, 7, 2, -, /']
+        test_expected_results = ['(2 + 3) * 5 = 25', 'exceeds the limit of 1000 bits', '10 / (7 - 2) = 2']
+
+        for threads in [1, 3]:
+            print(f"Running test_rpn_runner_line_limits with {threads} threads.", flush=True)
+            self._execute_runner_assert_logs(test_input_list=test_input_list,
+                                             expected_results_list=test_expected_results,
+                                             workers_count=threads,
+                                             comment_identifier='#',
+                                             batch_size=2,
+                                             extra_args=['--max_result_bits=1000', '--line_cpu_time_limit=10',
+                                                         '--line_timeout=60'])
+
+    def test_rpn_runner_line_cpu_time_limit(self):
+        # A chain of multiplications of 1000 digits numbers, taking more than a second of CPU time
+        heavy_line = ', '.join(['9' * 1000] * 500) + ', *' * 499
+        test_input_list = ['2, 3, +, 5, *', heavy_line, '10, 7, 2, -, /', 'sds', '1, 1, +'] * 2
+        test_expected_results = ['(2 + 3) * 5 = 25', 'exceeded the CPU time limit of 0.2 seconds', '10 / (7 - 2) = 2',
+                                 'ERROR', '1 + 1 = 2'] * 2
+
+        for threads in [1, 2]:
+            print(f"Running test_rpn_runner_line_cpu_time_limit with {threads} threads.", flush=True)
+            self._execute_runner_assert_logs(test_input_list=test_input_list,
+                                             expected_results_list=test_expected_results,
+                                             workers_count=threads,
+                                             comment_identifier='#',
+                                             batch_size=5,
+                                             extra_args=['--line_cpu_time_limit=0.2', '--chunk_size=2'])
+
+    def test_rpn_runner_killed_consumers(self):
+        # Distinct results, so a line which is lost or processed twice is noticed
+        lines_count = 20000
+        test_input_list = [f"{line_no}, 1, +" for line_no in range(lines_count)]
+        original_start = rpnconsumer.RpnConsumer.start
+
+        for scheduler in ['stealing', 'shared']:
+            print(f"Running test_rpn_runner_killed_consumers with {scheduler} scheduler.", flush=True)
+            started_consumers = []
+            killed_pids = []
+
+            def start(consumer):
+                original_start(consumer)
+                started_consumers.append(consumer)
+
+            def kill_consumers():
+                # SIGKILLs a consumer while it processes a chunk, then any other consumer once it is replaced
+                while len(killed_pids) < 2 and time.monotonic() < deadline:
+                    for consumer in list(started_consumers):
+                        if consumer.pid not in killed_pids and (killed_pids or consumer.get_lease() is not None) \
+                                and len(started_consumers) > len(killed_pids) + 2:
+                            os.kill(consumer.pid, signal.SIGKILL)
+                            killed_pids.append(consumer.pid)
+                            break
+                    time.sleep(0.005)
+
+            parser = rpn_runner.get_parser()
+            args = parser.parse_args(['dummy_input.txt', '--worker_threads_count=3', '--process_limit_size=5000',
+                                      '--chunk_size=50', f'--scheduler={scheduler}'])
+            rpn_runner.prepare_logging(verbose=False)
+            deadline = time.monotonic() + 60
+            killer = threading.Thread(target=kill_consumers)
+            with mock.patch.object(rpnconsumer.RpnConsumer, 'start', start), \
+                    self.assertLogs('rpn_processes.rpn_watchdog', level='WARNING') as watchdog_context_manager, \
+                    self.assertLogs(rpn_runner.logger_name, level='INFO') as context_manager:
+                killer.start()
+                rpn_runner.start_main_thread(input_args=args, input_iterable=test_input_list)
+                killer.join()
+
+            self.assertEqual(2, len(killed_pids))
+            self.assertEqual(2, sum('Replacing the worker thread' in output
+                                    for output in watchdog_context_manager.output))
+            self.assertEqual(lines_count, len(context_manager.output))
+            failed_lines = 0
+            for line_no, output in enumerate(context_manager.output):
+                if 'died with exit code -9' in output:
+                    self.assertIn(f"line {line_no} '", output)
+                    failed_lines += 1
+                else:
+                    self.assertIn(f"{line_no} + 1 = {line_no + 1}", output)
+            self.assertLessEqual(failed_lines, 2)
+
+    def test_rpn_runner_result_store(self):
+        test_input_list = ['#CMNT', '2, 3, +, 5, *', 'sds', '10, 7, 2, -, /', '2, 3, +, 5, *'] * 10
+        edited_input_list = ['1, 1, +'] + test_input_list[1:-1] + ['sds']
+        test_expected_results = ['(2 + 3) * 5 = 25', 'ERROR', '10 / (7 - 2) = 2', '(2 + 3) * 5 = 25'] * 10
+
+        with tempfile.TemporaryDirectory() as store_dir:
+            outputs = []
+            # The first run also reuses the results of the lines repeated in the next batches
+            for input_list, reused_count in [(test_input_list, None), (test_input_list, 40), (edited_input_list, 40)]:
+                print(f"Running test_rpn_runner_result_store, expecting {reused_count} reused lines.", flush=True)
+                args = rpn_runner.get_parser().parse_args(['dummy_input.txt', '--worker_threads_count=2',
+                                                           '--process_limit_size=8', '--chunk_size=3',
+                                                           f"--result_store={os.path.join(store_dir, 'results.db')}"])
+                rpn_runner.prepare_logging(verbose=False)
+
+                with self.assertLogs(rpn_runner.logger_name, level='INFO') as context_manager, \
+                        self.assertLogs(rpn_runner.stats_logger_name, level='INFO') as stats_context_manager:
+                    rpn_runner.start_main_thread(input_args=args, input_iterable=input_list)
+                self.assertIn('Result store: ' if reused_count is None else f"Result store: {reused_count} line(s) "
+                              f"reused", stats_context_manager.output[-1])
+                outputs.append(context_manager.output)
+
+            # Reused results are identical to the evaluated ones, including the line number of the error results
+            self.assertEqual(outputs[0], outputs[1])
+            self.assertEqual(len(test_expected_results), len(outputs[0]))
+            for idx in range(len(test_expected_results)):
+                self.assertIn(test_expected_results[idx], outputs[0][idx])
+            self.assertEqual(['INFO:RPN_Runner:1 + 1 = 2'] + outputs[0][:-1] + [outputs[0][1].replace(' 2 ', ' 49 ')],
+                             outputs[2])
+
+    def test_rpn_runner_tracing_and_profile(self):
+        test_input_list = ['#CMNT', '2, 3, +, 5, *', 'sds', '10, 7, 2, -, /'] * 25
+        test_expected_results = ['(2 + 3) * 5 = 25', 'ERROR', '10 / (7 - 2) = 2'] * 25
+
+        with tempfile.TemporaryDirectory() as output_dir:
+            trace_path = os.path.join(output_dir, 'trace.jsonl')
+            profile_path = os.path.join(output_dir, 'runner.prof')
+            print(f"Running test_rpn_runner_tracing_and_profile with 2 threads.", flush=True)
+            args = rpn_runner.get_parser().parse_args(['dummy_input.txt', '--worker_threads_count=2',
+                                                       '--process_limit_size=30', '--chunk_size=4',
+                                                       f"--trace_file={trace_path}", '--trace_sample_rate=1',
+                                                       '--profile', f"--profile_file={profile_path}"])
+            rpn_runner.prepare_logging(verbose=False)
+
+            with self.assertLogs(rpn_runner.logger_name, level='INFO') as context_manager, \
+                    self.assertLogs(rpn_runner.stats_logger_name, level='INFO') as stats_context_manager:
+                rpn_runner.start_main_thread(input_args=args, input_iterable=test_input_list)
+            self.assertEqual(len(test_expected_results), len(context_manager.output))
+            for idx in range(len(test_expected_results)):
+                self.assertIn(test_expected_results[idx], context_manager.output[idx])
+            self.assertEqual(2, len(stats_context_manager.output))
+            self.assertIn(f"Traced {len(test_expected_results) * 3 + 4} span(s)", stats_context_manager.output[0])
+            # The main thread, the producer and the two consumers
+            self.assertIn('Merged the profiles of 4 process(es)', stats_context_manager.output[1])
+
+            with open(trace_path) as trace_file:
+                spans = [json.loads(line) for line in trace_file]
+            for name in ['producer.window', 'consumer.evaluate', 'main.write']:
+                self.assertEqual(sorted(line_number for line_number in range(100) if line_number % 4),
+                                 sorted(span['line'] for span in spans if span['name'] == name))
+            self.assertEqual(4, len([span for span in spans if span['name'] == 'main.batch_wait']))
+            with open(f"{profile_path}.txt") as report_file:
+                self.assertIn('_construct_from_postfix', report_file.read())
+            self.assertEqual(['runner.prof', 'runner.prof.txt', 'trace.jsonl'], sorted(os.listdir(output_dir)))
+
+    def test_rpn_runner_profile_arguments(self):
+        # The input paths following --profile are not taken as the profile file
+        args = rpn_runner.get_parser().parse_args(['--profile', 'a.txt', 'b.txt'])
+        self.assertEqual(['a.txt', 'b.txt'], args.input_file)
+        self.assertIsNone(rpn_runner.find_overwritten_input(args, args.input_file))
+
+        for extra_args in [['--profile', '--profile_file=b.txt'], ['--profile', '--profile_file=a'],
+                           ['--trace_file=./a.txt']]:
+            args = rpn_runner.get_parser().parse_args(['a.txt', 'b.txt'] + extra_args)
+            self.assertIsNotNone(rpn_runner.find_overwritten_input(args, args.input_file))
+        args = rpn_runner.get_parser().parse_args(['a.txt', '--profile_file=a.txt'])
+        self.assertIsNone(rpn_runner.find_overwritten_input(args, args.input_file))
+
+    def test_rpn_runner_compiled_input(self):
+        test_input_list = ['#CMNT', '2, 3, +, 5, *', '', 'sds', '10,7,2,3', ' 10, 7, 2, -, / ', '007, 1, +', '5, 0, /',
+                           '99999999999999999999, 2, *', '1, 2, 3, -, -', '#CMNT'] * 10
+
+        with tempfile.TemporaryDirectory() as input_dir:
+            text_path = os.path.join(input_dir, 'input.txt')
+            compiled_path = os.path.join(input_dir, 'input.rpnc')
+            with open(text_path, 'w') as input_file:
+                input_file.write('\n'.join(test_input_list))
+            compile_args = rpn_runner.get_compile_parser().parse_args([text_path, compiled_path])
+            rpn_runner.prepare_logging(verbose=False)
+            with self.assertLogs(rpn_runner.logger_name, level='INFO'):
+                rpn_runner.start_compile(compile_args)
+
+            # The tokenised lines are rendered as text for the LPT scheduling, the budget and the result store; the
+            # second run with the result store reuses the stored results
+            store_args = ['--scheduling=lpt', '--max_inflight_bytes=2K', f'--result_store={input_dir}/results.db']
+            outputs = []
+            for path, extra_args in [(text_path, []), (compiled_path, []), (compiled_path, store_args),
+                                     (compiled_path, store_args)]:
+                for threads in [1, 3]:
+                    print(f"Running test_rpn_runner_compiled_input on {path} {extra_args} with {threads} threads.",
+                          flush=True)
+                    args = rpn_runner.get_parser().parse_args([path, f'--worker_threads_count={threads}',
+                                                               '--process_limit_size=7', '--chunk_size=2'] +
+                                                              extra_args)
+                    with self.assertLogs(rpn_runner.logger_name, level='INFO') as context_manager, \
+                            compressed_input.open_input(path) as input_file:
+                        rpn_runner.start_main_thread(input_args=args, input_iterable=input_file)
+                    outputs.append(context_manager.output)
+
+            self.assertEqual(80, len(outputs[0]))
+            for output in outputs[1:]:
+                self.assertEqual(outputs[0], output)
+
+            # The compiled file was compiled with the default comment identifier
+            args = rpn_runner.get_parser().parse_args([compiled_path, '--comment_identifier=;'])
+            with self.assertLogs(rpn_runner.logger_name, level='WARNING') as context_manager:
+                rpn_runner.open_input(args, compiled_path).close()
+            self.assertIn("skipped with the comment identifier '#', not ';'", context_manager.output[0])
+
+    def test_rpn_runner_coordinator(self):
+        test_input_list = ['#CMNT', '2, 3, +, 5, *', '#COMMENT', 'sds', '#CMNT', '10,7,2,3', '10, 7, 2, -, /'] * 20
+        test_expected_results = ['(2 + 3) * 5 = 25', 'ERROR', 'ERROR', '10 / (7 - 2) = 2'] * 20
+
+        for agents_count in [1, 3]:
+            print(f"Running test_rpn_runner_coordinator with {agents_count} worker agent(s).", flush=True)
+            # Picks a free port for the coordinator; the agents retry until it is listening
+            with socket.socket() as free_socket:
+                free_socket.bind(('127.0.0.1', 0))
+                address = f"127.0.0.1:{free_socket.getsockname()[1]}"
+            agents_thread = threading.Thread(target=rpn_agent.run_agents,
+                                             args=(rpn_protocol.parse_address(address), agents_count))
+            agents_thread.start()
+
+            args = rpn_runner.get_parser().parse_args(['dummy_input.txt', f'--coordinator={address}', '--chunk_size=5',
+                                                       '--max_pending_chunks=4'])
+            rpn_runner.prepare_logging(verbose=False)
+            with self.assertLogs(rpn_runner.logger_name, level='INFO') as context_manager, \
+                    self.assertLogs(rpn_runner.stats_logger_name, level='INFO') as stats_context_manager:
+                rpn_runner.start_coordinator(input_args=args, input_iterable=test_input_list)
+            agents_thread.join()
+
+            self.assertEqual(len(test_expected_results), len(context_manager.output))
+            for idx in range(len(test_expected_results)):
+                self.assertIn(test_expected_results[idx], context_manager.output[idx])
+            self.assertEqual(agents_count, len(stats_context_manager.output))
+            for output in stats_context_manager.output:
+                self.assertIn('Worker agent', output)
+
     def test_rpn_runner_1000lines(self):
         test_sample_list = [
             ('#CMNT', None),
@@ -89,6 +378,35 @@ class TestRpnRunner(unittest.TestCase):
                                                  comment_identifier=comment_identifier,
                                                  batch_size=batch_size)
 
+    def test_rpn_runner_multi_file(self):
+        test_files = [('a.txt', ['#CMNT', '2, 3, +, 5, *', 'sds']), ('b.txt', ['10, 7, 2, -, /']),
+                      ('c.txt', ['#CMNT'])]
+        test_expected_results = ['==> ', '(2 + 3) * 5 = 25', 'ERROR', '==> ', '10 / (7 - 2) = 2', '==> ', '==> ',
+                                 'ERROR- Could not read the input']
+
+        with tempfile.TemporaryDirectory() as input_dir:
+            input_paths = []
+            for name, lines in test_files:
+                input_paths.append(os.path.join(input_dir, name))
+                with open(input_paths[-1], 'w') as input_file:
+                    input_file.write('\n'.join(lines))
+            input_paths.append(os.path.join(input_dir, 'missing.txt'))
+
+            for threads in [1, 3]:
+                for batch_size in [1, 2, 100]:
+                    print(f"Running test_rpn_runner_multi_file with {threads} threads. Batch Size = {batch_size}",
+                          flush=True)
+                    parser = rpn_runner.get_parser()
+                    args = parser.parse_args(input_paths + [f'--worker_threads_count={threads}',
+                                                            f'--process_limit_size={batch_size}'])
+                    rpn_runner.prepare_logging(verbose=False)
+
+                    with self.assertLogs(rpn_runner.logger_name, level='INFO') as context_manager:
+                        rpn_runner.start_batch_thread(input_args=args, input_paths=args.input_file)
+                    self.assertEqual(len(test_expected_results), len(context_manager.output))
+                    for idx in range(len(test_expected_results)):
+                        self.assertIn(test_expected_results[idx], context_manager.output[idx])
+
 
 if __name__ == '__main__':
     unittest.main()
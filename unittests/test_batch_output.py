@@ -0,0 +1,44 @@
+import logging
+import os
+import tempfile
+import unittest
+
+from helpers.batch_output import BatchOutputWriter
+
+
+class TestBatchOutputWriter(unittest.TestCase):
+    """
+    Unit tests for BatchOutputWriter class
+    """
+    def setUp(self):
+        self._logger = logging.getLogger('TestBatchOutputWriter')
+
+    def test_sections_written_to_logger(self):
+        writer = BatchOutputWriter(['a.txt', 'b.txt', 'c.txt', 'd.txt'], self._logger)
+        with self.assertLogs(self._logger, level='INFO') as context_manager:
+            writer.write((0, 0), 'res0')
+            writer.write((0, 3), 'res1')
+            writer.write((2, 1), 'res2')
+            writer.close()
+
+        self.assertEqual(['==> a.txt <==', 'res0', 'res1', '==> b.txt <==', '==> c.txt <==', 'res2', '==> d.txt <=='],
+                         [record.getMessage() for record in context_manager.records])
+
+    def test_output_files(self):
+        with tempfile.TemporaryDirectory() as output_dir:
+            writer = BatchOutputWriter(['x/data.txt', 'empty.txt', 'y/data.txt'], self._logger, output_dir=output_dir)
+            writer.write((0, 0), 'res0')
+            writer.write((2, 5), 'res1')
+            writer.close()
+
+            self.assertEqual(['data.txt.2.out', 'data.txt.out', 'empty.txt.out'], sorted(os.listdir(output_dir)))
+            with open(writer.get_output_path(0)) as output_file:
+                self.assertEqual('res0\n', output_file.read())
+            with open(writer.get_output_path(1)) as output_file:
+                self.assertEqual('', output_file.read())
+            with open(writer.get_output_path(2)) as output_file:
+                self.assertEqual('res1\n', output_file.read())
+
+
+if __name__ == '__main__':
+    unittest.main()
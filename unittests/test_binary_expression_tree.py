@@ -48,6 +48,14 @@ class TestExpressionTree(unittest.TestCase):
         exp_tree = ExpressionTreeClass()
         self.assertRaises(ValueError, exp_tree._construct_from_postfix, postorder_expression)
 
+    def test_max_result_bits(self):
+        exp_tree = ExpressionTreeClass(max_result_bits=9)
+        self.assertEqual((400, '200 * 2'), exp_tree.process('200, 2, *'))
+        self.assertEqual((5.0, '10 / 2'), exp_tree.process('10, 2, /'))
+        self.assertRaises(ValueError, exp_tree.process, '200, 3, *')
+        self.assertRaises(ValueError, exp_tree.process, '500, 20, +')
+        self.assertRaises(ValueError, exp_tree.process, '2' + ', 300, *' * 100)
+
 
 if __name__ == '__main__':
     unittest.main()
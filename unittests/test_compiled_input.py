@@ -0,0 +1,94 @@
+import os
+import tempfile
+import unittest
+
+from binary_expression_tree.binary_expression_tree import ExpressionTree
+from helpers import compiled_input, compressed_input
+
+
+class TestCompiledInput(unittest.TestCase):
+    """
+    Unit tests for compiled_input helpers
+    """
+    _LINES = ['2, 3, +, 5, *', '#CMNT', '', '  10,7,2,-,/  ', '007, 1, +', 'sds', '5, 0, +', '5, 0, /', '1, +',
+              '99999999999999999999, 2, *', '2, 3, 4, *, -', '1, 2, 3, -, -', '6, 3, /, 2, /', '3, 4, -, 2, *',
+              '0', '1, 2, 3', '1,, 2, +', '9223372036854775807, 1, +', '#', '1, 2, %']
+
+    def setUp(self):
+        self._temp_dir = tempfile.TemporaryDirectory()
+        self._path = os.path.join(self._temp_dir.name, 'input.rpnc')
+
+    def tearDown(self):
+        self._temp_dir.cleanup()
+
+    def _read_lines(self):
+        with compiled_input.CompiledInputFile(self._path) as input_file:
+            return list(input_file)
+
+    def test_round_trip(self):
+        self.assertEqual((17, 5), compiled_input.compile_lines(self._LINES + ['#TRAILING'], self._path))
+        self.assertTrue(compiled_input.is_compiled_file(self._path))
+
+        lines = self._read_lines()
+        # The skipped lines are read as empty lines; trailing skipped lines are not read
+        self.assertEqual([line.strip() if not line.startswith('#') else '' for line in self._LINES],
+                         [compiled_input.get_line_text(line) for line in lines])
+        # The tokenised lines are stored without their text: an operand lower than 112 or an operator takes a byte
+        self.assertEqual(b'\x12\x13\x0f\x15\x0d', lines[0])
+        self.assertEqual([2, 3, -1, 5, -3], compiled_input.decode_tokens(lines[0]))
+        self.assertIsInstance(lines[9], bytes)
+        self.assertEqual(99999999999999999999, compiled_input.decode_tokens(lines[9])[0])
+        # Invalid or non-canonical operands, and other delimiters, are kept as text
+        for line_number in [3, 4, 5, 16, 19]:
+            self.assertIsInstance(lines[line_number], str)
+
+    def test_process_compiled(self):
+        compiled_input.compile_lines(self._LINES, self._path)
+
+        for line in self._read_lines():
+            if not isinstance(line, bytes):
+                continue
+            tokens = compiled_input.decode_tokens(line)
+            try:
+                expected_result = ExpressionTree().process(compiled_input.render_tokens(tokens))
+            except Exception as exc:
+                with self.assertRaises(type(exc), msg=line) as context_manager:
+                    ExpressionTree().process_compiled(tokens)
+                self.assertEqual(str(exc), str(context_manager.exception))
+                continue
+            self.assertEqual(expected_result, ExpressionTree().process_compiled(tokens))
+
+    def test_tokens(self):
+        for tokens in [[0], [111, 112, -1], [2 ** 7, 2 ** 63, 10 ** 30, -4, -2], []]:
+            self.assertEqual(tokens, compiled_input.decode_tokens(compiled_input.encode_tokens(tokens)))
+        self.assertEqual(3, len(compiled_input.encode_tokens([111, 112, -1])[1:]))
+        self.assertEqual('128, 9223372036854775808, /, -', compiled_input.render_tokens([2 ** 7, 2 ** 63, -4, -2]))
+        self.assertEqual('1, 2, +', compiled_input.get_line_text(compiled_input.encode_tokens([1, 2, -1])))
+        self.assertEqual('1,2,+', compiled_input.get_line_text('1,2,+'))
+
+    def test_long_lines(self):
+        # Lines longer than 127 bytes, or preceded by more than 63 skipped lines, take several bytes per varint
+        lines = [''] * 100 + [', '.join(['1'] * 100 + ['+'] * 99), 'x' * 300]
+        compiled_input.compile_lines(lines, self._path)
+        self.assertEqual(lines, [compiled_input.get_line_text(line) for line in self._read_lines()])
+
+    def test_open_input(self):
+        compiled_input.compile_lines(['#CMNT', '1, 2, +'], self._path)
+        with compressed_input.open_input(self._path) as input_file:
+            self.assertEqual(['', b'\x11\x12\x0f'], list(input_file))
+
+        compiled_input.compile_lines([], self._path)
+        self.assertEqual([], self._read_lines())
+
+    def test_invalid_file(self):
+        with open(self._path, 'wb') as output_file:
+            output_file.write(b'RPNC')
+        self.assertRaises(ValueError, compiled_input.CompiledInputFile, self._path)
+
+        with open(self._path, 'w') as output_file:
+            output_file.write('1, 2, +')
+        self.assertFalse(compiled_input.is_compiled_file(self._path))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+import bz2
+import gzip
+import lzma
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from helpers import compressed_input
+
+
+class TestCompressedInput(unittest.TestCase):
+    """
+    Unit tests for compressed_input helpers
+    """
+    _LINES = [f"{idx}, {idx % 7}, +, 5, *\n" if idx % 10 else '#CMNT\n' for idx in range(5000)]
+
+    def setUp(self):
+        self._temp_dir = tempfile.TemporaryDirectory()
+        self._data = ''.join(self._LINES).encode()
+
+    def tearDown(self):
+        self._temp_dir.cleanup()
+
+    def _write(self, name, content):
+        path = os.path.join(self._temp_dir.name, name)
+        with open(path, 'wb') as output_file:
+            output_file.write(content)
+        return path
+
+    def _multi_member(self, compress, members_count):
+        step = len(self._data) // members_count + 1
+        return b''.join(compress(self._data[idx:idx + step]) for idx in range(0, len(self._data), step))
+
+    def test_detect_compression(self):
+        self.assertEqual('gzip', compressed_input.detect_compression(self._write('a', gzip.compress(self._data))))
+        self.assertEqual('bz2', compressed_input.detect_compression(self._write('b', bz2.compress(self._data))))
+        self.assertEqual('xz', compressed_input.detect_compression(self._write('c', lzma.compress(self._data))))
+        self.assertIsNone(compressed_input.detect_compression(self._write('d', self._data)))
+        self.assertIsNone(compressed_input.detect_compression(self._write('e', b'')))
+        self.assertEqual('bz2', compressed_input.detect_compression(self._write('f', bz2.compress(b''))))
+        # A text file starting like a bzip2 stream
+        self.assertIsNone(compressed_input.detect_compression(self._write('g', b'BZh9, 1, +\n')))
+
+    def test_open_input_lines_are_identical(self):
+        test_contents = [gzip.compress(self._data), self._multi_member(gzip.compress, 13), bz2.compress(self._data),
+                         self._multi_member(bz2.compress, 4), lzma.compress(self._data), self._data]
+
+        for idx, content in enumerate(test_contents):
+            path = self._write(f"input_{idx}", content)
+            for workers in [1, 4]:
+                with compressed_input.open_input(path, workers=workers) as input_file:
+                    self.assertEqual(self._LINES, list(input_file))
+
+    def test_open_input_falls_back_on_header_like_data(self):
+        # A stored (not compressed) member contains the gzip member header as is, which looks like a member boundary
+        data = b'first\n' + b'\x1f\x8b\x08' * 3 + b'\nlast\n'
+        path = self._write('header_like', gzip.compress(data, compresslevel=0) + gzip.compress(b'next\n'))
+
+        with compressed_input.open_input(path, workers=4) as input_file:
+            self.assertEqual(data + b'next\n', input_file.buffer.read())
+
+    def test_open_input_bounds_decompressed_members(self):
+        # The 64 KiB of the second member compress to a few hundred bytes only
+        data = b'1, 2, +\n' * 8192
+        members = [self._data[:1000], data, self._data[1000:2000], self._data[2000:]]
+        for compress in [gzip.compress, bz2.compress]:
+            path = self._write('bomb', b''.join(compress(member) for member in members))
+            with mock.patch.object(compressed_input, 'PARALLEL_MAX_MEMBER_OUTPUT', 16 * 1024), \
+                    self.assertLogs(compressed_input.logger, level='DEBUG') as context_manager, \
+                    compressed_input.open_input(path, workers=4) as input_file:
+                self.assertEqual(b''.join(members), input_file.buffer.read())
+            self.assertIn(f"sequentially from offset {len(compress(members[0]))}.", context_manager.output[-1])
+
+        # The number of members in flight does not depend on the number of threads
+        with compressed_input.open_input(path, workers=64) as input_file:
+            max_pending = compressed_input.PARALLEL_MAX_INFLIGHT_BYTES // compressed_input.PARALLEL_MAX_MEMBER_OUTPUT
+            self.assertEqual(max_pending, input_file.buffer.raw._max_pending)
+
+    def test_open_input_truncated_file_raises(self):
+        path = self._write('truncated', self._multi_member(gzip.compress, 3)[:-1])
+        with compressed_input.open_input(path, workers=4) as input_file:
+            self.assertRaises(EOFError, input_file.read)
+
+
+if __name__ == '__main__':
+    unittest.main()
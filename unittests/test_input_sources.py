@@ -0,0 +1,49 @@
+import os
+import tempfile
+import unittest
+
+from helpers import input_sources
+
+
+class TestInputSources(unittest.TestCase):
+    """
+    Unit tests for the input_sources helpers
+    """
+    def setUp(self):
+        self._temp_dir = tempfile.TemporaryDirectory()
+        self._dir = self._temp_dir.name
+        for name, content in [('b.txt', '10, 7, 2, -, /\n'), ('a.txt', '2, 3, +\n#CMNT\n5, 5, *\n'), ('c.rpn', '')]:
+            with open(os.path.join(self._dir, name), 'w') as input_file:
+                input_file.write(content)
+
+    def tearDown(self):
+        self._temp_dir.cleanup()
+
+    def test_expand_input_paths_sorts_glob_matches(self):
+        paths = input_sources.expand_input_paths([os.path.join(self._dir, '*.txt')])
+        self.assertEqual([os.path.join(self._dir, 'a.txt'), os.path.join(self._dir, 'b.txt')], paths)
+
+    def test_expand_input_paths_keeps_unmatched_patterns(self):
+        pattern = os.path.join(self._dir, '*.csv')
+        self.assertEqual([pattern], input_sources.expand_input_paths([pattern]))
+
+    def test_expand_input_paths_with_file_list(self):
+        file_list_path = os.path.join(self._dir, 'inputs.lst')
+        with open(file_list_path, 'w') as file_list:
+            file_list.write(f"# Comment\n{os.path.join(self._dir, 'c.rpn')}\n\n{os.path.join(self._dir, 'b*')}\n")
+
+        paths = input_sources.expand_input_paths([os.path.join(self._dir, 'a.txt')], file_list_path)
+        self.assertEqual([os.path.join(self._dir, name) for name in ['a.txt', 'c.rpn', 'b.txt']], paths)
+
+    def test_iter_tagged_lines(self):
+        paths = [os.path.join(self._dir, name) for name in ['a.txt', 'missing.txt', 'b.txt']]
+        tagged_lines = list(input_sources.iter_tagged_lines(paths))
+
+        self.assertEqual([(0, 0), (0, 1), (0, 2), (1, 0), (2, 0)], [line_key for line_key, _ in tagged_lines])
+        self.assertEqual('#CMNT\n', tagged_lines[1][1])
+        self.assertIsInstance(tagged_lines[3][1], IOError)
+        self.assertEqual('10, 7, 2, -, /\n', tagged_lines[4][1])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,42 @@
+import unittest
+
+from rpn_processes import rpn_budget
+
+
+class TestRpnBudget(unittest.TestCase):
+    """
+    Unit tests for rpn_budget
+    """
+    def test_parse_size(self):
+        self.assertEqual(100, rpn_budget.parse_size('100'))
+        self.assertEqual(2048, rpn_budget.parse_size('2k'))
+        self.assertEqual(512 * 1024 ** 2, rpn_budget.parse_size('512MB'))
+        self.assertEqual(1024 ** 3, rpn_budget.parse_size(' 1G '))
+        self.assertRaises(ValueError, rpn_budget.parse_size, '1.5G')
+        self.assertRaises(ValueError, rpn_budget.parse_size, '-1')
+
+    def test_byte_budget(self):
+        budget = rpn_budget.ByteBudget(100)
+        self.assertTrue(budget.try_acquire(60))
+        self.assertFalse(budget.try_acquire(50))
+        self.assertTrue(budget.try_acquire(40))
+        self.assertEqual(100, budget.get_used())
+
+        budget.acquire(10)
+        self.assertEqual(110, budget.get_peak())
+        budget.release(110)
+        self.assertEqual(0, budget.get_used())
+
+        # An item bigger than the whole budget is accepted when nothing else is in flight
+        self.assertTrue(budget.try_acquire(500))
+        self.assertFalse(budget.try_acquire(1))
+        self.assertEqual(500, budget.get_peak())
+
+    def test_get_peak_rss(self):
+        peak_rss = rpn_budget.get_peak_rss()
+        if peak_rss is not None:
+            self.assertGreater(peak_rss[0], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,77 @@
+import socket
+import threading
+import time
+import unittest
+
+from binary_expression_tree.binary_expression_tree import ExpressionTree
+from rpn_processes import rpn_agent, rpn_protocol
+from rpn_processes.rpn_coordinator import Coordinator
+from rpn_processes.rpnconsumer import evaluate_item
+
+
+class TestCoordinator(unittest.TestCase):
+    """
+    Unit tests for Coordinator, with worker agents running in threads on localhost
+    """
+    _LINES = ['#CMNT', '2, 3, +, 5, *', '', 'sds', '10,7,2,3', '10, 7, 2, -, /', '1, 2, 3, -, -'] * 30
+
+    def _get_expected_results(self):
+        return [evaluate_item(ExpressionTree(), (line_number, line.strip()))[0]
+                for line_number, line in enumerate(self._LINES) if line and not line.startswith('#')]
+
+    def _run(self, coordinator, agents):
+        results = []
+        threads = [threading.Thread(target=agent, args=(coordinator.address,)) for agent in agents]
+        for thread in threads:
+            thread.start()
+        coordinator.run(self._LINES, lambda line_key, result: results.append((line_key, result)))
+        for thread in threads:
+            thread.join(timeout=10)
+        return results
+
+    @staticmethod
+    def _lost_agent(address):
+        # Leases a chunk, and disconnects without processing it
+        with socket.create_connection(address) as connection:
+            rpn_protocol.send_message(connection, {'type': rpn_protocol.HELLO, 'name': 'lost', 'prefetch': 1})
+            rpn_protocol.receive_message(connection)
+            rpn_protocol.receive_message(connection)
+
+    def test_parse_address(self):
+        self.assertEqual(('127.0.0.1', 8000), rpn_protocol.parse_address('127.0.0.1:8000'))
+        self.assertEqual(('', 8000), rpn_protocol.parse_address(':8000'))
+        self.assertEqual(('::1', 8000), rpn_protocol.parse_address('[::1]:8000'))
+        self.assertRaises(ValueError, rpn_protocol.parse_address, 'localhost')
+
+    def test_several_agents(self):
+        with Coordinator(('127.0.0.1', 0), chunk_size=4, max_pending_chunks=3) as coordinator:
+            results = self._run(coordinator, [lambda address, index=index:
+                                              rpn_agent.run_agent(address, f"agent-{index}") for index in range(3)])
+
+        self.assertEqual(self._get_expected_results(), results)
+        self.assertEqual(3, len(coordinator.agent_stats))
+        self.assertEqual(len(results), sum(stats.lines_count for stats in coordinator.agent_stats))
+        self.assertTrue(all(stats.lost_chunks_count == 0 for stats in coordinator.agent_stats))
+
+    def test_lost_agent(self):
+        def late_agent(address):
+            # Connects once the lost agent has leased a chunk
+            time.sleep(0.2)
+            rpn_agent.run_agent(address)
+
+        with Coordinator(('127.0.0.1', 0), chunk_size=4) as coordinator:
+            results = self._run(coordinator, [self._lost_agent, late_agent])
+
+        self.assertEqual(self._get_expected_results(), results)
+        self.assertEqual([1], [stats.lost_chunks_count for stats in coordinator.agent_stats if stats.name == 'lost'])
+
+    def test_max_retries(self):
+        with Coordinator(('127.0.0.1', 0), chunk_size=200, max_retries=1) as coordinator:
+            results = self._run(coordinator, [self._lost_agent, self._lost_agent])
+
+        self.assertEqual(len(self._get_expected_results()), len(results))
+        self.assertTrue(all('The chunk was lost by 2 worker agent(s)' in result for _, result in results))
+
+
+if __name__ == '__main__':
+    unittest.main()
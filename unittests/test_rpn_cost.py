@@ -0,0 +1,36 @@
+import unittest
+
+from rpn_processes import rpn_cost
+
+
+class TestRpnCost(unittest.TestCase):
+    """
+    Unit tests for rpn_cost
+    """
+    def test_estimate_line_cost(self):
+        short_cost = rpn_cost.estimate_line_cost('2, 3, +')
+        self.assertGreater(rpn_cost.estimate_line_cost('2, 3, +, 4, *'), short_cost)
+        # Same length and token count, but bigger operands
+        self.assertGreater(rpn_cost.estimate_line_cost('99999, 99999, *'), rpn_cost.estimate_line_cost('1, 2, +, 3, -'))
+        self.assertGreater(rpn_cost.estimate_line_cost('9' * 1000 + ', 2, *'),
+                           10 * rpn_cost.estimate_line_cost('9' * 100 + ', 2, *'))
+
+    def test_plan_chunks(self):
+        heavy_line = '9' * 1000 + ', 9' * 10 + ', *' * 10
+        items = [(index, '1, 2, +') for index in range(10)] + [(10, heavy_line), (11, '3, 4, *')]
+        chunks = rpn_cost.plan_chunks(items, chunk_size=4, workers_count=2)
+
+        # The heavy line is dispatched first, in a chunk of its' own
+        self.assertEqual([(10, heavy_line)], chunks[0])
+        self.assertTrue(all(len(chunk) <= 4 for chunk in chunks))
+        self.assertEqual(sorted(items), sorted(item for chunk in chunks for item in chunk))
+
+    def test_plan_chunks_keeps_order_of_equal_costs(self):
+        items = [(index, '1, 2, +') for index in range(5)]
+        chunks = rpn_cost.plan_chunks(items, chunk_size=5, workers_count=1)
+        self.assertEqual(items, [item for chunk in chunks for item in chunk])
+        self.assertEqual([], rpn_cost.plan_chunks([], chunk_size=5, workers_count=1))
+
+
+if __name__ == '__main__':
+    unittest.main()
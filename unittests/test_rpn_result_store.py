@@ -0,0 +1,68 @@
+import os
+import tempfile
+import unittest
+
+from rpn_processes import rpn_result_store
+
+
+class TestResultStore(unittest.TestCase):
+    """
+    Unit tests for rpn_result_store
+    """
+    def setUp(self):
+        self._store_dir = tempfile.TemporaryDirectory()
+        self._store_path = os.path.join(self._store_dir.name, 'results.db')
+
+    def tearDown(self):
+        self._store_dir.cleanup()
+
+    def _open_store(self, namespace=rpn_result_store.get_namespace(), max_size=1024 ** 2):
+        store = rpn_result_store.ResultStore(self._store_path, namespace, max_size)
+        self.addCleanup(store.close)
+        return store
+
+    def test_get_namespace(self):
+        self.assertNotEqual(rpn_result_store.get_namespace(), rpn_result_store.get_namespace(max_result_bits=64))
+        self.assertIn(f"evaluator={rpn_result_store.EVALUATOR_VERSION}", rpn_result_store.get_namespace())
+
+    def test_lookup_and_put(self):
+        store = self._open_store()
+        self.assertEqual([None, None], store.lookup(['1, 2, +', 'sds']))
+        store.put([('1, 2, +', False, '1 + 2 = 3'), ('sds', True, 'Invalid operand')], computed_count=3)
+
+        self.assertEqual([(False, '1 + 2 = 3'), (True, 'Invalid operand'), None, (False, '1 + 2 = 3')],
+                         store.lookup(['1, 2, +', 'sds', '2, 1, +', '1, 2, +']))
+        self.assertEqual(3, store.get_reused_count())
+        self.assertEqual(3, store.get_computed_count())
+
+    def test_results_persist_across_runs(self):
+        first_store = self._open_store()
+        first_store.put([('1, 2, +', False, '1 + 2 = 3')], computed_count=1)
+        first_store.close()
+
+        second_store = self._open_store()
+        self.assertGreater(second_store.run_id, first_store.run_id)
+        self.assertEqual([(False, '1 + 2 = 3')], second_store.lookup(['1, 2, +']))
+
+        # Another namespace does not see the results
+        other_store = self._open_store(namespace=rpn_result_store.get_namespace(max_result_bits=64))
+        self.assertEqual([None], other_store.lookup(['1, 2, +']))
+
+    def test_evict(self):
+        entry_size = len('1, 2, +') + len('1 + 2 = 3') + rpn_result_store.ENTRY_OVERHEAD
+        first_store = self._open_store(max_size=2 * entry_size)
+        first_store.put([('1, 2, +', False, '1 + 2 = 3'), ('2, 1, +', False, '2 + 1 = 3')], computed_count=2)
+        self.assertEqual(0, first_store.evict())
+
+        # The first line is used again by the second run, so the second line is evicted first
+        second_store = self._open_store(max_size=2 * entry_size)
+        second_store.lookup(['1, 2, +'])
+        second_store.put([('1, 1, +', False, '1 + 1 = 2')], computed_count=1)
+        self.assertEqual(1, second_store.evict())
+        self.assertEqual([(False, '1 + 2 = 3'), None, (False, '1 + 1 = 2')],
+                         second_store.lookup(['1, 2, +', '2, 1, +', '1, 1, +']))
+        self.assertLessEqual(second_store.get_size(), 2 * entry_size)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,138 @@
+import multiprocessing as mp
+import os
+import signal
+import time
+import unittest
+
+from rpn_processes import rpn_scheduler
+
+
+def hold_read_lock(read_lock):
+    # Stands for a consumer killed while reading a chunk
+    read_lock.acquire()
+    os.kill(os.getpid(), signal.SIGKILL)
+
+
+class TestRpnScheduler(unittest.TestCase):
+    """
+    Unit tests for the schedulers
+    """
+    @staticmethod
+    def _fetch(scheduler, worker_index, consumer_id=1):
+        deadline = time.time() + 5
+        taken = None
+        while taken is None and time.time() < deadline:
+            taken = scheduler.fetch(worker_index, consumer_id, timeout=0.1)
+        return taken
+
+    def test_create_scheduler(self):
+        self.assertIsInstance(rpn_scheduler.create_scheduler(rpn_scheduler.SHARED_QUEUE, 2),
+                              rpn_scheduler.SharedQueueScheduler)
+        self.assertIsInstance(rpn_scheduler.create_scheduler(rpn_scheduler.WORK_STEALING, 2),
+                              rpn_scheduler.WorkStealingScheduler)
+        self.assertRaises(ValueError, rpn_scheduler.create_scheduler, 'dummy', 2)
+
+    def test_completion_tracking(self):
+        for name in [rpn_scheduler.SHARED_QUEUE, rpn_scheduler.WORK_STEALING]:
+            scheduler = rpn_scheduler.create_scheduler(name, 2)
+            self.assertTrue(scheduler.is_drained())
+            scheduler.dispatch([(0, '1'), (1, '2')])
+            scheduler.dispatch([(2, '3')])
+            self.assertFalse(scheduler.is_drained())
+
+            taken_chunks = [self._fetch(scheduler, 0), self._fetch(scheduler, 1)]
+            self.assertEqual([(0, [(0, '1'), (1, '2')]), (1, [(2, '3')])], sorted(taken_chunks))
+            chunks = [chunk for _, chunk in taken_chunks]
+            scheduler.complete(0, chunks[0])
+            self.assertFalse(scheduler.is_drained())
+            scheduler.complete(1, chunks[1])
+            self.assertTrue(scheduler.is_drained())
+            self.assertEqual([len(chunks[0]), len(chunks[1])], scheduler.get_completed_counts())
+            scheduler.join()
+
+    def test_max_chunks(self):
+        scheduler = rpn_scheduler.create_scheduler(rpn_scheduler.SHARED_QUEUE, 1, max_chunks=2)
+        scheduler.dispatch([(0, '1')])
+        scheduler.dispatch([(1, '2')])
+        self.assertRaises(ValueError, scheduler.dispatch, [(2, '3')])
+
+    def test_work_stealing(self):
+        scheduler = rpn_scheduler.WorkStealingScheduler(3)
+        for line_no in range(3):
+            scheduler.dispatch([(line_no, str(line_no))])
+
+        # Each chunk goes into a different local queue, the idle worker 2 steals the chunks of the workers 0 and 1
+        fetched_chunks = [self._fetch(scheduler, 2)[1] for _ in range(3)]
+        self.assertEqual([[(0, '0')], [(1, '1')], [(2, '2')]], sorted(fetched_chunks))
+        self.assertIsNone(scheduler.fetch(0, 1, timeout=0.01))
+
+    def test_recovery_request(self):
+        scheduler = rpn_scheduler.SharedQueueScheduler(2)
+        chunks = [[(0, '1')], [(1, '2'), (2, '2, 3, +'), (3, '4')], [(4, '5')]]
+        for chunk in chunks:
+            scheduler.dispatch(chunk)
+
+        # The consumer 7 completed the first chunk, and died while processing the second line of the second chunk. The
+        # third chunk was taken by the consumer 8.
+        taken_chunks = dict(self._fetch(scheduler, 0, 7) for _ in range(2))
+        self.assertEqual({0: chunks[0], 1: chunks[1]}, taken_chunks)
+        scheduler.complete(0, chunks[0])
+        self.assertEqual((2, chunks[2]), self._fetch(scheduler, 1, 8))
+        scheduler.complete(1, chunks[2])
+
+        scheduler.request_recovery(7, 1, {0}, 1, (1, 1, 'The worker thread died.'))
+        self.assertFalse(scheduler.is_drained())
+        failed_lines = []
+        scheduler.serve_recovery_requests(lambda *failed_line: failed_lines.append(failed_line), timeout=5)
+        self.assertEqual([(2, '2, 3, +', 'The worker thread died.')], failed_lines)
+
+        # Only the other lines of the second chunk are processed again
+        self.assertEqual((1, [(1, '2'), (3, '4')]), self._fetch(scheduler, 1, 9))
+        self.assertFalse(scheduler.is_drained())
+        scheduler.complete(1, [(1, '2'), (3, '4')])
+        self.assertTrue(scheduler.is_drained())
+
+    def test_lost_results_are_recovered(self):
+        scheduler = rpn_scheduler.SharedQueueScheduler(1)
+        chunk = [(0, '1'), (1, '2')]
+        scheduler.dispatch(chunk)
+        self.assertEqual((0, chunk), self._fetch(scheduler, 0, 7))
+        scheduler.complete(0, chunk)
+        self.assertTrue(scheduler.is_drained())
+
+        # The consumer reported the chunk as completed, but its' results were lost
+        scheduler.request_recovery(7, len(chunk), set(), 0)
+        scheduler.serve_recovery_requests(lambda *failed_line: self.fail('No line failed.'), timeout=5)
+        self.assertFalse(scheduler.is_drained())
+        self.assertEqual((0, chunk), self._fetch(scheduler, 0, 8))
+        scheduler.complete(0, chunk)
+        self.assertTrue(scheduler.is_drained())
+
+    def test_queue_left_locked_is_retired(self):
+        for name in [rpn_scheduler.SHARED_QUEUE, rpn_scheduler.WORK_STEALING]:
+            scheduler = rpn_scheduler.create_scheduler(name, 1)
+            chunk = [(0, '1')]
+            scheduler.dispatch(chunk)
+            process = mp.Process(target=hold_read_lock, args=(scheduler._read_locks[0],))
+            process.start()
+            process.join()
+
+            # The chunk cannot be read anymore, until the queue is retired and the chunk dispatched again
+            self.assertIsNone(scheduler.fetch(0, 7, timeout=0.1))
+            self.assertEqual([0], scheduler.retire_held_queues())
+            self.assertEqual([], scheduler.retire_held_queues())
+            scheduler.request_recovery(7, 0, set(), 0)
+            scheduler.serve_recovery_requests(lambda *failed_line: self.fail('No line failed.'), timeout=5)
+            scheduler.drain_retired_queues()
+            self.assertEqual((0, chunk), self._fetch(scheduler, 0, 8))
+
+            # The spare queue replaced the retired one
+            scheduler.dispatch([(1, '2')])
+            self.assertEqual((1, [(1, '2')]), self._fetch(scheduler, 0, 8))
+            scheduler.complete(0, chunk)
+            scheduler.complete(0, [(1, '2')])
+            self.assertTrue(scheduler.is_drained())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,105 @@
+import json
+import multiprocessing as mp
+import os
+import pstats
+import tempfile
+import unittest
+
+from rpn_processes import rpn_process, rpn_tracing
+
+
+def _record_spans(tracer, line_keys):
+    for line_key in line_keys:
+        tracer.record('child.span', line_key, 1000.0 + line_key, 0.5, worker=1)
+    tracer.flush()
+
+
+def _busy_function():
+    return sum(index * index for index in range(10000))
+
+
+class _ProfiledProcess(rpn_process.ProcessWithIPC):
+    @rpn_tracing.profiled
+    def run(self):
+        _busy_function()
+
+
+class TestTracer(unittest.TestCase):
+    """
+    Unit tests for rpn_tracing.Tracer
+    """
+    def setUp(self):
+        self._output_dir = tempfile.TemporaryDirectory()
+        self._trace_path = os.path.join(self._output_dir.name, 'trace.jsonl')
+
+    def tearDown(self):
+        self._output_dir.cleanup()
+
+    def test_is_sampled(self):
+        tracer = rpn_tracing.Tracer(self._trace_path, 0.1)
+        sampled_keys = [line_key for line_key in range(10000) if tracer.is_sampled(line_key)]
+        self.assertTrue(900 <= len(sampled_keys) <= 1100)
+        # The sampling only depends on the line key
+        self.assertEqual(sampled_keys, [line_key for line_key in range(10000)
+                                        if rpn_tracing.Tracer(self._trace_path, 0.1).is_sampled(line_key)])
+        self.assertTrue(900 <= sum(1 for line_index in range(10000) if tracer.is_sampled((1, line_index))) <= 1100)
+
+        tracer = rpn_tracing.Tracer(self._trace_path, 1)
+        self.assertTrue(all(tracer.is_sampled(line_key) for line_key in list(range(1000)) + [(2, 5), (-1, -1)]))
+
+    def test_merge(self):
+        tracer = rpn_tracing.Tracer(self._trace_path, 1)
+        tracer.record('main.span', 1, 1001.0, 0.25)
+        process = mp.Process(target=_record_spans, args=(tracer, [0, 2]))
+        process.start()
+        process.join()
+        tracer.record('main.span', None, 999.0, 0.25)
+
+        self.assertEqual(4, tracer.merge())
+        with open(self._trace_path) as trace_file:
+            spans = [json.loads(line) for line in trace_file]
+        self.assertEqual([('main.span', None), ('child.span', 0), ('main.span', 1), ('child.span', 2)],
+                         [(span['name'], span['line']) for span in spans])
+        self.assertEqual({'name': 'child.span', 'line': 0, 'pid': process.pid, 'start': 1000.0, 'duration': 0.5,
+                          'worker': 1}, spans[1])
+        self.assertEqual(os.getpid(), spans[0]['pid'])
+        # The part files are removed
+        self.assertEqual(['trace.jsonl'], os.listdir(self._output_dir.name))
+
+
+class TestProfiler(unittest.TestCase):
+    """
+    Unit tests for rpn_tracing.Profiler
+    """
+    def test_merge(self):
+        with tempfile.TemporaryDirectory() as output_dir:
+            report_path = os.path.join(output_dir, 'runner.prof')
+            profiler = rpn_tracing.Profiler(report_path)
+            processes = [profiler.attach(_ProfiledProcess()) for _ in range(2)]
+            profiler.start()
+            for process in processes:
+                process.start()
+            for process in processes:
+                process.join()
+            _busy_function()
+            profiler.stop()
+
+            self.assertEqual(3, profiler.merge())
+            self.assertEqual(['runner.prof', 'runner.prof.txt'], sorted(os.listdir(output_dir)))
+            busy_function_stats = [function_stats for function, function_stats in
+                                   pstats.Stats(report_path).stats.items() if function[2] == '_busy_function']
+            # The number of calls of the main thread and of the two processes
+            self.assertEqual(3, busy_function_stats[0][1])
+            with open(f"{report_path}.txt") as report_file:
+                self.assertIn('Merged profile of 3 process(es).', report_file.read())
+
+    def test_not_attached(self):
+        process = _ProfiledProcess()
+        process.start()
+        process.join()
+        self.assertEqual(0, process.exitcode)
+        self.assertEqual(0, rpn_tracing.Profiler(os.path.join(tempfile.gettempdir(), 'unused.prof')).merge())
+
+
+if __name__ == '__main__':
+    unittest.main()
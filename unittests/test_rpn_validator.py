@@ -0,0 +1,79 @@
+import gzip
+import os
+import tempfile
+import unittest
+
+from binary_expression_tree.binary_expression_tree import ExpressionTree
+from helpers import rpn_validator
+
+
+class TestRpnValidator(unittest.TestCase):
+    """
+    Unit tests for rpn_validator
+    """
+    def test_validate_expression(self):
+        test_expressions = [
+            ('2, 3, +, 5, *', None),
+            ('10,7,2,-,/', None),
+            ('', None),
+            ('42', None),
+            ('2, 3, +, , *', rpn_validator.ERROR_EMPTY_TOKEN),
+            ('2, a, +', rpn_validator.ERROR_INVALID_OPERAND),
+            ('2, ½, +', rpn_validator.ERROR_INVALID_OPERAND),
+            ('2, -3, +', rpn_validator.ERROR_INVALID_OPERAND),
+            ('2, +, 3', rpn_validator.ERROR_MISSING_OPERAND),
+            ('+', rpn_validator.ERROR_MISSING_OPERAND),
+            ('10,7,2,3', rpn_validator.ERROR_MISSING_OPERATOR),
+            ('0, 5, +', None),
+            ('5, 0, +', rpn_validator.ERROR_ZERO_SECOND_OPERAND),
+            ('5, 000, /', rpn_validator.ERROR_ZERO_SECOND_OPERAND),
+            ('5, \u0660, -', rpn_validator.ERROR_ZERO_SECOND_OPERAND),
+            ('1, 2, 0, *, +', rpn_validator.ERROR_ZERO_SECOND_OPERAND),
+            ('0', None),
+        ]
+        for expression, expected_error in test_expressions:
+            self.assertEqual(expected_error, rpn_validator.validate_expression(expression), expression)
+
+    def test_validate_expression_agrees_with_expression_tree(self):
+        # The second operands evaluating to zero are left out, as they are only detected while evaluating
+        test_expressions = ['2, 3, +, 5, *', '1,2,3', '1,+', '7, x, -', '', '5,,*', '9, 4, 2, *, -', '²', '3, 1, /',
+                            '5, 0, +', '1, 2, 0, *, +', '0, 5, +', '5, 00, -']
+        for expression in test_expressions:
+            try:
+                ExpressionTree().process(expression)
+                is_valid = True
+            except Exception:
+                is_valid = False
+            self.assertEqual(is_valid, rpn_validator.validate_expression(expression) is None, expression)
+
+    def test_validate_files(self):
+        lines = ['#CMNT', '2, 3, +, 5, *', '', 'sds', '10,7,2,3', '10, 7, 2, -, /', '+'] * 1000
+        data = '\n'.join(lines).encode()
+        with tempfile.TemporaryDirectory() as temp_dir:
+            paths = [os.path.join(temp_dir, name) for name in ['plain.txt', 'compressed.txt.gz']]
+            with open(paths[0], 'wb') as output_file:
+                output_file.write(data.replace(b'\n', b'\r\n'))
+            with open(paths[1], 'wb') as output_file:
+                output_file.write(gzip.compress(data))
+
+            original_range_size, original_chunk_lines = rpn_validator.RANGE_SIZE, rpn_validator.CHUNK_LINES
+            rpn_validator.RANGE_SIZE, rpn_validator.CHUNK_LINES = 1000, 100
+            try:
+                reports = rpn_validator.validate_files(paths + [os.path.join(temp_dir, 'missing.txt')],
+                                                       max_reported=4, workers=2)
+            finally:
+                rpn_validator.RANGE_SIZE, rpn_validator.CHUNK_LINES = original_range_size, original_chunk_lines
+
+        for report in reports[:2]:
+            self.assertEqual(7000, report.lines_count)
+            self.assertEqual(5000, report.expressions_count)
+            self.assertEqual({rpn_validator.ERROR_INVALID_OPERAND: 1000, rpn_validator.ERROR_MISSING_OPERATOR: 1000,
+                              rpn_validator.ERROR_MISSING_OPERAND: 1000}, report.error_counts)
+            self.assertEqual([(3, rpn_validator.ERROR_INVALID_OPERAND), (4, rpn_validator.ERROR_MISSING_OPERATOR),
+                              (6, rpn_validator.ERROR_MISSING_OPERAND), (10, rpn_validator.ERROR_INVALID_OPERAND)],
+                             report.first_errors)
+        self.assertIsInstance(reports[2].read_error, IOError)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,238 @@
+import os
+import queue
+import struct
+import time
+import unittest
+
+from rpn_processes import rpn_process, rpn_scheduler, rpnconsumer
+from rpn_processes.rpn_watchdog import ConsumerWatchdog
+
+
+class StubConsumer:
+    """
+    Stands for a RpnConsumer, without spawning any process
+    """
+    def __init__(self, worker_index, consumer_id=1, is_alive=True, lease=None, line_position=0, line_start_time=0,
+                 results=(), all_read=True, batch_report=(0, set(), 0)):
+        self.worker_index = worker_index
+        self.consumer_id = consumer_id
+        self.alive = is_alive
+        self.exitcode = None if is_alive else -9
+        self.lease = lease
+        self.line_position = line_position
+        self.line_start_time = line_start_time
+        self.results = list(results)
+        self.all_read = all_read
+        self.batch_report = batch_report
+        self.exception_queue = queue.Queue()
+        self.started = False
+        self.terminated = False
+
+    def get_worker_index(self):
+        return self.worker_index
+
+    def get_consumer_id(self):
+        return self.consumer_id
+
+    def is_alive(self):
+        return self.alive
+
+    def get_exception_queue(self):
+        return self.exception_queue
+
+    def get_results(self):
+        return self.results, self.all_read
+
+    def salvage_results(self):
+        return self.results, self.all_read
+
+    def get_batch_report(self):
+        return self.batch_report
+
+    def get_lease(self):
+        return self.lease
+
+    def get_line_position(self):
+        return self.line_position
+
+    def get_line_start_time(self):
+        return self.line_start_time
+
+    def terminate(self):
+        self.terminated = True
+        self.alive = False
+
+    def join(self):
+        pass
+
+    def start(self):
+        self.started = True
+
+
+class LostProcess(rpn_process.ProcessWithIPC):
+    """
+    Puts a result, then leaves the result queue as if it was terminated while writing the next one
+    """
+    def __init__(self, truncated):
+        super(LostProcess, self).__init__()
+        self._truncated = truncated
+
+    def run(self):
+        result_queue = self.get_result_queue()
+        result_queue.put([(0, '1 = 1')])
+        result_queue.close()
+        result_queue.join_thread()
+        # The next item is counted by the queue, but it is never written, or only its' header is written
+        result_queue._sem.acquire()
+        if self._truncated:
+            os.write(result_queue._writer.fileno(), struct.pack('!i', 100) + b'partial')
+
+
+class TestSalvageResultQueue(unittest.TestCase):
+    """
+    Unit tests for ProcessWithIPC.salvage_result_queue
+    """
+    def test_salvage_result_queue(self):
+        for truncated in [False, True]:
+            process = LostProcess(truncated)
+            process.start()
+            process.join()
+            start = time.monotonic()
+            self.assertEqual(([[(0, '1 = 1')]], False), process.salvage_result_queue(timeout=0.5))
+            self.assertLess(time.monotonic() - start, 5)
+
+
+class TestConsumerWatchdog(unittest.TestCase):
+    """
+    Unit tests for ConsumerWatchdog class
+    """
+    @staticmethod
+    def _fetch(scheduler, worker_index, consumer_id):
+        deadline = time.time() + 5
+        taken = None
+        while taken is None and time.time() < deadline:
+            taken = scheduler.fetch(worker_index, consumer_id, timeout=0.1)
+        return taken
+
+    @staticmethod
+    def _serve(scheduler):
+        failed_lines = []
+        scheduler.serve_recovery_requests(lambda *failed_line: failed_lines.append(failed_line), timeout=5)
+        return failed_lines
+
+    def test_healthy_consumers_are_kept(self):
+        scheduler = rpn_scheduler.WorkStealingScheduler(2)
+        watchdog = ConsumerWatchdog(scheduler, StubConsumer, line_timeout=10)
+        pool_consumers = [StubConsumer(0, line_start_time=time.monotonic()), StubConsumer(1)]
+
+        self.assertEqual([], watchdog.check(pool_consumers))
+        self.assertFalse(pool_consumers[0].started or pool_consumers[1].started)
+        self.assertTrue(scheduler.is_drained())
+
+    def test_dead_consumer_is_replaced_and_its_chunks_redispatched(self):
+        scheduler = rpn_scheduler.SharedQueueScheduler(2)
+        chunks = [[(0, '1')], [(1, '2'), (2, '2, 3, +'), (3, '4')]]
+        for chunk in chunks:
+            scheduler.dispatch(chunk)
+        self.assertEqual((0, chunks[0]), self._fetch(scheduler, 0, 7))
+        scheduler.complete(0, chunks[0])
+        self.assertEqual((1, chunks[1]), self._fetch(scheduler, 0, 7))
+
+        # The consumer died while processing the second line of its' second chunk; the result of the first chunk was
+        # already put
+        dead_consumer = StubConsumer(0, 7, is_alive=False, lease=1, line_position=1, line_start_time=time.monotonic(),
+                                     results=[(0, '1 = 1')], batch_report=(1, {0}, 1))
+        pool_consumers = [dead_consumer, StubConsumer(1, 8)]
+        self.assertEqual([(0, '1 = 1')], ConsumerWatchdog(scheduler, StubConsumer).check(pool_consumers))
+        self.assertTrue(pool_consumers[0].started)
+        self.assertIsNot(dead_consumer, pool_consumers[0])
+
+        # The producer fails the line being processed, and dispatches the other lines of the chunk again
+        self.assertFalse(scheduler.is_drained())
+        failed_lines = self._serve(scheduler)
+        self.assertEqual([2], [failed_line[0] for failed_line in failed_lines])
+        self.assertIn('died', failed_lines[0][2])
+        self.assertEqual((1, [(1, '2'), (3, '4')]), self._fetch(scheduler, 1, 8))
+        self.assertFalse(scheduler.is_drained())
+        scheduler.complete(1, [(1, '2'), (3, '4')])
+        self.assertTrue(scheduler.is_drained())
+
+    def test_consumer_lost_between_two_lines(self):
+        scheduler = rpn_scheduler.SharedQueueScheduler(1)
+        chunk = [(0, '1'), (1, '2')]
+        scheduler.dispatch(chunk)
+        self._fetch(scheduler, 0, 7)
+
+        # No line was being processed: the whole chunk is dispatched again
+        dead_consumer = StubConsumer(0, 7, is_alive=False, lease=0, line_position=1)
+        self.assertEqual([], ConsumerWatchdog(scheduler, StubConsumer).check([dead_consumer]))
+        self.assertEqual([], self._serve(scheduler))
+        self.assertEqual((0, chunk), self._fetch(scheduler, 0, 8))
+        scheduler.complete(0, chunk)
+        self.assertTrue(scheduler.is_drained())
+
+    def test_unread_results_are_redispatched(self):
+        scheduler = rpn_scheduler.SharedQueueScheduler(1)
+        chunk = [(0, '1'), (1, '2')]
+        scheduler.dispatch(chunk)
+        self._fetch(scheduler, 0, 7)
+        scheduler.complete(0, chunk)
+        self.assertTrue(scheduler.is_drained())
+
+        # The consumer reported the chunk as completed, but was terminated while its' results were being written
+        dead_consumer = StubConsumer(0, 7, is_alive=False, all_read=False, batch_report=(len(chunk), set(), 0))
+        self.assertEqual([], ConsumerWatchdog(scheduler, StubConsumer).check([dead_consumer]))
+        self.assertEqual([], self._serve(scheduler))
+
+        self.assertFalse(scheduler.is_drained())
+        self.assertEqual((0, chunk), self._fetch(scheduler, 0, 8))
+        scheduler.complete(0, chunk)
+        self.assertTrue(scheduler.is_drained())
+
+    def test_collect_results_replaces_lost_consumers(self):
+        scheduler = rpn_scheduler.WorkStealingScheduler(2)
+        pool_consumers = [StubConsumer(0, 7, results=[(0, '1 = 1')]),
+                          StubConsumer(1, 8, results=[(1, '2 = 2')], all_read=False)]
+        watchdog = ConsumerWatchdog(scheduler, StubConsumer)
+        self.assertEqual(([(0, '1 = 1'), (1, '2 = 2'), (1, '2 = 2')], False), watchdog.collect_results(pool_consumers))
+        self.assertFalse(pool_consumers[0].started)
+        self.assertTrue(pool_consumers[1].started)
+        self.assertFalse(scheduler.is_drained())
+        self.assertEqual([], self._serve(scheduler))
+        self.assertTrue(scheduler.is_drained())
+        # Once the chunks processed again are completed, the results are collected again
+        self.assertEqual(([(0, '1 = 1')], True), watchdog.collect_results(pool_consumers))
+
+    def test_consumer_lease(self):
+        scheduler = rpn_scheduler.WorkStealingScheduler(2)
+        consumer = rpnconsumer.RpnConsumer(scheduler, 1)
+        self.assertIsNone(consumer.get_lease())
+        self.assertNotEqual(consumer.get_consumer_id(), rpnconsumer.RpnConsumer(scheduler, 1).get_consumer_id())
+
+        # The results received within the batch are reported, along with the items completed within the batch
+        scheduler.complete(1, [(0, '1')] * 3)
+        consumer.start_batch()
+        scheduler.complete(1, [(5, '1'), (6, '2')])
+        self.assertEqual([(5, '1 = 1'), (6, '2 = 2')], consumer._receive([(4, [(5, '1 = 1'), (6, '2 = 2')])]))
+        self.assertEqual((2, {4}, 2), consumer.get_batch_report())
+        consumer.start_batch()
+        self.assertEqual((0, set(), 0), consumer.get_batch_report())
+
+    def test_hung_consumer_is_terminated(self):
+        scheduler = rpn_scheduler.SharedQueueScheduler(1)
+        chunk = [(0, '1, 2, +')]
+        scheduler.dispatch(chunk)
+        self._fetch(scheduler, 0, 7)
+
+        hung_consumer = StubConsumer(0, 7, lease=0, line_start_time=time.monotonic() - 10)
+        self.assertEqual([], ConsumerWatchdog(scheduler, StubConsumer, line_timeout=1).check([hung_consumer]))
+
+        self.assertTrue(hung_consumer.terminated)
+        failed_lines = self._serve(scheduler)
+        self.assertEqual(1, len(failed_lines))
+        self.assertIn('stopped after 1 seconds', failed_lines[0][2])
+        self.assertTrue(scheduler.is_drained())
+
+
+if __name__ == '__main__':
+    unittest.main()